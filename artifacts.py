@@ -0,0 +1,475 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+logger = logging.getLogger('aibnt_app.artifacts')
+
+# Configurações do armazenamento de artefatos (documentos formatados persistidos)
+ARTIFACT_TTL = int(os.environ.get('AIBNT_ARTIFACT_TTL', 30 * 24 * 60 * 60))  # 30 dias
+ANONYMOUS_ARTIFACT_TTL = int(os.environ.get('AIBNT_ANONYMOUS_ARTIFACT_TTL', 60 * 60))  # 1 hora
+ARTIFACT_USER_QUOTA = int(os.environ.get('AIBNT_ARTIFACT_USER_QUOTA', 200 * 1024 * 1024))  # 200MB por usuário
+ARTIFACT_MAX_BYTES = int(os.environ.get('AIBNT_ARTIFACT_MAX_BYTES', 5 * 1024 * 1024 * 1024))  # 5GB no total
+ARTIFACT_MIN_FREE_BYTES = int(os.environ.get('AIBNT_ARTIFACT_MIN_FREE_BYTES', 1024 * 1024 * 1024))  # 1GB livre no disco
+SWEEP_INTERVAL = int(os.environ.get('AIBNT_ARTIFACT_SWEEP_INTERVAL', 5 * 60))
+TEMP_MAX_AGE = int(os.environ.get('AIBNT_ARTIFACT_TEMP_MAX_AGE', 6 * 60 * 60))  # temporários abandonados
+SWEEP_BATCH_SIZE = 500
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class QuotaExceededError(Exception):
+    """
+    Não há espaço para o artefato, mesmo após liberar os mais antigos.
+    """
+
+    code = 'cota_excedida'
+    status_code = 507
+
+
+class Artifact(namedtuple('Artifact', ['id', 'path', 'name', 'size', 'owner', 'expires_at'])):
+    """
+    Artefato guardado: `path` é o arquivo em disco e `name` o nome de download.
+    """
+
+    __slots__ = ()
+
+    @property
+    def filename(self):
+        # Nome público do artefato, usado em /download
+        return self.id + os.path.splitext(self.path)[1]
+
+
+class ArtifactStore:
+    """
+    Armazenamento dos documentos formatados, com validade e cotas.
+
+    O conteúdo fica em blobs endereçados pelo SHA-256, distribuídos em dois
+    níveis de subdiretórios; cada artefato aponta para um blob, e saídas
+    idênticas (por exemplo, o mesmo documento enviado por dois usuários)
+    compartilham o mesmo blob com contagem de referências. O índice é um
+    SQLite no modo WAL ao lado dos arquivos, compartilhado entre os
+    processos; buscas por ID, por dono e por validade usam índices e não
+    dependem do número de arquivos em disco.
+
+    Artefatos vencidos são removidos por uma varredura em segundo plano. Ao
+    gravar, os artefatos mais antigos do usuário dão lugar aos novos quando
+    a cota dele é excedida, e os de validade mais próxima são removidos
+    quando o total ou o espaço livre no disco passam do limite.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS blobs (
+            name TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS artifacts (
+            id TEXT PRIMARY KEY,
+            blob TEXT NOT NULL REFERENCES blobs (name),
+            owner TEXT,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_artifacts_expires ON artifacts (expires_at);
+        CREATE INDEX IF NOT EXISTS idx_artifacts_owner ON artifacts (owner, created_at);
+        CREATE TABLE IF NOT EXISTS metadata (
+            blob TEXT PRIMARY KEY REFERENCES blobs (name),
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS usage (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            bytes INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO usage (id, bytes) VALUES (1, 0);
+    '''
+
+    def __init__(self, root, ttl=ARTIFACT_TTL, user_quota=ARTIFACT_USER_QUOTA, max_bytes=ARTIFACT_MAX_BYTES,
+                 min_free_bytes=ARTIFACT_MIN_FREE_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.user_quota = user_quota
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.temp_dir = os.path.join(root, 'tmp')
+        self.index_path = os.path.join(root, 'indice.db')
+        self._local = threading.local()
+        self._sweeper_pid = None
+        self._sweeps = []
+
+        for directory in (self.blob_dir, self.temp_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        # Uma conexão por thread; após um fork, a conexão herdada não é reutilizada
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE serializa as gravações entre processos antes de ler cotas e contagens.
+        # Mudanças em disco feitas na transação registram como desfazê-las (ROLLBACK)
+        # e como concluí-las (após o COMMIT) em `_local.undo` e `_local.after_commit`
+        conn = self._connection()
+        local = self._local
+        local.undo, local.after_commit = [], []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            self._run_actions(reversed(local.undo))
+            conn.execute('ROLLBACK')
+            raise
+        self._run_actions(local.after_commit)
+
+    def _run_actions(self, actions):
+        for action in actions:
+            try:
+                action()
+            except OSError as e:
+                logger.error(f"Erro ao atualizar blobs em disco: {str(e)}")
+
+    def _remove_after_commit(self, path):
+        # Tira o arquivo do lugar dentro da transação, para que nenhum outro processo
+        # grave o mesmo blob antes do COMMIT, e só o apaga depois dele; no ROLLBACK,
+        # ele volta. Se o processo cair antes, o temporário sai na varredura
+        trash = self.temp_path()
+        try:
+            os.replace(path, trash)
+        except FileNotFoundError:
+            return
+        # O blob mantém a data antiga; sem renová-la, a varredura de outro processo o apagaria já
+        os.utime(trash)
+        self._local.undo.append(lambda: os.replace(trash, path))
+        self._local.after_commit.append(lambda: os.remove(trash))
+
+    def _blob_path(self, blob):
+        return os.path.join(self.blob_dir, blob[:2], blob[2:4], blob)
+
+    def temp_path(self, suffix=''):
+        """
+        Caminho para um arquivo temporário no mesmo disco dos artefatos.
+
+        Arquivos abandonados aqui (por exemplo, por um worker encerrado) são
+        removidos pela varredura após TEMP_MAX_AGE.
+        """
+        return os.path.join(self.temp_dir, f"{uuid.uuid4().hex}{suffix}")
+
+    def put(self, source, ext, owner=None, name=None, ttl=None, metadata=None):
+        """
+        Guarda um documento como artefato.
+
+        Args:
+            source: Caminho (o arquivo é movido para o armazenamento), bytes ou
+                arquivo binário (file-like, lido a partir da posição atual)
+            ext (str): Extensão do documento, ex.: '.docx'
+            owner (str, optional): Usuário dono; conta na cota dele
+            name (str, optional): Nome oferecido no download
+            ttl (int, optional): Validade em segundos; se None, ARTIFACT_TTL
+                (ou ANONYMOUS_ARTIFACT_TTL sem dono)
+            metadata (optional): Dados JSON derivados do conteúdo (ex.: índice de
+                citações), guardados com o blob e compartilhados pelas cópias
+
+        Returns:
+            Artifact: Artefato guardado
+
+        Raises:
+            QuotaExceededError: Se não houver espaço para o documento
+        """
+        temp_path = self.temp_path(ext)
+        try:
+            digest, size = self._spool(source, temp_path)
+            if size > self.max_bytes or (owner is not None and self.user_quota and size > self.user_quota):
+                raise QuotaExceededError(f"Documento de {size} bytes excede a cota de armazenamento")
+
+            if ttl is None:
+                ttl = self.ttl if owner is not None else ANONYMOUS_ARTIFACT_TTL
+            now = time.time()
+            blob = f"{digest}{ext.lower()}"
+            artifact = Artifact(uuid.uuid4().hex, self._blob_path(blob), name or f"documento{ext}", size, owner,
+                                now + ttl)
+
+            with self._transaction() as conn:
+                self._make_room(conn, owner, size)
+                if conn.execute('SELECT 1 FROM blobs WHERE name = ?', (blob,)).fetchone() is None:
+                    os.makedirs(os.path.dirname(artifact.path), exist_ok=True)
+                    os.replace(temp_path, artifact.path)
+                    self._local.undo.append(lambda: os.remove(artifact.path))
+                    conn.execute('INSERT INTO blobs (name, size, refcount) VALUES (?, ?, 1)', (blob, size))
+                    conn.execute('UPDATE usage SET bytes = bytes + ? WHERE id = 1', (size,))
+                else:
+                    # Conteúdo já guardado: só mais uma referência ao mesmo blob
+                    conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE name = ?', (blob,))
+                if metadata is not None:
+                    conn.execute('INSERT OR IGNORE INTO metadata (blob, data) VALUES (?, ?)',
+                                 (blob, json.dumps(metadata, ensure_ascii=False)))
+                conn.execute('INSERT INTO artifacts (id, blob, owner, name, size, created_at, expires_at) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (artifact.id, blob, owner, artifact.name, size, now, artifact.expires_at))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return artifact
+
+    def _spool(self, source, temp_path):
+        # Grava a origem no temporário calculando o SHA-256; retorna (digest, tamanho)
+        digest = hashlib.sha256()
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            shutil.move(source, temp_path)
+            return digest.hexdigest(), os.path.getsize(temp_path)
+
+        if isinstance(source, (bytes, bytearray)):
+            chunks = [source]
+        else:
+            chunks = iter(lambda: source.read(COPY_CHUNK_SIZE), b'')
+        size = 0
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _make_room(self, conn, owner, incoming):
+        # Limite global e espaço livre no disco. O documento já está gravado no
+        # temporário, na mesma raiz, e por isso já saiu do espaço livre medido
+        used = conn.execute('SELECT bytes FROM usage WHERE id = 1').fetchone()[0]
+        free = shutil.disk_usage(self.root).free
+        needed = max(used + incoming - self.max_bytes, self.min_free_bytes - free, 0)
+        # Remover todos os artefatos libera no máximo `used`; se não bastar (o disco
+        # está cheio por outros motivos), recusa sem apagar nada
+        if needed > used:
+            raise QuotaExceededError("Sem espaço em disco para guardar o documento formatado")
+
+        # Cota do usuário: os artefatos mais antigos dele dão lugar ao novo
+        if owner is not None and self.user_quota:
+            owned = conn.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts WHERE owner = ?', (owner,)).fetchone()[0]
+            excess = owned + incoming - self.user_quota
+            if excess > 0:
+                victims = []
+                for artifact_id, size in conn.execute(
+                        'SELECT id, size FROM artifacts WHERE owner = ? ORDER BY created_at', (owner,)):
+                    if excess <= 0:
+                        break
+                    victims.append(artifact_id)
+                    excess -= size
+                self._release(conn, victims)
+                logger.info(f"Cota do usuário {owner}: {len(victims)} artefatos antigos removidos")
+
+        # Remove os de validade mais próxima até liberar o necessário
+        used_after = conn.execute('SELECT bytes FROM usage WHERE id = 1').fetchone()[0]
+        needed -= used - used_after
+        removed = 0
+        while needed > 0:
+            victims = [row[0] for row in conn.execute('SELECT id FROM artifacts ORDER BY expires_at LIMIT 100')]
+            if not victims:
+                raise QuotaExceededError("Sem espaço em disco para guardar o documento formatado")
+            for artifact_id in victims:
+                needed -= self._release(conn, [artifact_id])
+                removed += 1
+                if needed <= 0:
+                    break
+        if removed:
+            logger.warning(f"Limite de armazenamento atingido: {removed} artefatos removidos antes da validade")
+
+    def _release(self, conn, artifact_ids):
+        # Remove artefatos e os blobs que ficaram sem referências; retorna os bytes liberados em disco
+        freed = 0
+        for artifact_id in artifact_ids:
+            row = conn.execute('SELECT blob FROM artifacts WHERE id = ?', (artifact_id,)).fetchone()
+            if row is None:
+                continue
+            blob = row[0]
+            conn.execute('DELETE FROM artifacts WHERE id = ?', (artifact_id,))
+            conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE name = ?', (blob,))
+            refcount, size = conn.execute('SELECT refcount, size FROM blobs WHERE name = ?', (blob,)).fetchone()
+            if refcount > 0:
+                continue
+
+            conn.execute('DELETE FROM blobs WHERE name = ?', (blob,))
+            conn.execute('DELETE FROM metadata WHERE blob = ?', (blob,))
+            conn.execute('UPDATE usage SET bytes = bytes - ? WHERE id = 1', (size,))
+            self._remove_after_commit(self._blob_path(blob))
+            freed += size
+        return freed
+
+    def get(self, artifact_id):
+        """
+        Retorna o artefato com o ID informado, ou None se não existir ou estiver vencido.
+        """
+        row = self._connection().execute(
+            'SELECT blob, name, size, owner, expires_at FROM artifacts WHERE id = ? AND expires_at > ?',
+            (artifact_id, time.time())).fetchone()
+        if row is None:
+            return None
+        blob, name, size, owner, expires_at = row
+        path = self._blob_path(blob)
+        if not os.path.exists(path):
+            return None
+        return Artifact(artifact_id, path, name, size, owner, expires_at)
+
+    def metadata(self, artifact_id):
+        """
+        Retorna os dados guardados com o conteúdo do artefato, ou None.
+        """
+        row = self._connection().execute(
+            'SELECT m.data FROM artifacts a JOIN metadata m ON m.blob = a.blob WHERE a.id = ? AND a.expires_at > ?',
+            (artifact_id, time.time())).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def available(self, artifact_ids):
+        """
+        Filtra os IDs de artefatos ainda disponíveis, em uma única consulta.
+
+        Returns:
+            set: IDs não vencidos
+        """
+        artifact_ids = list(artifact_ids)
+        if not artifact_ids:
+            return set()
+        placeholders = ', '.join('?' * len(artifact_ids))
+        rows = self._connection().execute(
+            f'SELECT id FROM artifacts WHERE id IN ({placeholders}) AND expires_at > ?',
+            artifact_ids + [time.time()])
+        return {row[0] for row in rows}
+
+    def delete(self, artifact_id):
+        """
+        Remove um artefato; o conteúdo só é apagado quando não houver outras referências.
+        """
+        with self._transaction() as conn:
+            self._release(conn, [artifact_id])
+
+    def sweep(self):
+        """
+        Remove os artefatos vencidos, os blobs sem registro no índice e os temporários abandonados.
+
+        Returns:
+            int: Número de artefatos removidos
+        """
+        now = time.time()
+        removed = 0
+        while True:
+            # Lotes pequenos mantêm as transações curtas para as gravações concorrentes
+            with self._transaction() as conn:
+                expired = [row[0] for row in conn.execute('SELECT id FROM artifacts WHERE expires_at <= ? LIMIT ?',
+                                                          (now, SWEEP_BATCH_SIZE))]
+                self._release(conn, expired)
+            removed += len(expired)
+            if len(expired) < SWEEP_BATCH_SIZE:
+                break
+
+        orphans = self._sweep_orphans()
+
+        limit = now - TEMP_MAX_AGE
+        for entry in os.scandir(self.temp_dir):
+            try:
+                if entry.stat().st_mtime < limit:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+        if removed:
+            logger.info(f"Varredura de artefatos: {removed} vencidos removidos")
+        if orphans:
+            logger.warning(f"Varredura de artefatos: {orphans} blobs sem registro removidos")
+        return removed
+
+    def _sweep_orphans(self):
+        # Blobs em disco sem linha no índice, deixados por um processo encerrado no meio
+        # de uma gravação. A consulta e a remoção ficam na mesma transação, que exclui
+        # um `put` em andamento do mesmo blob
+        removed = 0
+        for first in os.scandir(self.blob_dir):
+            if not first.is_dir():
+                continue
+            for second in os.scandir(first.path):
+                if not second.is_dir():
+                    continue
+                names = [entry.name for entry in os.scandir(second.path) if entry.is_file()]
+                if not names:
+                    continue
+                with self._transaction() as conn:
+                    known = set()
+                    for start in range(0, len(names), SWEEP_BATCH_SIZE):
+                        batch = names[start:start + SWEEP_BATCH_SIZE]
+                        placeholders = ', '.join('?' * len(batch))
+                        known.update(row[0] for row in conn.execute(
+                            f'SELECT name FROM blobs WHERE name IN ({placeholders})', batch))
+                    for name in names:
+                        if name not in known:
+                            self._remove_after_commit(os.path.join(second.path, name))
+                            removed += 1
+        return removed
+
+    def add_sweep(self, func):
+        """
+        Inclui na varredura periódica a limpeza de outro armazenamento em disco.
+
+        Args:
+            func (callable): Função sem argumentos, chamada após cada varredura dos artefatos
+        """
+        self._sweeps.append(func)
+
+    def start_sweeper(self, interval=SWEEP_INTERVAL):
+        """
+        Inicia a varredura periódica em uma thread do processo atual (uma vez por processo).
+        """
+        if self._sweeper_pid == os.getpid():
+            return
+        self._sweeper_pid = os.getpid()
+
+        def run():
+            while True:
+                for sweep in [self.sweep] + self._sweeps:
+                    try:
+                        sweep()
+                    except Exception as e:
+                        logger.error(f"Erro na varredura de artefatos: {str(e)}")
+                time.sleep(interval)
+
+        threading.Thread(target=run, name='aibnt-artifact-sweeper', daemon=True).start()
+
+    def usage_bytes(self):
+        """
+        Retorna o espaço ocupado em disco pelos blobs, em bytes.
+        """
+        return self._connection().execute('SELECT bytes FROM usage WHERE id = 1').fetchone()[0]
+
+    def stats(self):
+        """
+        Retorna a ocupação atual do armazenamento.
+        """
+        conn = self._connection()
+        artifacts, logical = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts').fetchone()
+        blobs = conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+        return {
+            'artifacts': artifacts,
+            'blobs': blobs,
+            'logical_bytes': logical,
+            'size_bytes': self.usage_bytes(),
+            'max_bytes': self.max_bytes,
+            'free_bytes': shutil.disk_usage(self.root).free,
+        }
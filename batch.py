@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logger = logging.getLogger('aibnt_app.batch')
+
+# Configurações do processamento em lote
+BATCH_WORKERS = int(os.environ.get('AIBNT_BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_FILES = int(os.environ.get('AIBNT_BATCH_MAX_FILES', 1000))
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.environ.get('AIBNT_BATCH_MAX_UNCOMPRESSED_BYTES', 1024 * 1024 * 1024))  # 1GB
+BATCH_TIMEOUT = int(os.environ.get('AIBNT_BATCH_TIMEOUT', 60 * 60))  # tempo máximo de um lote no worker
+BATCH_EXTENSIONS = ('.docx', '.pdf', '.txt', '.gdoc')
+REPORT_NAME = 'relatorio.json'
+
+# Estados de cada arquivo no relatório
+STATUS_OK = 'ok'
+STATUS_FAILED = 'erro'
+STATUS_SKIPPED = 'ignorado'
+STATUS_CANCELLED = 'cancelado'
+
+
+def check_archive(archive):
+    """
+    Recusa ZIPs com documentos demais ou grandes demais, antes de extrair.
+
+    Usa os tamanhos declarados no diretório central; a leitura de cada
+    membro não passa do tamanho declarado, então o limite vale para os
+    bytes efetivamente extraídos.
+
+    Args:
+        archive (zipfile.ZipFile): Arquivo ZIP aberto
+
+    Raises:
+        ValueError: Se o ZIP exceder BATCH_MAX_FILES ou BATCH_MAX_UNCOMPRESSED_BYTES
+    """
+    members = [member for member in archive.infolist()
+               if not member.is_dir() and os.path.splitext(member.filename)[1].lower() in BATCH_EXTENSIONS]
+    if len(members) > BATCH_MAX_FILES:
+        raise ValueError(f"Lote com {len(members)} documentos excede o limite de {BATCH_MAX_FILES}")
+    total = sum(member.file_size for member in members)
+    if total > BATCH_MAX_UNCOMPRESSED_BYTES:
+        raise ValueError(f"Lote com {total} bytes descompactados excede o limite de {BATCH_MAX_UNCOMPRESSED_BYTES}")
+
+
+def collect_inputs(source, work_dir):
+    """
+    Lista os documentos de uma pasta ou de um arquivo ZIP.
+
+    Args:
+        source (str): Pasta ou arquivo .zip
+        work_dir (str): Diretório onde o ZIP é extraído
+
+    Returns:
+        tuple: (lista de (caminho, nome relativo), lista de nomes ignorados)
+    """
+    inputs = []
+    skipped = []
+
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                relative = os.path.relpath(path, source).replace(os.sep, '/')
+                if os.path.splitext(filename)[1].lower() in BATCH_EXTENSIONS:
+                    inputs.append((path, relative))
+                else:
+                    skipped.append(relative)
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            check_archive(archive)
+            for index, member in enumerate(archive.infolist()):
+                if member.is_dir():
+                    continue
+                relative = member.filename
+                if os.path.splitext(relative)[1].lower() not in BATCH_EXTENSIONS:
+                    skipped.append(relative)
+                    continue
+                # Cada membro vai para um subdiretório próprio com nome neutro,
+                # o que impede path traversal e colisões de nomes
+                target_dir = os.path.join(work_dir, 'entrada', str(index))
+                os.makedirs(target_dir, exist_ok=True)
+                path = os.path.join(target_dir, f"documento{os.path.splitext(relative)[1].lower()}")
+                with archive.open(member) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                inputs.append((path, relative))
+    else:
+        raise ValueError(f"Entrada do lote deve ser uma pasta ou um arquivo .zip: {source}")
+
+    if len(inputs) > BATCH_MAX_FILES:
+        raise ValueError(f"Lote com {len(inputs)} documentos excede o limite de {BATCH_MAX_FILES}")
+    return inputs, skipped
+
+
+def _run_one(format_func, input_path, output_dir):
+    # Executado nos processos do pool; mede o tempo da formatação isolada
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.time()
+    output_path = format_func(input_path, output_dir)
+    return output_path, time.time() - started
+
+
+def _output_stems(inputs):
+    # Nome base de cada saída: a pasta relativa e o nome da entrada, sem extensão.
+    # Entradas com o mesmo nome base (a.docx e a.pdf) recebem a extensão de origem
+    # e, se ainda repetidas, um contador, na ordem de entrada
+    used = set()
+    stems = []
+    for _, relative in inputs:
+        base, ext = os.path.splitext(relative)
+        stem = base
+        if stem.lower() in used:
+            stem = f"{base}_{ext.lstrip('.').lower()}"
+        counter = 2
+        while stem.lower() in used:
+            stem = f"{base}_{ext.lstrip('.').lower()}_{counter}"
+            counter += 1
+        used.add(stem.lower())
+        stems.append(stem)
+    return stems
+
+
+def _output_name(stem, output_path):
+    # Nome base único da entrada com a extensão final gerada pelo formatador
+    _, ext = os.path.splitext(output_path)
+    return f"{stem}_ABNT{ext}"
+
+
+def format_batch(source, output_zip, format_func, workers=BATCH_WORKERS, ordered=False, fail_fast=False,
+                 initializer=None):
+    """
+    Formata todos os documentos de uma pasta ou ZIP e grava as saídas em um ZIP.
+
+    As saídas são adicionadas ao ZIP assim que cada documento termina. Um
+    documento com erro não interrompe os demais, a menos que `fail_fast`
+    seja usado. O relatório também é gravado no ZIP como relatorio.json.
+
+    Args:
+        source (str): Pasta ou arquivo .zip com os documentos
+        output_zip (str): Caminho do ZIP de saída
+        format_func (callable): Função de nível de módulo (input_path, output_dir) -> caminho formatado
+        workers (int): Número máximo de documentos formatados ao mesmo tempo
+        ordered (bool): Grava as saídas na ordem de entrada em vez da ordem de conclusão
+        fail_fast (bool): Cancela os documentos restantes após o primeiro erro
+        initializer (callable, optional): Função de nível de módulo executada em cada processo do pool
+
+    Returns:
+        list: Relatório com um dicionário por arquivo
+    """
+    work_dir = tempfile.mkdtemp(prefix='aibnt_lote_')
+    report = []
+    try:
+        inputs, skipped = collect_inputs(source, work_dir)
+        for relative in skipped:
+            report.append({'input': relative, 'status': STATUS_SKIPPED, 'error': 'Formato não suportado'})
+
+        logger.info(f"Formatando lote com {len(inputs)} documentos ({workers} processos)")
+        with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as archive, \
+                ProcessPoolExecutor(max_workers=max(1, workers), initializer=initializer) as executor:
+            futures = {}
+            for index, ((path, relative), stem) in enumerate(zip(inputs, _output_stems(inputs))):
+                output_dir = os.path.join(work_dir, 'saida', str(index))
+                futures[executor.submit(_run_one, format_func, path, output_dir)] = (relative, stem)
+
+            failed = False
+            pending = list(futures) if ordered else as_completed(futures)
+            for future in pending:
+                relative, stem = futures[future]
+                if future.cancelled():
+                    report.append({'input': relative, 'status': STATUS_CANCELLED})
+                    continue
+                try:
+                    output_path, elapsed = future.result()
+                except Exception as e:
+                    logger.error(f"Erro ao formatar {relative} no lote: {str(e)}")
+                    report.append({'input': relative, 'status': STATUS_FAILED, 'error': str(e)})
+                    if fail_fast and not failed:
+                        failed = True
+                        for other in futures:
+                            other.cancel()
+                    continue
+
+                name = _output_name(stem, output_path)
+                archive.write(output_path, name)
+                os.remove(output_path)
+                report.append({'input': relative, 'output': name, 'status': STATUS_OK,
+                               'seconds': round(elapsed, 3)})
+
+            archive.writestr(REPORT_NAME, json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    ok = sum(1 for entry in report if entry['status'] == STATUS_OK)
+    logger.info(f"Lote concluído: {ok}/{len(report)} documentos formatados em {output_zip}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Formata em lote documentos conforme as normas ABNT 2023.')
+    parser.add_argument('entrada', help='Pasta ou arquivo .zip com os documentos')
+    parser.add_argument('saida', help='Arquivo .zip de saída')
+    parser.add_argument('-w', '--workers', type=int, default=BATCH_WORKERS,
+                        help='Documentos formatados ao mesmo tempo (padrão: %(default)s)')
+    parser.add_argument('--ordenado', action='store_true',
+                        help='Grava as saídas na ordem de entrada em vez da ordem de conclusão')
+    parser.add_argument('--parar-no-erro', action='store_true',
+                        help='Cancela os documentos restantes após o primeiro erro')
+    parser.add_argument('--relatorio', help='Também grava o relatório JSON neste caminho')
+    args = parser.parse_args(argv)
+
+    # Importado aqui para que `import batch` não carregue o aplicativo web
+    from main import _format_job, _init_batch_worker
+
+    report = format_batch(args.entrada, args.saida, _format_job, workers=args.workers,
+                          ordered=args.ordenado, fail_fast=args.parar_no_erro, initializer=_init_batch_worker)
+
+    if args.relatorio:
+        with open(args.relatorio, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for entry in report:
+        print(f"{entry['status']:10} {entry['input']}" + (f" -> {entry['output']}" if 'output' in entry else '')
+              + (f" ({entry['error']})" if entry.get('error') else ''))
+    return 0 if all(entry['status'] in (STATUS_OK, STATUS_SKIPPED) for entry in report) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,419 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import subprocess
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+import textwrap
+from io import BytesIO
+
+from docx import Document
+
+from rules import CITATION_PATTERN
+
+# Vocabulário dos parágrafos sintéticos
+WORDS = ('pesquisa', 'dados', 'análise', 'resultado', 'método', 'estudo', 'teoria', 'processo',
+         'educação', 'sistema', 'modelo', 'forma', 'desenvolvimento', 'social', 'trabalho')
+AUTHORS = ('SILVA', 'SOUZA', 'OLIVEIRA', 'SANTOS', 'PEREIRA', 'LIMA', 'COSTA', 'ALMEIDA')
+LATIN = ('et al.', 'apud', 'in', 'op. cit.', 'passim', 'sic')
+
+# Citações inseridas pelo gerador, com o autor em maiúsculas como nos trabalhos reais
+INSERTED_CITATION_RE = re.compile(r'\((?:%s)(?:,| et al\.,) \d{4}\)' % '|'.join(AUTHORS))
+
+# Bibliotecas pesadas acompanhadas na medição da inicialização
+HEAVY_MODULES = ('docx', 'PyPDF2', 'reportlab', 'weasyprint', 'lxml')
+
+# Executado em um interpretador novo: importa o aplicativo e o aquece, como um worker
+STARTUP_SCRIPT = textwrap.dedent('''
+    import sys, json, time
+
+    def rss():
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter() - started
+    result = {'import_seconds': imported, 'import_rss_bytes': rss(),
+              'modules': [name for name in sys.argv[1:] if name in sys.modules]}
+    started = time.perf_counter()
+    main.warm_up(start_pool=False)
+    result['warm_up_seconds'] = time.perf_counter() - started
+    result['warm_up_rss_bytes'] = rss()
+    print(json.dumps(result))
+''')
+
+# Linhas por página no PDF sintético
+PDF_LINES_PER_PAGE = 45
+PDF_LINE_WIDTH = 90
+
+
+def _sentence(rng, citation_density):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+    if rng.random() < citation_density:
+        author = rng.choice(AUTHORS)
+        separator = rng.choice((',', ' et al.,'))
+        words.insert(rng.randrange(len(words)), f"({author}{separator} {rng.randint(1990, 2023)})")
+    if rng.random() < citation_density:
+        words.insert(rng.randrange(1, len(words)), rng.choice(LATIN))
+    # Só a primeira letra: capitalize() poria as citações em minúsculas, e o
+    # CITATION_PATTERN (autor em maiúsculas) deixaria de encontrá-las
+    sentence = ' '.join(words)
+    return sentence[0].upper() + sentence[1:] + '.'
+
+
+def generate_paragraphs(count, citation_density=0.3, references=20, long_quotes=0.05, seed=0):
+    """
+    Gera parágrafos sintéticos de um trabalho acadêmico.
+
+    Args:
+        count (int): Número de parágrafos de corpo
+        citation_density (float): Probabilidade de citação/expressão latina por frase
+        references (int): Número de entradas na lista de referências
+        long_quotes (float): Fração de parágrafos que são citações longas
+        seed (int): Semente do gerador aleatório
+
+    Returns:
+        list: Textos dos parágrafos
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(count):
+        text = ' '.join(_sentence(rng, citation_density) for _ in range(rng.randint(2, 6)))
+        if rng.random() < long_quotes:
+            while len(text) <= 260:
+                text += ' ' + _sentence(rng, citation_density)
+            text = f'"{text}"'
+        paragraphs.append(text)
+
+    # As citações geradas precisam exercitar a correção de citações do formatador
+    inserted = sum(len(INSERTED_CITATION_RE.findall(text)) for text in paragraphs)
+    matched = sum(len(re.findall(CITATION_PATTERN, text)) for text in paragraphs)
+    assert matched == inserted, f"{inserted - matched} de {inserted} citações geradas fora do CITATION_PATTERN"
+
+    paragraphs.append('REFERÊNCIAS')
+    for index in range(references):
+        author = rng.choice(AUTHORS)
+        paragraphs.append(f"{author}, {chr(65 + index % 26)}. Título da obra {index}. São Paulo: Editora, "
+                          f"{rng.randint(1990, 2023)}.")
+    return paragraphs
+
+
+def write_txt(path, paragraphs):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(paragraphs))
+
+
+def write_docx(path, paragraphs):
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    doc.save(path)
+
+
+def write_pdf(path, paragraphs, pages=None):
+    """
+    Gera um PDF com os parágrafos quebrados em linhas.
+
+    Args:
+        path (str): Caminho de saída
+        paragraphs (list): Textos dos parágrafos
+        pages (int, optional): Número de páginas; se None, usa PDF_LINES_PER_PAGE linhas por página
+
+    Returns:
+        int: Número de páginas gravadas
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    lines = []
+    for text in paragraphs:
+        lines.extend(textwrap.wrap(text, PDF_LINE_WIDTH) or [''])
+    per_page = -(-len(lines) // pages) if pages else PDF_LINES_PER_PAGE
+
+    pdf = canvas.Canvas(path, pagesize=A4)
+    count = 0
+    for start in range(0, len(lines), per_page):
+        y = A4[1] - 50
+        for line in lines[start:start + per_page]:
+            pdf.drawString(40, y, line)
+            y -= 16
+        pdf.showPage()
+        count += 1
+    pdf.save()
+    return count
+
+
+def measure(func, setup=None, repeat=5):
+    """
+    Mede o tempo mediano e o pico de memória de uma função.
+
+    O pico de memória é medido em uma execução separada com tracemalloc,
+    para que o rastreamento não distorça os tempos.
+
+    Args:
+        func (callable): Recebe o resultado de `setup` (ou nada)
+        setup (callable, optional): Preparação fora da medição, executada antes de cada chamada
+        repeat (int): Número de execuções cronometradas
+
+    Returns:
+        dict: 'seconds' (mediana), 'min_seconds' e 'peak_memory_bytes'
+    """
+    def call():
+        if setup is None:
+            return func, ()
+        return func, (setup(),)
+
+    timings = []
+    for _ in range(repeat):
+        target, args = call()
+        started = time.perf_counter()
+        target(*args)
+        timings.append(time.perf_counter() - started)
+
+    target, args = call()
+    tracemalloc.start()
+    try:
+        target(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds': statistics.median(timings),
+        'min_seconds': min(timings),
+        'peak_memory_bytes': peak,
+    }
+
+
+def measure_startup(repeat=5):
+    """
+    Mede a inicialização de um worker: importação de main e aquecimento.
+
+    Cada execução usa um interpretador novo, com armazenamento em memória para
+    não tocar no banco de dados. O RSS é o do processo inteiro (memória base
+    de cada worker), e não apenas das alocações Python.
+
+    Args:
+        repeat (int): Número de interpretadores iniciados
+
+    Returns:
+        dict: Resultados 'startup_import' e 'startup_warm_up'
+    """
+    env = dict(os.environ, AIBNT_STORAGE_URL='memory://')
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, *HEAVY_MODULES], cwd=cwd, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    import_times = [run['import_seconds'] for run in runs]
+    warm_times = [run['warm_up_seconds'] for run in runs]
+    return {
+        'startup_import': {
+            'seconds': statistics.median(import_times),
+            'min_seconds': min(import_times),
+            'peak_memory_bytes': max(run['import_rss_bytes'] for run in runs),
+            'modules': runs[-1]['modules'],
+        },
+        'startup_warm_up': {
+            'seconds': statistics.median(warm_times),
+            'min_seconds': min(warm_times),
+            'peak_memory_bytes': max(run['warm_up_rss_bytes'] for run in runs),
+        },
+    }
+
+
+def run_benchmarks(paragraphs=500, citation_density=0.3, references=50, pages=None, repeat=5, seed=0):
+    """
+    Executa os benchmarks do ABNTFormatter sobre um corpus sintético.
+
+    Returns:
+        dict: Resultados com metadados da execução
+    """
+    # Importado aqui para que os geradores de corpus possam ser usados sem o aplicativo
+    from main import ABNTFormatter
+
+    formatter = ABNTFormatter()  # Sem cache: mede sempre a formatação completa
+    texts = generate_paragraphs(paragraphs, citation_density, references, seed=seed)
+    work_dir = tempfile.mkdtemp(prefix='aibnt_bench_')
+    results = measure_startup(repeat)
+    try:
+        txt_path = os.path.join(work_dir, 'corpus.txt')
+        docx_path = os.path.join(work_dir, 'corpus.docx')
+        pdf_path = os.path.join(work_dir, 'corpus.pdf')
+        output_dir = os.path.join(work_dir, 'saida')
+        write_txt(txt_path, texts)
+        write_docx(docx_path, texts)
+        page_count = write_pdf(pdf_path, texts, pages)
+        with open(docx_path, 'rb') as f:
+            docx_bytes = f.read()
+        with open(txt_path, 'rb') as f:
+            txt_bytes = f.read()
+
+        paragraph_count = len(texts)
+        for name, path in (('format_document_txt', txt_path),
+                           ('format_document_docx', docx_path),
+                           ('format_document_pdf', pdf_path)):
+            results[name] = measure(lambda path=path: formatter.format_document(path, output_dir), repeat=repeat)
+            results[name]['paragraphs'] = paragraph_count
+
+        results['format_document_pdf']['pages'] = page_count
+
+        results['_format_pdf'] = measure(
+            lambda: formatter._format_pdf(pdf_path, os.path.join(output_dir, 'pdf_ABNT.docx')), repeat=repeat)
+        results['_format_pdf']['pages'] = page_count
+        results['_format_pdf']['paragraphs'] = paragraph_count
+
+        # Caminho dos uploads: o PDF chega em memória. Acima de PDF_PARALLEL_MIN_PAGES,
+        # a extração precisa acontecer em faixas paralelas também nesse caminho
+        import main
+        import metrics
+
+        with open(pdf_path, 'rb') as f:
+            pdf_bytes = f.read()
+        count_before, shards_before = metrics.PDF_SHARDS.totals()
+        results['format_stream_pdf'] = measure(lambda: formatter.format_stream(pdf_bytes, '.pdf'), repeat=repeat)
+        results['format_stream_pdf']['pages'] = page_count
+        count_after, shards_after = metrics.PDF_SHARDS.totals()
+        if page_count >= main.PDF_PARALLEL_MIN_PAGES and main.PDF_EXTRACT_WORKERS >= 2:
+            assert shards_after - shards_before > count_after - count_before, \
+                "PDF enviado em memória não foi extraído em faixas paralelas"
+
+        # Cada execução recebe um documento novo (com os estilos ABNT), já que a formatação o altera
+        def styled_document():
+            doc = Document(BytesIO(docx_bytes))
+            formatter._merge_abnt_styles(doc)
+            return doc
+
+        results['_apply_abnt_formatting_to_docx'] = measure(
+            formatter._apply_abnt_formatting_to_docx, setup=styled_document, repeat=repeat)
+        results['_apply_abnt_formatting_to_docx']['paragraphs'] = paragraph_count
+
+        results['_fix_citation_format'] = measure(
+            lambda: [formatter._fix_citation_format(text) for text in texts], repeat=repeat)
+        results['_fix_citation_format']['paragraphs'] = paragraph_count
+
+        # Renderização do DOCX formatado como PDF, com os caches do processo vazios e aquecidos
+        import pdfrender
+        from PyPDF2 import PdfReader
+
+        formatted, _ = formatter.format_stream(txt_bytes, '.txt')
+        rendered = BytesIO()
+        formatter._render_pdf(formatted, rendered)
+        rendered_pages = len(PdfReader(rendered).pages)
+
+        results['_render_pdf'] = measure(
+            lambda _: formatter._render_pdf(formatted, BytesIO()), setup=pdfrender.clear_caches, repeat=repeat)
+        results['_render_pdf_cached'] = measure(
+            lambda: formatter._render_pdf(formatted, BytesIO()), repeat=repeat)
+        for name in ('_render_pdf', '_render_pdf_cached'):
+            results[name]['pages'] = rendered_pages
+            results[name]['paragraphs'] = paragraph_count
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for result in results.values():
+        if 'paragraphs' in result:
+            result['paragraphs_per_s'] = result['paragraphs'] / result['seconds']
+        if 'pages' in result:
+            result['pages_per_s'] = result['pages'] / result['seconds']
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'formatter_version': ABNTFormatter.VERSION,
+            'paragraphs': paragraphs,
+            'citation_density': citation_density,
+            'references': references,
+            'pages': page_count,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    """
+    Compara duas execuções e lista as regressões de tempo acima do limite.
+
+    Args:
+        current (dict): Resultado atual de run_benchmarks
+        baseline (dict): Resultado de referência
+        threshold (float): Aumento relativo tolerado (0.10 = 10%)
+
+    Returns:
+        list: Tuplas (nome, segundos de referência, segundos atuais, variação relativa)
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        change = result['seconds'] / reference['seconds'] - 1
+        if change > threshold:
+            regressions.append((name, reference['seconds'], result['seconds'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do formatador ABNT com corpus sintético.')
+    parser.add_argument('--paragrafos', type=int, default=500, help='Parágrafos de corpo (padrão: %(default)s)')
+    parser.add_argument('--densidade-citacoes', type=float, default=0.3,
+                        help='Probabilidade de citação por frase (padrão: %(default)s)')
+    parser.add_argument('--referencias', type=int, default=50, help='Entradas de referência (padrão: %(default)s)')
+    parser.add_argument('--paginas', type=int, help='Número de páginas do PDF (padrão: proporcional ao texto)')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Execuções por medição (padrão: %(default)s)')
+    parser.add_argument('--semente', type=int, default=0, help='Semente do corpus (padrão: %(default)s)')
+    parser.add_argument('--saida', help='Grava os resultados em JSON neste caminho')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior para detectar regressões')
+    parser.add_argument('--limite', type=float, default=0.10,
+                        help='Regressão relativa tolerada na comparação (padrão: %(default)s)')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.paragrafos, args.densidade_citacoes, args.referencias,
+                            args.paginas, args.repeticoes, args.semente)
+
+    for name, result in report['results'].items():
+        rates = []
+        if 'paragraphs_per_s' in result:
+            rates.append(f"{result['paragraphs_per_s']:.0f} parágrafos/s")
+        if 'pages_per_s' in result:
+            rates.append(f"{result['pages_per_s']:.1f} páginas/s")
+        if 'modules' in result:
+            rates.append('carregados: ' + (', '.join(result['modules']) or 'nenhum'))
+        print(f"{name:32} {result['seconds'] * 1000:9.1f} ms  {result['peak_memory_bytes'] / 1024 / 1024:7.1f} MB  "
+              + ', '.join(rates))
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.limite)
+        for name, before, after, change in regressions:
+            print(f"REGRESSÃO {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms (+{change:.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+logger = logging.getLogger('aibnt_app.cache')
+
+# Configurações do cache de saídas formatadas
+CACHE_MAX_BYTES = int(os.environ.get('AIBNT_CACHE_MAX_BYTES', 500 * 1024 * 1024))  # 500MB
+HASH_CHUNK_SIZE = 1024 * 1024
+# Ao exceder o limite, remove entradas até esta fração dele, para que as
+# varreduras da remoção não se repitam a cada gravação
+CACHE_EVICT_TARGET = float(os.environ.get('AIBNT_CACHE_EVICT_TARGET', 0.9))
+# Intervalo entre recontagens do diretório, que corrigem o total mantido em memória
+CACHE_RESCAN_INTERVAL = int(os.environ.get('AIBNT_CACHE_RESCAN_INTERVAL', 10 * 60))
+
+
+class OutputCache:
+    """
+    Cache endereçado por conteúdo das saídas do ABNTFormatter.
+
+    A chave é o SHA-256 dos bytes de entrada combinado com a extensão e a
+    versão do conjunto de regras. Os arquivos ficam em disco, distribuídos em
+    subdiretórios pelos dois primeiros caracteres da chave, e são removidos
+    do menos recentemente usado para o mais recente quando o tamanho total
+    passa de `max_bytes`. Os contadores ficam em memória compartilhada para
+    que os processos do pool de trabalhos somem nos mesmos valores.
+
+    O tamanho total e o número de entradas também são mantidos nos
+    contadores, atualizados a cada gravação e remoção; o diretório só é
+    percorrido na primeira consulta, periodicamente (CACHE_RESCAN_INTERVAL)
+    e quando é preciso escolher entradas para remover.
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._hits = multiprocessing.Value('L', 0)
+        self._misses = multiprocessing.Value('L', 0)
+        self._evictions = multiprocessing.Value('L', 0)
+        self._size = multiprocessing.Value('q', 0)
+        self._count = multiprocessing.Value('q', 0)
+        self._scanned_at = multiprocessing.Value('d', 0.0)  # 0: ainda não contado
+        self._lock = threading.Lock()
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key_for(self, input_path, version):
+        """
+        Calcula a chave de cache de um arquivo de entrada.
+
+        Args:
+            input_path (str): Caminho do arquivo de entrada
+            version (str): Versão do formatador/regras ABNT
+
+        Returns:
+            str: Chave hexadecimal
+        """
+        with open(input_path, 'rb') as f:
+            return self.key_for_stream(f, os.path.splitext(input_path)[1], version)
+
+    def key_for_stream(self, stream, ext, version):
+        """
+        Calcula a chave de cache de um arquivo em memória, sem alterar sua posição.
+
+        Args:
+            stream: Arquivo binário (file-like) de entrada
+            ext (str): Extensão de entrada, ex.: '.docx'
+            version (str): Versão do formatador/regras ABNT
+
+        Returns:
+            str: Chave hexadecimal
+        """
+        content = hashlib.sha256()
+        position = stream.tell()
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            content.update(chunk)
+        stream.seek(position)
+        return self.key_for_digest(content.hexdigest(), ext, version)
+
+    def key_for_digest(self, content_digest, ext, version):
+        """
+        Calcula a chave de cache a partir do SHA-256 já calculado da entrada.
+
+        Permite reaproveitar o hash feito durante o recebimento do upload.
+
+        Args:
+            content_digest (str): SHA-256 hexadecimal dos bytes de entrada
+            ext (str): Extensão de entrada, ex.: '.docx'
+            version (str): Versão do formatador/regras ABNT
+
+        Returns:
+            str: Chave hexadecimal
+        """
+        digest = hashlib.sha256()
+        digest.update(version.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(ext.lower().encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content_digest.encode('ascii'))
+        return digest.hexdigest()
+
+    def _shard(self, key):
+        return os.path.join(self.cache_dir, key[:2])
+
+    def _find(self, key):
+        shard = self._shard(key)
+        try:
+            names = os.listdir(shard)
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.startswith(key) and not name.endswith('.tmp'):
+                return os.path.join(shard, name)
+        return None
+
+    def contains(self, key):
+        """
+        Indica se há saída em cache para a chave, sem contar acerto ou falha.
+        """
+        return self._find(key) is not None
+
+    def get(self, key):
+        """
+        Procura uma saída em cache e a marca como usada recentemente.
+
+        Returns:
+            str: Caminho do artefato em cache, ou None
+        """
+        path = self._find(key)
+        if path is None:
+            self.record_miss()
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Removido por outro processo entre a busca e o uso
+            self.record_miss()
+            return None
+
+        with self._hits.get_lock():
+            self._hits.value += 1
+        return path
+
+    def fetch(self, key, output_dir, name):
+        """
+        Materializa uma saída em cache em `output_dir` sem reformatar.
+
+        Args:
+            key (str): Chave de cache
+            output_dir (str): Diretório de saída
+            name (str): Nome base do arquivo de saída (sem extensão)
+
+        Returns:
+            str: Caminho do arquivo de saída, ou None se não houver entrada em cache
+        """
+        cached_path = self.get(key)
+        if cached_path is None:
+            return None
+
+        _, ext = os.path.splitext(cached_path)
+        output_path = os.path.join(output_dir, f"{name}_ABNT{ext}")
+        try:
+            _link_or_copy(cached_path, output_path)
+        except FileNotFoundError:
+            return None
+
+        logger.info(f"Saída recuperada do cache: {output_path}")
+        return output_path
+
+    def fetch_stream(self, key, output_file):
+        """
+        Copia uma saída em cache para um arquivo em memória sem reformatar.
+
+        Args:
+            key (str): Chave de cache
+            output_file: Arquivo binário (file-like) de saída
+
+        Returns:
+            str: Extensão da saída em cache, ou None se não houver entrada
+        """
+        cached_path = self.get(key)
+        if cached_path is None:
+            return None
+
+        try:
+            with open(cached_path, 'rb') as f:
+                shutil.copyfileobj(f, output_file)
+        except FileNotFoundError:
+            return None
+        return os.path.splitext(cached_path)[1]
+
+    def put_stream(self, key, stream, ext):
+        """
+        Guarda no cache uma saída formatada em memória, sem alterar sua posição.
+
+        Args:
+            key (str): Chave de cache
+            stream: Arquivo binário (file-like) com a saída
+            ext (str): Extensão da saída, ex.: '.docx'
+        """
+        position = stream.tell()
+        stream.seek(0)
+        self._store(key, ext, lambda target: _write_stream(stream, target))
+        stream.seek(position)
+
+    def _metadata_key(self, key):
+        # Chave própria, que não começa com a chave da saída (ver _find)
+        return hashlib.sha256(f"{key}\0metadados".encode('ascii')).hexdigest()
+
+    def put_metadata(self, key, data):
+        """
+        Guarda dados JSON associados a uma saída em cache (por exemplo, o índice de citações).
+
+        Args:
+            key (str): Chave de cache da saída
+            data: Valor serializável em JSON
+        """
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+        def write(target):
+            with open(target, 'wb') as f:
+                f.write(payload)
+        self._store(self._metadata_key(key), '.json', write)
+
+    def record_miss(self):
+        """
+        Conta uma falha de uma busca que desistiu antes de consultar a saída (ex.: sem os metadados).
+        """
+        with self._misses.get_lock():
+            self._misses.value += 1
+
+    def fetch_metadata(self, key):
+        """
+        Retorna os dados associados a uma saída em cache, sem contar acerto ou falha.
+
+        Returns:
+            Valor guardado com put_metadata, ou None
+        """
+        path = self._find(self._metadata_key(key))
+        if path is None:
+            return None
+        try:
+            # Marca como usada junto com a saída, para não ser removida antes dela
+            os.utime(path)
+            with open(path, 'rb') as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, output_path):
+        """
+        Guarda uma saída formatada no cache.
+
+        Args:
+            key (str): Chave de cache
+            output_path (str): Caminho do arquivo formatado
+        """
+        _, ext = os.path.splitext(output_path)
+        self._store(key, ext, lambda target: _link_or_copy(output_path, target))
+
+    def _store(self, key, ext, write):
+        shard = self._shard(key)
+        if not os.path.exists(shard):
+            os.makedirs(shard, exist_ok=True)
+
+        # Escrita atômica: outro processo nunca vê um arquivo parcial
+        target = os.path.join(shard, f"{key}{ext}")
+        temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(temp_path)
+            size = os.path.getsize(temp_path)
+            replaced = _size_or_none(target)
+            os.replace(temp_path, target)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar no cache: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        if replaced is None:
+            self._account(size, 1)
+        else:
+            self._account(size - replaced, 0)
+        if self._total()[0] > self.max_bytes:
+            self._evict()
+
+    def _account(self, size, count):
+        # Atualiza os totais compartilhados (vale em todos os processos do pool)
+        with self._size.get_lock():
+            self._size.value += size
+        with self._count.get_lock():
+            self._count.value += count
+
+    def _total(self):
+        # Tamanho e número de entradas, recontando o diretório quando a contagem envelhece
+        if time.time() - self._scanned_at.value > CACHE_RESCAN_INTERVAL:
+            self._rescan(self._entries())
+        return self._size.value, self._count.value
+
+    def _rescan(self, entries):
+        with self._size.get_lock():
+            self._size.value = sum(size for _, size, _ in entries)
+            self._count.value = len(entries)
+            self._scanned_at.value = time.time()
+
+    def _entries(self):
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        # Remove as entradas menos recentemente usadas até caber no limite
+        with self._lock:
+            entries = self._entries()
+            self._rescan(entries)
+            total = self._size.value
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            goal = self.max_bytes * CACHE_EVICT_TARGET
+            for _, size, path in entries:
+                if total <= goal:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue  # Já removida por outro processo
+                total -= size
+                self._account(-size, -1)
+                with self._evictions.get_lock():
+                    self._evictions.value += 1
+
+    @property
+    def hits(self):
+        return self._hits.value
+
+    @property
+    def misses(self):
+        return self._misses.value
+
+    @property
+    def evictions(self):
+        return self._evictions.value
+
+    def hit_ratio(self):
+        """
+        Retorna a fração de buscas atendidas pelo cache.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """
+        Retorna os contadores e a ocupação atual do cache.
+        """
+        size, count = self._total()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': count,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes,
+        }
+
+
+def _size_or_none(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return None
+
+
+def _link_or_copy(source, target):
+    # Hard link evita copiar os bytes; cai para cópia entre sistemas de arquivos
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _write_stream(stream, target):
+    with open(target, 'wb') as f:
+        shutil.copyfileobj(stream, f)
@@ -0,0 +1,185 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+from rules import STYLE_REFERENCE
+
+# Ano de publicação (com letra para obras do mesmo ano, ex.: 2020a) ou "sem data"
+YEAR_PATTERN = r'(?:1[5-9]|20)\d{2}[a-z]?\b|s\.d\.'
+YEAR_RE = re.compile(r'\b' + YEAR_PATTERN)
+
+# Demais obras de uma citação múltipla, ex.: (SILVA, 2020; SOUZA, 2019)
+EXTRA_WORK_RE = re.compile(r'\s*(?P<author>[^\W\d_]+)(?:\s+et\s+al\.)?,\s*(?P<year>' + YEAR_PATTERN + ')')
+
+# Autoria de uma referência: até a primeira vírgula (pessoa) ou ponto (entidade)
+REFERENCE_AUTHOR_RE = re.compile(r'[^,.]+')
+
+CITATION = 'citacao'
+REFERENCE = 'referencia'
+
+Citation = namedtuple('Citation', ['paragraph', 'start', 'end', 'author', 'year'])
+Reference = namedtuple('Reference', ['paragraph', 'author', 'year', 'text'])
+
+
+def author_key(author):
+    """
+    Normaliza a autoria para comparação: sem acentos e em maiúsculas.
+    """
+    decomposed = unicodedata.normalize('NFKD', author)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).strip().upper()
+
+
+def _work_key(author, year):
+    return author_key(author), (year or '').lower()
+
+
+def _works(author, rest):
+    # Obras de uma citação: a primeira usa o autor do padrão; as demais vêm após ';'
+    parts = rest.split(';')
+    works = []
+    year = YEAR_RE.search(parts[0])
+    if year is not None:
+        works.append((author, year.group(0)))
+    for part in parts[1:]:
+        match = EXTRA_WORK_RE.match(part)
+        if match is not None:
+            works.append((match.group('author'), match.group('year')))
+    return works
+
+
+def paragraph_entries(text, rule, edits, found):
+    """
+    Converte o resultado da varredura de um parágrafo em entradas do índice.
+
+    As posições das citações são convertidas para o texto formatado,
+    descontando as edições anteriores a cada uma; como ambas as listas
+    estão ordenadas, a conversão é uma única passada.
+
+    Args:
+        text (str): Texto de entrada do parágrafo
+        rule (ParagraphRule): Regra que classificou o parágrafo
+        edits (list): Edições aplicadas ao parágrafo (ver rules.paragraph_edits)
+        found (list): Citações encontradas na varredura (ver rules.citation_edits)
+
+    Returns:
+        list: Entradas [CITATION, início, fim, autor, ano] ou [REFERENCE, autor, ano, texto],
+            serializáveis em JSON (guardadas nos estados de revisão)
+    """
+    if rule.style == STYLE_REFERENCE:
+        text = text.strip()
+        years = YEAR_RE.findall(text)
+        author = REFERENCE_AUTHOR_RE.match(text)
+        return [[REFERENCE, author.group(0).strip() if author else text, years[-1] if years else None, text]]
+
+    entries = []
+    shift = 0
+    index = 0
+    for start, end, author, rest in found:
+        while index < len(edits) and edits[index][1] <= start:
+            edit_start, edit_end, replacement = edits[index]
+            shift += len(replacement) - (edit_end - edit_start)
+            index += 1
+        length = end - start
+        if index < len(edits) and edits[index][:2] == (start, end):
+            length = len(edits[index][2])
+        for work_author, year in _works(author, rest):
+            entries.append([CITATION, start + shift, start + shift + length, work_author, year])
+    return entries
+
+
+class CitationIndex:
+    """
+    Índice das citações autor-data e das referências de um documento.
+
+    É preenchido pelo formatador na mesma passada que classifica os
+    parágrafos e corrige as citações, e guardado junto com a saída. As
+    verificações cruzadas usam conjuntos de chaves (autor normalizado, ano)
+    e custam tempo linear no número de entradas; a ordenação das
+    referências não relê o documento.
+    """
+
+    def __init__(self):
+        self.citations = []
+        self.references = []
+
+    def add(self, paragraph, entries):
+        """
+        Acrescenta as entradas de um parágrafo.
+
+        Args:
+            paragraph (int): Posição do parágrafo no documento formatado
+            entries (list): Entradas de paragraph_entries
+        """
+        for entry in entries:
+            if entry[0] == CITATION:
+                self.citations.append(Citation(paragraph, *entry[1:]))
+            else:
+                self.references.append(Reference(paragraph, *entry[1:]))
+
+    def load(self, data):
+        """
+        Acrescenta as entradas de um índice serializado com to_dict.
+        """
+        self.citations.extend(Citation(**item) for item in data.get('citations', []))
+        self.references.extend(Reference(**item) for item in data.get('references', []))
+        return self
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls().load(data)
+
+    def to_dict(self):
+        return {
+            'citations': [citation._asdict() for citation in self.citations],
+            'references': [reference._asdict() for reference in self.references],
+        }
+
+    def cited_not_listed(self):
+        """
+        Obras citadas no texto sem referência correspondente.
+
+        Returns:
+            list: Dicionários com autor, ano, número de ocorrências e parágrafos
+        """
+        listed = {_work_key(reference.author, reference.year) for reference in self.references}
+        missing = {}
+        for citation in self.citations:
+            key = _work_key(citation.author, citation.year)
+            if key in listed:
+                continue
+            if key not in missing:
+                missing[key] = {'author': citation.author, 'year': citation.year, 'occurrences': 0, 'paragraphs': []}
+            missing[key]['occurrences'] += 1
+            missing[key]['paragraphs'].append(citation.paragraph)
+        return list(missing.values())
+
+    def listed_not_cited(self):
+        """
+        Referências que não são citadas no texto.
+
+        Returns:
+            list: Referências (dicionários) na ordem do documento
+        """
+        cited = {_work_key(citation.author, citation.year) for citation in self.citations}
+        return [reference._asdict() for reference in self.references
+                if _work_key(reference.author, reference.year) not in cited]
+
+    def sorted_references(self):
+        """
+        Ordem alfabética das referências (autor, ano e texto, sem acentos).
+
+        Returns:
+            list: Posições em `references`, na ordem ABNT
+        """
+        return sorted(range(len(self.references)),
+                      key=lambda i: (_work_key(self.references[i].author, self.references[i].year),
+                                     author_key(self.references[i].text)))
+
+    def report(self):
+        """
+        Retorna o índice com as verificações cruzadas e a ordem das referências.
+        """
+        return dict(self.to_dict(),
+                    cited_not_listed=self.cited_not_listed(),
+                    listed_not_cited=self.listed_not_cited(),
+                    sorted_references=self.sorted_references())
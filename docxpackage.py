@@ -0,0 +1,214 @@
+import re
+import struct
+import logging
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape, quoteattr
+
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+logger = logging.getLogger('aibnt_app.docxpackage')
+
+# Membros lidos e interpretados pelo python-docx; os demais (imagens, fontes,
+# planilhas de gráficos, miniaturas) não são descomprimidos
+XML_SUFFIXES = ('.xml', '.rels')
+
+# Tamanho dos blocos ao copiar dados comprimidos
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Bit 3 do cabeçalho: CRC e tamanhos gravados em um descritor após os dados
+_DATA_DESCRIPTOR_FLAG = 0x08
+
+
+# Caracteres de controle que não podem aparecer em XML 1.0 (comuns em texto extraído de PDF)
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+# Como no setter `run.text` do python-docx: tabulação vira <w:tab/> e quebras viram <w:br/>
+_RUN_SPECIAL_CHARS = re.compile('[\t\n\r]')
+_RUN_SPECIAL_XML = {
+    '\t': '</w:t><w:tab/><w:t xml:space="preserve">',
+    '\n': '</w:t><w:br/><w:t xml:space="preserve">',
+    '\r': '</w:t><w:br/><w:t xml:space="preserve">',
+}
+
+
+def paragraph_xml(text, style_id=None):
+    """
+    Gera o XML de um parágrafo com um único run de texto.
+
+    Equivale a `add_paragraph(text, style)` do python-docx, sem criar os
+    objetos; os fragmentos são inseridos em lote com append_paragraphs.
+
+    Args:
+        text (str): Texto do parágrafo
+        style_id (str, optional): ID do estilo; None para o estilo padrão
+
+    Returns:
+        str: Elemento <w:p> serializado (prefixo w: sem declaração)
+    """
+    properties = '' if style_id is None else f'<w:pPr><w:pStyle w:val={quoteattr(style_id)}/></w:pPr>'
+    if not text:
+        return f'<w:p>{properties}</w:p>'
+    content = _RUN_SPECIAL_CHARS.sub(lambda match: _RUN_SPECIAL_XML[match.group(0)],
+                                     escape(_INVALID_XML_CHARS.sub('', text)))
+    return f'<w:p>{properties}<w:r><w:t xml:space="preserve">{content}</w:t></w:r></w:p>'
+
+
+def append_paragraphs(body, paragraphs):
+    """
+    Acrescenta parágrafos ao fim do corpo do documento, antes das propriedades da seção.
+
+    O lote é interpretado em uma única chamada ao parser, e os elementos são
+    movidos de uma vez; `add_paragraph` percorre o corpo a cada inserção para
+    achar a posição, o que torna documentos longos quadráticos.
+
+    Args:
+        body: Elemento <w:body> (document.element.body)
+        paragraphs (list): Fragmentos gerados por paragraph_xml
+
+    Returns:
+        int: Número de parágrafos acrescentados
+    """
+    fragment = parse_xml(f'<w:body {nsdecls("w")}>{"".join(paragraphs)}</w:body>')
+    count = len(fragment)
+    # sectPr, quando existe, é sempre o último filho do corpo
+    sect_pr = body[-1] if len(body) and body[-1].tag == qn('w:sectPr') else None
+    if sect_pr is not None:
+        body.remove(sect_pr)
+    body.extend(list(fragment))
+    if sect_pr is not None:
+        body.append(sect_pr)
+    return count
+
+
+def _is_xml_member(name):
+    return name.lower().endswith(XML_SUFFIXES)
+
+
+def _copy_raw(source, info, archive):
+    """
+    Copia um membro de um ZIP para outro sem descomprimir nem recomprimir.
+
+    Args:
+        source (zipfile.ZipFile): ZIP de origem, aberto para leitura
+        info (zipfile.ZipInfo): Membro da origem
+        archive (zipfile.ZipFile): ZIP de destino, aberto para escrita
+    """
+    # O cabeçalho local pode ter um campo extra diferente do diretório central
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    source.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+
+    copy = zipfile.ZipInfo(info.filename, info.date_time)
+    copy.compress_type = info.compress_type
+    copy.CRC = info.CRC
+    copy.compress_size = info.compress_size
+    copy.file_size = info.file_size
+    copy.external_attr = info.external_attr
+    copy.flag_bits = info.flag_bits & ~_DATA_DESCRIPTOR_FLAG
+    copy.header_offset = archive.fp.tell()
+
+    archive.fp.write(copy.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source.fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Membro truncado: {info.filename}")
+        archive.fp.write(chunk)
+        remaining -= len(chunk)
+
+    archive.filelist.append(copy)
+    archive.NameToInfo[copy.filename] = copy
+    # Próximas gravações continuam após os dados copiados
+    archive.start_dir = archive.fp.tell()
+
+
+class LazyDocx:
+    """
+    Abre um .docx carregando apenas as partes XML.
+
+    Partes binárias são entregues ao python-docx como marcadores vazios e, ao
+    salvar, copiadas do arquivo original com os bytes comprimidos. Partes XML
+    que não foram alteradas também são copiadas sem recompressão; só as partes
+    informadas como alteradas e as relações são serializadas novamente.
+
+    Args:
+        source: Caminho ou arquivo binário (file-like) do .docx
+    """
+
+    def __init__(self, source):
+        self._archive = zipfile.ZipFile(source)
+        try:
+            self._members = {info.filename: info for info in self._archive.infolist()}
+            self.skipped = set()
+
+            # Pacote enxuto sem compressão: o python-docx só descomprime o XML
+            slim = BytesIO()
+            with zipfile.ZipFile(slim, 'w', zipfile.ZIP_STORED) as package:
+                for name, info in self._members.items():
+                    if info.is_dir():
+                        continue
+                    if _is_xml_member(name):
+                        package.writestr(name, self._archive.read(info))
+                    else:
+                        package.writestr(name, b'')
+                        self.skipped.add(name)
+            slim.seek(0)
+            self.document = Document(slim)
+        except Exception:
+            self._archive.close()
+            raise
+
+    def save(self, target, dirty_parts):
+        """
+        Grava o documento, copiando literalmente as partes não alteradas.
+
+        Se o pacote ganhou partes novas (por exemplo, um styles.xml criado pelo
+        python-docx), grava pelo caminho completo de `Document.save`, já que o
+        [Content_Types].xml original deixa de ser válido.
+
+        Args:
+            target: Caminho ou arquivo binário (file-like) de saída
+            dirty_parts (list): Partes (python-docx) alteradas pela formatação
+        """
+        package = self.document.part.package
+        parts = package.parts
+        if any(part.partname.membername not in self._members for part in parts):
+            if self.skipped:
+                self._restore_skipped(parts)
+            self.document.save(target)
+            return
+
+        dirty = {part.partname.membername for part in dirty_parts}
+        for part in parts:
+            part.before_marshal()
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+            _copy_raw(self._archive, self._members['[Content_Types].xml'], archive)
+            archive.writestr('_rels/.rels', package.rels.xml)
+            for part in parts:
+                name = part.partname.membername
+                if name in dirty:
+                    archive.writestr(name, part.blob)
+                else:
+                    _copy_raw(self._archive, self._members[name], archive)
+                if part.rels:
+                    archive.writestr(part.partname.rels_uri.membername, part.rels.xml)
+
+    def _restore_skipped(self, parts):
+        # Caminho completo: as partes binárias precisam do conteúdo real
+        for part in parts:
+            name = part.partname.membername
+            if name in self.skipped:
+                part._blob = self._archive.read(self._members[name])
+
+    def close(self):
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,48 @@
+import os
+
+# Configuração do gunicorn para produção (usada pelo Procfile e por server.py)
+
+bind = os.environ.get('AIBNT_BIND', f"0.0.0.0:{os.environ.get('PORT', 8080)}")
+
+# Os trabalhos de formatação e os uploads em partes ficam na memória de cada
+# worker, e a formatação em si roda no pool de processos de cada um. Por isso o
+# padrão é um worker com várias threads; com mais workers, o balanceador precisa
+# manter cada cliente no mesmo worker (sessões fixas).
+workers = int(os.environ.get('AIBNT_WEB_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('AIBNT_WEB_THREADS', 16))  # inclui conexões SSE abertas
+
+# Carregar o aplicativo no mestre: bibliotecas, modelo ABNT e memória
+# compartilhada das métricas são herdados pelos workers no fork
+preload_app = True
+
+timeout = int(os.environ.get('AIBNT_WEB_TIMEOUT', 120))
+# Tempo para concluir requisições e trabalhos em andamento no reinício (SIGHUP/SIGTERM)
+graceful_timeout = int(os.environ.get('AIBNT_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# Reciclar workers descarta os trabalhos em memória; desativado por padrão
+max_requests = int(os.environ.get('AIBNT_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('AIBNT_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    # No mestre, antes do fork: importações pesadas e modelo ABNT
+    import main
+    main.warm_up(start_pool=False)
+
+
+def post_fork(server, worker):
+    # Em cada worker, antes de aceitar conexões: inicia o pool de trabalhos
+    import main
+    main.warm_up()
+
+
+def worker_exit(server, worker):
+    # Aguarda os trabalhos em andamento dentro do graceful_timeout
+    import main
+    main.job_queue.shutdown(wait=True)
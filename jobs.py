@@ -0,0 +1,629 @@
+import os
+import time
+import uuid
+import queue
+import atexit
+import signal
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+try:
+    import resource
+except ImportError:  # Windows: sem limite de CPU por trabalho
+    resource = None
+
+logger = logging.getLogger('aibnt_app.jobs')
+
+# Configurações da fila de trabalhos
+JOB_WORKERS = int(os.environ.get('AIBNT_JOB_WORKERS', os.cpu_count() or 1))
+JOB_QUEUE_DEPTH = int(os.environ.get('AIBNT_JOB_QUEUE_DEPTH', 32))
+JOB_RESULT_TTL = int(os.environ.get('AIBNT_JOB_RESULT_TTL', 60 * 60))  # 1 hora
+
+# Limites de cada trabalho nos workers isolados (0 desativa)
+JOB_TIMEOUT = int(os.environ.get('AIBNT_JOB_TIMEOUT', 300))  # segundos de relógio
+JOB_CPU_SECONDS = int(os.environ.get('AIBNT_JOB_CPU_SECONDS', 240))
+JOB_MAX_MEMORY_MB = int(os.environ.get('AIBNT_JOB_MAX_MEMORY_MB', 1024))  # PSS do worker e seus filhos
+JOB_MAX_PER_WORKER = int(os.environ.get('AIBNT_JOB_MAX_PER_WORKER', 100))  # reciclagem contra vazamentos
+
+# Intervalo entre verificações de tempo e memória dos workers ocupados
+WATCH_INTERVAL = 0.2
+
+# Estados possíveis de um trabalho
+STATUS_PENDING = 'pendente'
+STATUS_RUNNING = 'processando'
+STATUS_DONE = 'concluido'
+STATUS_FAILED = 'erro'
+
+
+class QueueFullError(Exception):
+    """
+    Erro levantado quando a fila atingiu a profundidade máxima configurada.
+    """
+
+
+class JobError(Exception):
+    """
+    Falha de um trabalho no worker isolado, com um código estável para os clientes.
+    """
+
+    code = 'worker_encerrado'
+    status_code = 500
+
+
+class JobTimeoutError(JobError):
+    """
+    O trabalho excedeu o tempo máximo e o worker foi encerrado.
+    """
+
+    code = 'tempo_esgotado'
+    status_code = 422
+
+
+class JobMemoryError(JobError):
+    """
+    O worker excedeu o limite de memória e foi encerrado.
+    """
+
+    code = 'memoria_excedida'
+    status_code = 422
+
+
+class JobCPUTimeError(JobError):
+    """
+    O trabalho excedeu o limite de tempo de CPU.
+    """
+
+    code = 'cpu_excedida'
+    status_code = 422
+
+
+# Limite de CPU por trabalho no worker atual (definido em _worker_main)
+_cpu_seconds = None
+
+
+def _raise_cpu_limit(signum, frame):
+    raise JobCPUTimeError(f"Trabalho excedeu o limite de {_cpu_seconds}s de CPU")
+
+
+def _set_cpu_limit(seconds):
+    # Limite flexível de CPU do processo: `seconds` além do já consumido, ou nenhum
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = hard
+    if seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + seconds
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, cpu_seconds):
+    """
+    Laço de um worker isolado: recebe (função, argumentos) pelo pipe e devolve o resultado.
+
+    O limite de CPU é renovado a cada trabalho a partir do tempo já consumido
+    pelo processo; ao excedê-lo, o SIGXCPU interrompe o trabalho com
+    JobCPUTimeError, sem derrubar o worker.
+    """
+    global _cpu_seconds
+    _cpu_seconds = cpu_seconds
+
+    # Interrupções do terminal chegam ao processo principal, que encerra os workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    limit_cpu = resource is not None and cpu_seconds
+    if limit_cpu:
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return  # Processo principal encerrado
+        if task is None:
+            return
+        func, args = task
+
+        try:
+            if limit_cpu:
+                _set_cpu_limit(cpu_seconds)
+            outcome = (True, func(*args))
+        except MemoryError:
+            outcome = (False, JobMemoryError("Memória esgotada no worker"))
+        except Exception as e:
+            outcome = (False, e)
+        except BaseException as e:
+            outcome = (False, JobError(f"Trabalho interrompido: {type(e).__name__}"))
+        finally:
+            if limit_cpu:
+                _set_cpu_limit(None)
+
+        try:
+            conn.send(outcome)
+        except Exception as e:
+            # Resultado ou exceção que não pode ser serializado
+            conn.send((False, JobError(f"Resultado do trabalho não pôde ser enviado: {str(e)}")))
+
+
+def _process_memory(pid):
+    # PSS (páginas compartilhadas divididas entre os processos que as usam) pelo
+    # smaps_rollup; em kernels sem ele (anteriores ao 4.14), o RSS do statm
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _tree_memory(pid):
+    """
+    Memória, em bytes, de um processo e de seus descendentes (Linux); None se indisponível.
+
+    Soma o PSS de cada processo: as páginas herdadas no fork e compartilhadas
+    por cópia na escrita entram uma vez no total, e não uma vez por filho
+    como no RSS.
+    """
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            total += _process_memory(current)
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total
+
+
+class _Worker:
+    """
+    Processo filho que executa um trabalho por vez, ligado ao pool por um pipe.
+    """
+
+    def __init__(self, cpu_seconds):
+        self.conn, child_conn = multiprocessing.Pipe()
+        # Não daemon: os trabalhos podem abrir seus próprios pools (extração de PDF, lotes)
+        self.process = multiprocessing.Process(target=_worker_main, args=(child_conn, cpu_seconds),
+                                               name='aibnt-worker')
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Pool de processos com limites por trabalho e reciclagem de workers.
+
+    Cada worker é acompanhado por uma thread do processo principal, que
+    entrega um trabalho por vez e vigia o tempo de relógio e a memória
+    (PSS) do worker, incluindo seus filhos. Ao exceder um limite, só aquele worker é
+    encerrado; o trabalho falha com um JobError de código próprio e o worker
+    é substituído no próximo trabalho. Após `max_jobs_per_worker` trabalhos o
+    worker é reciclado, contendo vazamentos de memória das bibliotecas.
+
+    Os workers são criados por fork do processo atual e herdam as bibliotecas,
+    o modelo ABNT já carregados e a memória compartilhada das métricas. Como o
+    processo tem outras threads (as do servidor e as deste pool), todo fork
+    passa por uma única thread dedicada, que não segura nenhuma trava da
+    aplicação no momento do fork, e dois forks nunca acontecem ao mesmo tempo.
+
+    Oferece a mesma interface de submissão (Future) do ProcessPoolExecutor.
+    """
+
+    def __init__(self, max_workers, timeout=JOB_TIMEOUT, cpu_seconds=JOB_CPU_SECONDS,
+                 max_memory_mb=JOB_MAX_MEMORY_MB, max_jobs_per_worker=JOB_MAX_PER_WORKER):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.recycled = 0
+        self.killed = 0
+        self._tasks = queue.Queue()
+        self._workers = [None] * max_workers
+        self._lock = threading.Lock()
+        self._spawns = queue.Queue()
+        threading.Thread(target=self._spawn_loop, name='aibnt-worker-spawner', daemon=True).start()
+        self._threads = [threading.Thread(target=self._run, args=(slot,), name=f'aibnt-worker-{slot}', daemon=True)
+                         for slot in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+        # Os workers não são daemon: sem isto, a saída do interpretador esperaria por eles
+        atexit.register(self.shutdown, wait=False)
+
+    def submit(self, func, *args, timeout=None):
+        """
+        Agenda `func(*args)` em um worker.
+
+        Args:
+            func: Função de nível de módulo (serializável)
+            *args: Argumentos serializáveis
+            timeout (int, optional): Tempo máximo deste trabalho; se None, usa o do pool
+
+        Returns:
+            Future: Resultado ou exceção do trabalho
+        """
+        future = Future()
+        self._tasks.put((future, func, args, self.timeout if timeout is None else timeout))
+        return future
+
+    def start(self):
+        """
+        Cria todos os workers antecipadamente.
+        """
+        for slot in range(self.max_workers):
+            self._worker(slot)
+
+    def _spawn_loop(self):
+        # Único ponto de fork do pool
+        while True:
+            future = self._spawns.get()
+            if future is None:
+                return
+            try:
+                future.set_result(_Worker(self.cpu_seconds))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _worker(self, slot):
+        with self._lock:
+            worker = self._workers[slot]
+        if worker is not None:
+            return worker
+
+        future = Future()
+        self._spawns.put(future)
+        worker = future.result()
+        with self._lock:
+            current = self._workers[slot]
+            if current is None:
+                self._workers[slot] = worker
+                return worker
+        # Outra thread (start) ocupou o slot enquanto o worker era criado
+        worker.stop()
+        return current
+
+    def _discard(self, slot, kill):
+        with self._lock:
+            worker, self._workers[slot] = self._workers[slot], None
+        if worker is None:
+            return
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def _run(self, slot):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                self._discard(slot, kill=False)
+                return
+            future, func, args, timeout = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                worker = self._worker(slot)
+                worker.conn.send((func, args))
+            except Exception as e:
+                self._discard(slot, kill=True)
+                future.set_exception(e)
+                continue
+
+            try:
+                ok, value = self._wait(worker, timeout)
+            except JobError as e:
+                with self._lock:
+                    self.killed += 1
+                logger.warning(f"Worker {worker.process.pid} encerrado: {str(e)}")
+                self._discard(slot, kill=True)
+                future.set_exception(e)
+                continue
+
+            worker.jobs += 1
+            if self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+                with self._lock:
+                    self.recycled += 1
+                self._discard(slot, kill=False)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _wait(self, worker, timeout):
+        # Aguarda a resposta do worker vigiando tempo, memória e término inesperado
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            try:
+                if worker.conn.poll(WATCH_INTERVAL):
+                    return worker.conn.recv()
+            except (EOFError, OSError):
+                pass
+            if not worker.process.is_alive():
+                raise JobError(f"Worker terminou inesperadamente (código {worker.process.exitcode})")
+            if deadline is not None and time.monotonic() > deadline:
+                raise JobTimeoutError(f"Trabalho excedeu o limite de {timeout}s")
+            if self.max_memory:
+                used = _tree_memory(worker.process.pid)
+                if used is not None and used > self.max_memory:
+                    raise JobMemoryError(f"Trabalho excedeu o limite de {self.max_memory // (1024 * 1024)} MB "
+                                         f"({used // (1024 * 1024)} MB em uso)")
+
+    def shutdown(self, wait=True):
+        """
+        Encerra os workers.
+
+        Args:
+            wait (bool): Conclui antes os trabalhos já submetidos; se False,
+                os workers são encerrados imediatamente
+        """
+        atexit.unregister(self.shutdown)
+        for _ in self._threads:
+            self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            self._spawns.put(None)
+        else:
+            for slot in range(self.max_workers):
+                self._discard(slot, kill=True)
+
+
+class Job:
+    """
+    Representa um trabalho de formatação submetido à fila.
+    """
+
+    def __init__(self, job_id, metadata=None):
+        self.id = job_id
+        self.metadata = metadata or {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.error_code = None
+        self.error_status = None
+        self.future = None
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return STATUS_FAILED
+        if self.finished_at is not None:
+            return STATUS_DONE
+        if self.future is not None and self.future.running():
+            return STATUS_RUNNING
+        return STATUS_PENDING
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'error_code': self.error_code,
+        }
+
+
+class JobQueue:
+    """
+    Fila limitada de trabalhos executados em um pool de processos isolados (WorkerPool).
+
+    A fila rejeita novos trabalhos com QueueFullError quando o número de
+    trabalhos ainda não concluídos atinge `max_depth`, de modo que picos de
+    envio não acumulem memória nem atrasem indefinidamente as respostas.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_depth=JOB_QUEUE_DEPTH, result_ttl=JOB_RESULT_TTL):
+        self.max_workers = max_workers
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._jobs = {}
+        self._pending = 0
+        self._cond = threading.Condition()
+
+    def _get_executor(self):
+        # O pool é criado sob demanda para não iniciar processos na importação
+        if self._executor is None:
+            self._executor = WorkerPool(self.max_workers)
+        return self._executor
+
+    def worker_stats(self):
+        """
+        Retorna (workers reciclados, workers encerrados por limite) desde o início.
+        """
+        if self._executor is None:
+            return 0, 0
+        return self._executor.recycled, self._executor.killed
+
+    def depth(self):
+        """
+        Retorna o número de trabalhos pendentes ou em execução.
+        """
+        with self._cond:
+            return self._pending
+
+    def is_full(self):
+        """
+        Indica se a fila atingiu a profundidade máxima.
+        """
+        with self._cond:
+            return self._pending >= self.max_depth
+
+    def submit(self, func, *args, on_complete=None, timeout=None, **metadata):
+        """
+        Submete um trabalho ao pool de processos.
+
+        Args:
+            func: Função de nível de módulo (serializável) a ser executada
+            *args: Argumentos repassados para `func`
+            on_complete (callable, optional): Chamado no processo principal com o Job concluído
+            timeout (int, optional): Tempo máximo do trabalho; se None, usa JOB_TIMEOUT
+            **metadata: Dados adicionais guardados junto ao trabalho
+
+        Returns:
+            Job: Trabalho criado
+
+        Raises:
+            QueueFullError: Se a fila estiver cheia
+        """
+        with self._cond:
+            self._prune()
+            if self._pending >= self.max_depth:
+                raise QueueFullError(f"Fila de formatação cheia ({self.max_depth} trabalhos)")
+            job = Job(str(uuid.uuid4()), metadata)
+            self._jobs[job.id] = job
+            self._pending += 1
+
+        try:
+            job.future = self._get_executor().submit(func, *args, timeout=timeout)
+        except Exception:
+            with self._cond:
+                self._pending -= 1
+                del self._jobs[job.id]
+            raise
+
+        job.future.add_done_callback(lambda future: self._finish(job, future, on_complete))
+        logger.info(f"Trabalho {job.id} enfileirado (profundidade: {self.depth()})")
+        return job
+
+    def run_inline(self, func, *args, on_complete=None, **metadata):
+        """
+        Executa um trabalho no processo atual e o registra como concluído.
+
+        Usado para documentos pequenos, em que enviar os dados ao pool custa
+        mais que a própria formatação. O trabalho fica disponível pelas mesmas
+        rotas de estado e resultado dos trabalhos enfileirados.
+
+        Args:
+            func: Função a ser executada
+            *args: Argumentos repassados para `func`
+            on_complete (callable, optional): Chamado com o Job concluído
+            **metadata: Dados adicionais guardados junto ao trabalho
+
+        Returns:
+            Job: Trabalho concluído (com resultado ou erro)
+        """
+        with self._cond:
+            self._prune()
+            job = Job(str(uuid.uuid4()), metadata)
+            self._jobs[job.id] = job
+            self._pending += 1
+
+        job.future = Future()
+        try:
+            job.future.set_result(func(*args))
+        except Exception as e:
+            job.future.set_exception(e)
+        self._finish(job, job.future, on_complete)
+        return job
+
+    def _finish(self, job, future, on_complete):
+        try:
+            job.result = future.result()
+        except Exception as e:
+            job.error = str(e)
+            job.error_code = getattr(e, 'code', 'erro_formatacao')
+            job.error_status = getattr(e, 'status_code', 500)
+            logger.error(f"Erro no trabalho {job.id}: {str(e)}")
+
+        if on_complete is not None and job.error is None:
+            try:
+                on_complete(job)
+            except Exception as e:
+                logger.error(f"Erro ao finalizar trabalho {job.id}: {str(e)}")
+
+        with self._cond:
+            job.finished_at = time.time()
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def _prune(self):
+        # Descarta trabalhos concluídos há mais tempo que o TTL
+        limit = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < limit]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """
+        Retorna o trabalho com o ID informado ou None.
+        """
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """
+        Aguarda até que o trabalho seja concluído ou o tempo se esgote.
+
+        Returns:
+            Job: Trabalho (concluído ou não), ou None se o ID não existir
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.finished:
+                self._cond.wait_for(lambda: job.finished, timeout=timeout)
+            return job
+
+    def events(self, job_id, poll_interval=1, heartbeat=15):
+        """
+        Gera os estados de um trabalho à medida que mudam, até sua conclusão.
+
+        Yields:
+            dict: Estado do trabalho, ou None como sinal de keep-alive
+        """
+        last_status = None
+        last_sent = time.time()
+        while True:
+            job = self.wait(job_id, timeout=poll_interval if last_status else 0)
+            if job is None:
+                return
+            if job.status != last_status:
+                last_status = job.status
+                last_sent = time.time()
+                yield job.to_dict()
+            elif time.time() - last_sent >= heartbeat:
+                last_sent = time.time()
+                yield None
+            if job.finished:
+                return
+
+    def start(self):
+        """
+        Inicia os processos do pool antecipadamente, para que o primeiro
+        trabalho não pague a partida a frio.
+        """
+        self._get_executor().start()
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
@@ -0,0 +1,546 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+from io import BytesIO
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+import benchmark
+
+# Diretório padrão dos resultados, ao lado do banco de dados (fora do repositório)
+RESULTS_FOLDER = os.environ.get('AIBNT_LOADTEST_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                     '..', 'data', 'carga'))
+
+# Mistura padrão de tipos de documento (peso relativo) e tamanhos (parágrafos de corpo)
+DEFAULT_MIX = 'txt=4,docx=3,pdf=2,gdoc=1'
+DEFAULT_SIZES = '20,200,1000'
+
+# Intervalo entre consultas ao status de um trabalho
+POLL_INTERVAL = 0.2
+
+# Espera após um 503 sem Retry-After, e o máximo aceito do servidor
+DEFAULT_RETRY_AFTER = 1.0
+MAX_RETRY_AFTER = 30.0
+
+# Respostas de sucesso de cada rota. Cadastro e login redirecionam ao entrar e
+# mostram o formulário de novo (200) quando falham; envio e download
+# redirecionam (302) quando falham.
+SUCCESS_STATUSES = {
+    'register': (302, 303),
+    'login': (302, 303),
+    'upload': (200, 202),
+}
+
+# Percentis reportados por rota
+PERCENTILES = (50, 90, 95, 99)
+
+DOWNLOAD_LINK_RE = re.compile(r'/download/([^"?]+)')
+
+
+def parse_mix(value):
+    """
+    Converte 'txt=4,docx=3' em {'.txt': 4.0, '.docx': 3.0}.
+    """
+    mix = {}
+    for item in filter(None, value.split(',')):
+        ext, _, weight = item.partition('=')
+        mix['.' + ext.strip().lower().lstrip('.')] = float(weight or 1)
+    unknown = set(mix) - {'.txt', '.docx', '.pdf', '.gdoc'}
+    if unknown:
+        raise ValueError(f"Tipos não suportados na mistura: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def build_documents(mix, sizes, variants=3, seed=0):
+    """
+    Gera os documentos sintéticos usados nos uploads.
+
+    Cada combinação de tipo e tamanho tem `variants` versões com sementes
+    diferentes; a repetição entre versões reproduz a taxa de acertos no
+    cache de saídas de um tráfego real, com envios repetidos.
+
+    Returns:
+        dict: (extensão, parágrafos) -> lista de (nome do arquivo, bytes)
+    """
+    documents = {}
+    work_dir = tempfile.mkdtemp(prefix='aibnt_carga_')
+    try:
+        for ext in mix:
+            for size in sizes:
+                items = []
+                for variant in range(variants):
+                    name = f"doc_{size}_{variant}{ext}"
+                    path = os.path.join(work_dir, name)
+                    if ext == '.gdoc':
+                        # Atalho do Google Docs falso: só o JSON com o ID do documento
+                        data = json.dumps({'doc_id': uuid.uuid4().hex, 'url': 'https://docs.google.com/document/d/x',
+                                           'email': 'carga@aibnt.local'}).encode('utf-8')
+                        items.append((name, data))
+                        continue
+                    texts = benchmark.generate_paragraphs(size, references=max(5, size // 10),
+                                                          seed=seed + size * 100 + variant)
+                    if ext == '.txt':
+                        benchmark.write_txt(path, texts)
+                    elif ext == '.docx':
+                        benchmark.write_docx(path, texts)
+                    else:
+                        benchmark.write_pdf(path, texts)
+                    with open(path, 'rb') as f:
+                        items.append((name, f.read()))
+                documents[(ext, size)] = items
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return documents
+
+
+def _multipart(fields, files):
+    # Corpo multipart/form-data sem dependências externas
+    boundary = uuid.uuid4().hex
+    body = BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for name, (filename, data) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'))
+        body.write(data)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode('utf-8'))
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    # Redirecionamentos (login, cadastro) são medidos como a própria resposta, sem seguir
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """
+    Acumula latências e respostas por rota, compartilhado entre os usuários virtuais.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, name, seconds, status, ok):
+        """
+        Registra uma requisição.
+
+        Args:
+            name (str): Rota ou etapa, ex.: 'upload'
+            seconds (float): Latência
+            status: Código HTTP, ou o nome da exceção em falhas de conexão
+            ok (bool): Se a resposta é a esperada em caso de sucesso
+        """
+        with self._lock:
+            self.samples.setdefault(name, []).append((seconds, status, ok))
+
+    def summary(self, duration):
+        """
+        Calcula percentis de latência, vazão e taxa de erros de cada rota.
+
+        Args:
+            duration (float): Duração da execução, em segundos
+
+        Returns:
+            dict: Nome -> estatísticas
+        """
+        with self._lock:
+            samples = {name: list(items) for name, items in self.samples.items()}
+
+        results = {}
+        for name, items in sorted(samples.items()):
+            latencies = sorted(seconds for seconds, _, _ in items)
+            statuses = {}
+            errors = 0
+            for _, status, ok in items:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if not ok:
+                    errors += 1
+            result = {
+                'count': len(items),
+                'errors': errors,
+                'error_rate': errors / len(items),
+                'throughput_per_s': len(items) / duration if duration else 0.0,
+                'mean_seconds': statistics.fmean(latencies),
+                'max_seconds': latencies[-1],
+                'statuses': statuses,
+            }
+            for percentile in PERCENTILES:
+                result[f'p{percentile}_seconds'] = _percentile(latencies, percentile)
+            results[name] = result
+        return results
+
+
+def _percentile(ordered, percentile):
+    # Percentil pelo posto mais próximo, sobre valores já ordenados
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(percentile / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _retry_after(value):
+    # Segundos de um cabeçalho Retry-After (só o formato numérico), limitados a MAX_RETRY_AFTER
+    try:
+        return min(max(float(value), 0.0), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class VirtualUser(threading.Thread):
+    """
+    Usuário simulado: envia documentos, acompanha o trabalho e baixa o resultado.
+
+    Cada usuário tem o próprio cookie de sessão. Usuários logados se
+    cadastram e entram uma vez e, a cada documento, abrem o histórico e
+    baixam pelo link de /download; anônimos baixam pelo resultado do
+    trabalho. O fluxo completo (do envio ao download) também é medido.
+    """
+
+    def __init__(self, number, base_url, documents, mix, recorder, deadline, logged_in, think_time=0.0,
+                 timeout=120, seed=0):
+        super().__init__(name=f'aibnt-carga-{number}', daemon=True)
+        self.base_url = base_url
+        self.documents = documents
+        self.mix = mix
+        self.recorder = recorder
+        self.deadline = deadline
+        self.logged_in = logged_in
+        self.think_time = think_time
+        self.timeout = timeout
+        self.rng = random.Random(seed + number)
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect())
+        self.flows = 0
+        self.retry_after = 0.0
+
+    def request(self, name, path, data=None, headers=None, method=None, success=(200,)):
+        """
+        Executa e registra uma requisição.
+
+        Um 503 registra a espera pedida em Retry-After, respeitada antes do
+        próximo documento do usuário.
+
+        Args:
+            success (tuple): Códigos HTTP que contam como sucesso; os demais são erros
+
+        Returns:
+            tuple: (código HTTP ou None, corpo da resposta)
+        """
+        request = Request(urljoin(self.base_url, path), data=data, headers=headers or {}, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except HTTPError as e:
+            status, body = e.code, e.read()
+            if status == 503:
+                self.retry_after = _retry_after(e.headers.get('Retry-After'))
+        except (URLError, OSError) as e:
+            self.recorder.record(name, time.perf_counter() - started, type(e).__name__, False)
+            return None, b''
+        self.recorder.record(name, time.perf_counter() - started, status, status in success)
+        return status, body
+
+    def _form(self, name, path, fields, files=None):
+        if files:
+            body, content_type = _multipart(fields, files)
+        else:
+            body = '&'.join(f'{key}={value}' for key, value in fields.items()).encode('utf-8')
+            content_type = 'application/x-www-form-urlencoded'
+        return self.request(name, path, body, {'Content-Type': content_type, 'Accept': 'application/json'}, 'POST',
+                            SUCCESS_STATUSES[name.split('.')[0]])
+
+    def sign_in(self):
+        email = f'carga-{uuid.uuid4().hex[:12]}@aibnt.local'
+        self._form('register', '/register', {'email': email, 'password': 'carga', 'name': 'Carga'})
+        status, _ = self._form('login', '/login', {'email': email, 'password': 'carga'})
+        return status in SUCCESS_STATUSES['login']
+
+    def pick_document(self):
+        exts = list(self.mix)
+        ext = self.rng.choices(exts, weights=[self.mix[ext] for ext in exts])[0]
+        sizes = [size for key_ext, size in self.documents if key_ext == ext]
+        name, data = self.rng.choice(self.documents[(ext, self.rng.choice(sizes))])
+        return ext, name, data
+
+    def flow(self):
+        """
+        Um documento do envio ao download.
+
+        Returns:
+            bool: True se o documento foi baixado
+        """
+        ext, name, data = self.pick_document()
+        started = time.perf_counter()
+        status, body = self._form(f'upload{ext}', '/upload', {}, {'file': (name, data)})
+        if status not in SUCCESS_STATUSES['upload']:
+            return False
+        job = json.loads(body)
+        status_url, result_url = job['status_url'], job['result_url']
+
+        while job.get('status') not in ('concluido', 'erro'):
+            if time.time() > self.deadline + self.timeout:
+                return False
+            time.sleep(POLL_INTERVAL)
+            status, body = self.request('job_status', status_url, headers={'Accept': 'application/json'})
+            if status != 200:
+                return False
+            job = json.loads(body)
+        if job['status'] != 'concluido':
+            self.recorder.record('flow_failed', time.perf_counter() - started, 'erro', False)
+            return False
+
+        download = result_url
+        if self.logged_in:
+            status, body = self.request('history', '/history')
+            links = DOWNLOAD_LINK_RE.findall(body.decode('utf-8', errors='ignore')) if status == 200 else []
+            if links:
+                download = f'/download/{links[0]}'
+        status, _ = self.request('download', download)
+        if status != 200:
+            return False
+        self.recorder.record(f'flow{ext}', time.perf_counter() - started, 200, True)
+        return True
+
+    def run(self):
+        if self.logged_in and not self.sign_in():
+            return
+        while time.time() < self.deadline:
+            if self.flow():
+                self.flows += 1
+            if self.retry_after:
+                # Servidor ocupado: espera o pedido antes de enviar de novo
+                time.sleep(max(0.0, min(self.retry_after, self.deadline - time.time())))
+                self.retry_after = 0.0
+            if self.think_time:
+                time.sleep(self.rng.expovariate(1 / self.think_time))
+
+
+class LocalServer:
+    """
+    Substituto local do servidor: o aplicativo em processo, com dados temporários.
+
+    Usuários, cache, revisões, uploads em partes e artefatos vão para um
+    diretório temporário (removido ao final), e o aplicativo é servido por
+    HTTP em uma porta livre com o servidor multithread do Werkzeug. O pool de
+    trabalhos é iniciado como em um worker de produção.
+    """
+
+    def __init__(self):
+        self.data_dir = tempfile.mkdtemp(prefix='aibnt_carga_srv_')
+        os.environ.setdefault('AIBNT_STORAGE_URL', 'memory://')
+        for variable, folder in (('AIBNT_CACHE_FOLDER', 'cache'), ('AIBNT_REVISION_FOLDER', 'revisoes'),
+                                 ('AIBNT_UPLOAD_PARTS_FOLDER', 'parciais'), ('AIBNT_ARTIFACT_FOLDER', 'artefatos')):
+            os.environ.setdefault(variable, os.path.join(self.data_dir, folder))
+
+        import main
+        from werkzeug.serving import make_server
+
+        self.main = main
+        app = main.app
+        if not os.path.isdir(os.path.join(app.root_path, app.template_folder)):
+            # No repositório, os templates ficam na raiz, ao lado de main.py
+            from jinja2 import FileSystemLoader
+            app.jinja_loader = FileSystemLoader(app.root_path)
+        main.warm_up()
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, name='aibnt-carga-servidor', daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.main.job_queue.shutdown()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+def run_load(base_url, users=8, duration=60, mix=DEFAULT_MIX, sizes=DEFAULT_SIZES, logged_in_share=0.5,
+             ramp_up=0.0, think_time=0.0, variants=3, timeout=120, seed=0, label=None):
+    """
+    Executa um teste de carga contra o servidor em `base_url`.
+
+    Args:
+        base_url (str): Endereço do servidor, ex.: 'http://127.0.0.1:8080'
+        users (int): Usuários virtuais simultâneos
+        duration (float): Duração, em segundos, após a rampa
+        mix (str): Pesos dos tipos de documento, ex.: 'txt=4,docx=3,pdf=2,gdoc=1'
+        sizes (str): Tamanhos em parágrafos de corpo, ex.: '20,200,1000'
+        logged_in_share (float): Fração dos usuários que entram com conta
+        ramp_up (float): Intervalo, em segundos, para iniciar todos os usuários
+        think_time (float): Pausa média entre documentos de um usuário
+        variants (int): Versões de cada documento sintético
+        timeout (float): Tempo máximo de cada requisição
+        seed (int): Semente dos documentos e das escolhas dos usuários
+        label (str, optional): Identificação da execução (versão, configuração)
+
+    Returns:
+        dict: Resultados por rota com metadados da execução
+    """
+    weights = parse_mix(mix)
+    size_list = [int(size) for size in sizes.split(',') if size]
+    documents = build_documents(weights, size_list, variants, seed)
+
+    recorder = Recorder()
+    started = time.time()
+    deadline = started + ramp_up + duration
+    logged_in_users = round(users * logged_in_share)
+    workers = [VirtualUser(number, base_url, documents, weights, recorder, deadline, number < logged_in_users,
+                           think_time, timeout, seed) for number in range(users)]
+    for worker in workers:
+        worker.start()
+        if ramp_up and users > 1:
+            time.sleep(ramp_up / (users - 1))
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+
+    results = recorder.summary(elapsed)
+    flows = sum(worker.flows for worker in workers)
+    requests = sum(result['count'] for name, result in results.items() if not name.startswith('flow'))
+    errors = sum(result['errors'] for name, result in results.items() if not name.startswith('flow'))
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'label': label,
+            'target': base_url,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'users': users,
+            'logged_in_users': logged_in_users,
+            'duration_seconds': elapsed,
+            'ramp_up_seconds': ramp_up,
+            'think_time_seconds': think_time,
+            'mix': mix,
+            'sizes': size_list,
+            'variants': variants,
+            'seed': seed,
+            # Configuração do servidor local (ou do ambiente de onde partiu a carga)
+            'config': {name: value for name, value in sorted(os.environ.items())
+                       if name.startswith('AIBNT_') and 'SECRET' not in name},
+        },
+        'totals': {
+            'requests': requests,
+            'errors': errors,
+            'error_rate': errors / requests if requests else 0.0,
+            'requests_per_s': requests / elapsed,
+            'flows': flows,
+            'flows_per_s': flows / elapsed,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    """
+    Compara duas execuções: p95 maior, vazão menor ou taxa de erros maior.
+
+    Args:
+        current (dict): Resultado atual de run_load
+        baseline (dict): Resultado de referência
+        threshold (float): Piora relativa tolerada (0.10 = 10%)
+
+    Returns:
+        list: Tuplas (nome, métrica, valor de referência, valor atual, variação relativa)
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        if reference['p95_seconds'] and result['p95_seconds'] / reference['p95_seconds'] - 1 > threshold:
+            regressions.append((name, 'p95_seconds', reference['p95_seconds'], result['p95_seconds'],
+                                result['p95_seconds'] / reference['p95_seconds'] - 1))
+        if result['error_rate'] > reference['error_rate'] + threshold / 10:
+            regressions.append((name, 'error_rate', reference['error_rate'], result['error_rate'],
+                                result['error_rate'] - reference['error_rate']))
+
+    before = baseline['totals']['flows_per_s']
+    after = current['totals']['flows_per_s']
+    if before and 1 - after / before > threshold:
+        regressions.append(('total', 'flows_per_s', before, after, after / before - 1))
+    return regressions
+
+
+def _result_path(folder, report):
+    stamp = report['meta']['timestamp'].replace(':', '')
+    label = re.sub(r'[^\w.-]+', '_', report['meta']['label'] or 'carga')
+    return os.path.join(folder, f'{stamp}_{label}.json')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de carga do fluxo de envio e download do AI.BNT.')
+    parser.add_argument('--url', help='Servidor alvo (padrão: servidor local em processo, com dados temporários)')
+    parser.add_argument('--usuarios', type=int, default=8, help='Usuários simultâneos (padrão: %(default)s)')
+    parser.add_argument('--duracao', type=float, default=60, help='Duração em segundos (padrão: %(default)s)')
+    parser.add_argument('--mistura', default=DEFAULT_MIX, help='Pesos dos tipos de documento (padrão: %(default)s)')
+    parser.add_argument('--tamanhos', default=DEFAULT_SIZES,
+                        help='Tamanhos dos documentos, em parágrafos (padrão: %(default)s)')
+    parser.add_argument('--logados', type=float, default=0.5,
+                        help='Fração de usuários com conta (padrão: %(default)s)')
+    parser.add_argument('--rampa', type=float, default=0.0, help='Segundos para iniciar todos os usuários')
+    parser.add_argument('--pausa', type=float, default=0.0, help='Pausa média entre documentos, em segundos')
+    parser.add_argument('--variantes', type=int, default=3,
+                        help='Versões de cada documento sintético (padrão: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=120, help='Tempo máximo por requisição (padrão: %(default)s)')
+    parser.add_argument('--semente', type=int, default=0, help='Semente dos documentos (padrão: %(default)s)')
+    parser.add_argument('--rotulo', help='Identificação da execução, ex.: versão ou configuração do servidor')
+    parser.add_argument('--saida', help=f'Arquivo JSON dos resultados (padrão: um novo arquivo em {RESULTS_FOLDER})')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior para detectar regressões')
+    parser.add_argument('--limite', type=float, default=0.10,
+                        help='Piora relativa tolerada na comparação (padrão: %(default)s)')
+    args = parser.parse_args(argv)
+
+    options = dict(users=args.usuarios, duration=args.duracao, mix=args.mistura, sizes=args.tamanhos,
+                   logged_in_share=args.logados, ramp_up=args.rampa, think_time=args.pausa,
+                   variants=args.variantes, timeout=args.timeout, seed=args.semente, label=args.rotulo)
+    if args.url:
+        report = run_load(args.url, **options)
+    else:
+        with LocalServer() as server:
+            report = run_load(server.url, **options)
+
+    print(f"{'rota':20} {'req':>6} {'erros':>7} {'req/s':>7} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9}")
+    for name, result in report['results'].items():
+        print(f"{name:20} {result['count']:6d} {result['error_rate']:7.1%} {result['throughput_per_s']:7.2f} "
+              + ' '.join(f"{result[f'p{percentile}_seconds'] * 1000:7.0f}ms" for percentile in PERCENTILES))
+    totals = report['totals']
+    print(f"total: {totals['requests']} requisições ({totals['requests_per_s']:.1f}/s, "
+          f"{totals['error_rate']:.1%} erros), {totals['flows']} documentos ({totals['flows_per_s']:.2f}/s)")
+
+    path = args.saida or _result_path(RESULTS_FOLDER, report)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {path}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.limite)
+        for name, metric, before, after, change in regressions:
+            print(f"REGRESSÃO {name} {metric}: {before:.3f} -> {after:.3f} ({change:+.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,21 +1,38 @@
 import os
-import re
 import json
+import mmap
+import time
 import uuid
+import shutil
+import hashlib
+import tempfile
+import importlib
+import threading
+import zipfile
 import logging
-from io import BytesIO
-from flask import Flask, request, render_template, send_from_directory, url_for, flash, redirect, session, jsonify, send_file
+from copy import deepcopy
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, TextIOWrapper
+from flask import Flask, request, render_template, send_from_directory, url_for, flash, redirect, session, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-import docx
 from docx import Document
 from docx.shared import Pt, Cm, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
 from docx.enum.style import WD_STYLE_TYPE
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from weasyprint import HTML, CSS
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from jobs import JobQueue, QueueFullError, STATUS_DONE
+from cache import OutputCache
+import rules
+import docxpackage
+import revisions
+import uploads
+import batch
+import artifacts
+import citations
+from storage import create_storage
+import metrics
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -25,30 +42,119 @@ logger = logging.getLogger('aibnt_app')
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads')
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx', 'gdoc'}
 MAX_CONTENT_LENGTH = 20 * 1024 * 1024  # 20MB limite
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('AIBNT_PDF_PARALLEL_MIN_PAGES', 64))
+PDF_EXTRACT_WORKERS = int(os.environ.get('AIBNT_PDF_EXTRACT_WORKERS', os.cpu_count() or 1))
+PDF_MIN_SHARD_PAGES = 8
+# Parágrafos de TXT e PDF classificados e gravados no DOCX por lote
+PARAGRAPH_BATCH_SIZE = int(os.environ.get('AIBNT_PARAGRAPH_BATCH_SIZE', 4096))
+STORAGE_URL = os.environ.get('AIBNT_STORAGE_URL', 'sqlite://' + os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'aibnt.db'))
+CACHE_FOLDER = os.environ.get('AIBNT_CACHE_FOLDER', os.path.join(UPLOAD_FOLDER, 'cache'))
+REVISION_FOLDER = os.environ.get('AIBNT_REVISION_FOLDER', os.path.join(UPLOAD_FOLDER, 'revisoes'))
+UPLOAD_PARTS_FOLDER = os.environ.get('AIBNT_UPLOAD_PARTS_FOLDER', os.path.join(UPLOAD_FOLDER, 'parciais'))
+ARTIFACT_FOLDER = os.environ.get('AIBNT_ARTIFACT_FOLDER', os.path.join(UPLOAD_FOLDER, 'artefatos'))
+# Backends carregados no aquecimento; os demais são importados no primeiro documento do formato
+PRELOAD_BACKENDS = os.environ.get('AIBNT_PRELOAD_BACKENDS', '.docx,.pdf,.txt,.gdoc').split(',')
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
-app.secret_key = os.urandom(24)  # Necessário para mensagens flash e sessões
+# Necessário para mensagens flash e sessões; deve ser fixa para compartilhar sessões entre workers
+app.secret_key = os.environ.get('AIBNT_SECRET_KEY') or os.urandom(24)
 
 # Garantir que a pasta de uploads exista
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-# Simulação de banco de dados de usuários (em produção, usar um banco de dados real)
-users_db = {}
+# Armazenamento persistente de usuários e histórico (SQLite em modo WAL por padrão).
+# Fica fora de UPLOAD_FOLDER para não ser servido por /download.
+storage = create_storage(STORAGE_URL)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _extract_pdf_pages(input_path, start, stop):
+    """
+    Extrai o texto de uma faixa de páginas do PDF (executado em um processo do pool).
+    
+    Cada worker abre o arquivo por conta própria via mmap, de modo que as
+    páginas são lidas sob demanda e compartilham o cache de páginas do sistema.
+    O PyPDF2 é importado aqui, e não no módulo, para só pesar nos processos
+    que de fato leem PDFs.
+    
+    Args:
+        input_path (str): Caminho do arquivo PDF
+        start (int): Primeira página da faixa
+        stop (int): Página seguinte à última da faixa
+        
+    Returns:
+        list: Texto de cada página da faixa
+    """
+    from PyPDF2 import PdfReader
+    
+    with open(input_path, 'rb') as pdf_file:
+        with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            reader = PdfReader(data)
+            return [reader.pages[index].extract_text() or '' for index in range(start, stop)]
+
+def _file_path(source):
+    # Caminho de um arquivo binário aberto em disco (ex.: upload em partes); None para arquivos em memória
+    name = getattr(source, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+def _source_size(source):
+    # Tamanho em bytes de um caminho ou arquivo binário (file-like)
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+def _describe_target(target):
+    # Caminho para mensagens de log; arquivos em memória não têm nome
+    return target if isinstance(target, str) else '<memória>'
+
+# Estilos definidos ou ajustados por ABNTFormatter._apply_abnt_styles
+ABNT_STYLE_NAMES = ('Normal', 'Heading 1', 'Heading 2', 'ABNT Citação', 'ABNT Referência')
+
 # Classe de formatação ABNT completa
 class ABNTFormatter:
     """
     Classe responsável pela formatação de documentos conforme as normas ABNT 2023.
     """
     
-    def __init__(self):
-        self.supported_extensions = ['.docx', '.pdf', '.txt']
+    # Versão das regras de formatação; alterar invalida o cache de saídas
+    VERSION = '2023.1'
+    
+    # Modelo ABNT compartilhado pelos documentos do processo
+    _template_bytes = None
+    _template_styles = None
+    
+    # Extensão de saída para cada extensão de entrada
+    OUTPUT_EXTENSIONS = {'.docx': '.docx', '.pdf': '.docx', '.txt': '.docx', '.gdoc': '.docx'}
+    
+    # Formatos de saída que podem ser pedidos; o PDF é renderizado a partir do DOCX formatado
+    OUTPUT_FORMATS = ('.docx', '.pdf')
+    
+    # Backend de cada extensão de entrada: método de formatação e bibliotecas
+    # próprias, importadas apenas no primeiro documento desse formato. O
+    # python-docx não entra aqui: todos os backends geram DOCX.
+    BACKENDS = {
+        '.docx': ('_format_docx', ()),
+        '.pdf': ('_format_pdf', ('PyPDF2',)),
+        '.txt': ('_format_txt_to_docx', ()),
+        '.gdoc': ('_format_gdoc', ()),
+    }
+    
+    # Backends já carregados neste processo
+    _loaded_backends = set()
+    
+    def __init__(self, cache=None, revisions=None):
+        self.supported_extensions = list(self.BACKENDS)
+        self.cache = cache
+        self.revisions = revisions
         
     def format_document(self, input_path, output_dir=None):
         """
@@ -83,141 +189,567 @@ class ABNTFormatter:
         filename = os.path.basename(input_path)
         name, _ = os.path.splitext(filename)
         
+        # Reaproveitar saída em cache para entradas idênticas
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key_for(input_path, self.VERSION)
+            cached_path = self.cache.fetch(cache_key, output_dir, name)
+            if cached_path is not None:
+                return cached_path
+        
         # Formatar documento de acordo com a extensão
+        output_path = os.path.join(output_dir, f"{name}_ABNT{self.OUTPUT_EXTENSIONS[ext]}")
         try:
-            if ext == '.docx':
-                output_path = os.path.join(output_dir, f"{name}_ABNT.docx")
-                return self._format_docx(input_path, output_path)
-            elif ext == '.pdf':
-                output_path = os.path.join(output_dir, f"{name}_ABNT.pdf")
-                return self._format_pdf(input_path, output_path)
-            elif ext == '.txt':
-                output_path = os.path.join(output_dir, f"{name}_ABNT.docx")
-                return self._format_txt_to_docx(input_path, output_path)
-            else:
-                raise ValueError(f"Formato não suportado: {ext}")
+            result = self._format(input_path, ext, output_path)
         except Exception as e:
             logger.error(f"Erro ao formatar documento: {str(e)}")
             raise
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
     
-    def _format_docx(self, input_path, output_path):
+    def format_stream(self, input_file, ext, output_file=None, revision_key=None, digest=None, output_ext=None,
+                      index=None):
         """
-        Formata um documento DOCX de acordo com as normas ABNT 2023.
+        Formata um documento em memória, sem gravar arquivos em disco.
         
         Args:
-            input_path (str): Caminho do arquivo de entrada
-            output_path (str): Caminho do arquivo de saída
+            input_file: Arquivo binário (file-like) ou bytes do documento de entrada
+            ext (str): Extensão do documento de entrada, ex.: '.docx'
+            output_file (optional): Arquivo binário (file-like) de saída. Se None, usa um BytesIO.
+            revision_key (str, optional): Identifica as versões de um mesmo documento para a
+                formatação incremental de DOCX (requer `revisions`)
+            digest (str, optional): SHA-256 da entrada, se já calculado (evita reler o arquivo)
+            output_ext (str, optional): Formato de saída ('.docx' ou '.pdf'). Se None, usa OUTPUT_EXTENSIONS.
+            index (CitationIndex, optional): Recebe as citações e referências do documento,
+                coletadas na mesma passada da formatação (ou do cache, junto com a saída)
             
         Returns:
-            str: Caminho do arquivo formatado
+            tuple: (arquivo de saída posicionado no início, extensão de saída)
         """
+        ext = ext.lower()
+        if ext not in self.supported_extensions:
+            raise ValueError(f"Formato de arquivo não suportado: {ext}. Formatos suportados: {', '.join(self.supported_extensions)}")
+        output_ext = output_ext or self.OUTPUT_EXTENSIONS[ext]
+        if output_ext not in self.OUTPUT_FORMATS:
+            raise ValueError(f"Formato de saída não suportado: {output_ext}. Formatos suportados: {', '.join(self.OUTPUT_FORMATS)}")
+        
+        if isinstance(input_file, (bytes, bytearray)):
+            input_file = BytesIO(input_file)
+        if output_file is None:
+            output_file = BytesIO()
+        
+        # Reaproveitar saída em cache para entradas idênticas
+        cache_key = None
+        if self.cache is not None:
+            cache_ext = self.cache_extension(ext, output_ext)
+            if digest is not None:
+                cache_key = self.cache.key_for_digest(digest, cache_ext, self.VERSION)
+            else:
+                cache_key = self.cache.key_for_stream(input_file, cache_ext, self.VERSION)
+            cached_ext = self._fetch_cached(cache_key, output_file, index)
+            if cached_ext is not None:
+                return output_file, cached_ext
+        
         try:
-            # Abrir documento
-            doc = Document(input_path)
+            if output_ext == '.pdf':
+                formatted = BytesIO()
+                self._format(input_file, ext, formatted, revision_key, index)
+                self._render_pdf(formatted, output_file)
+            else:
+                self._format(input_file, ext, output_file, revision_key, index)
+        except Exception as e:
+            logger.error(f"Erro ao formatar documento: {str(e)}")
+            raise
+        
+        if cache_key is not None:
+            self.cache.put_stream(cache_key, output_file, output_ext)
+            if index is not None:
+                self.cache.put_metadata(cache_key, index.to_dict())
+        output_file.seek(0)
+        return output_file, output_ext
+    
+    def fetch_cached(self, digest, ext, output_ext=None, index=None):
+        """
+        Procura a saída de um documento apenas no cache, sem formatar.
+        
+        Args:
+            digest (str): SHA-256 da entrada
+            ext (str): Extensão do documento de entrada
+            output_ext (str, optional): Formato de saída. Se None, usa OUTPUT_EXTENSIONS.
+            index (CitationIndex, optional): Recebe o índice de citações guardado com a saída
             
-            # Configurar estilos ABNT
-            self._apply_abnt_styles(doc)
+        Returns:
+            tuple: (arquivo de saída posicionado no início, extensão de saída), ou None se
+                a saída (ou, com `index`, o índice de citações) não estiver em cache
+        """
+        if self.cache is None:
+            return None
+        ext = ext.lower()
+        output_ext = output_ext or self.OUTPUT_EXTENSIONS.get(ext)
+        cache_key = self.cache.key_for_digest(digest, self.cache_extension(ext, output_ext), self.VERSION)
+        output_file = BytesIO()
+        cached_ext = self._fetch_cached(cache_key, output_file, index)
+        if cached_ext is None:
+            return None
+        return output_file, cached_ext
+    
+    def _fetch_cached(self, cache_key, output_file, index=None):
+        # Sem o índice guardado, a saída em cache não basta e o documento é formatado de novo
+        cached_index = self.cache.fetch_metadata(cache_key) if index is not None else None
+        if index is not None and cached_index is None:
+            self.cache.record_miss()
+            return None
+        cached_ext = self.cache.fetch_stream(cache_key, output_file)
+        if cached_ext is None:
+            return None
+        if index is not None:
+            index.load(cached_index)
+        output_file.seek(0)
+        return cached_ext
+    
+    def _format(self, source, ext, target, revision_key=None, index=None):
+        """
+        Encaminha a formatação para o método da extensão de entrada.
+        
+        Args:
+            source: Caminho ou arquivo binário (file-like) de entrada
+            ext (str): Extensão do documento de entrada
+            target: Caminho ou arquivo binário (file-like) de saída
+            revision_key (str, optional): Chave da formatação incremental de DOCX
+            index (CitationIndex, optional): Índice de citações a preencher
             
-            # Aplicar formatação ABNT ao conteúdo
-            self._apply_abnt_formatting_to_docx(doc)
+        Returns:
+            Caminho ou arquivo de saída
+        """
+        if ext not in self.BACKENDS:
+            raise ValueError(f"Formato não suportado: {ext}")
+        
+        method = getattr(self, self.load_backend(ext))
+        options = {'revision_key': revision_key} if ext == '.docx' else {}
+        if index is not None:
+            options['index'] = index
+        
+        metrics.DOCUMENT_BYTES.observe(_source_size(source), ext.lstrip('.'))
+        with metrics.STAGE_SECONDS.time('format_total'):
+            return method(source, target, **options)
+    
+    @classmethod
+    def cache_extension(cls, ext, output_ext=None):
+        """
+        Extensão usada na chave do cache de saídas.
+        
+        Saídas em um formato diferente do padrão da entrada ganham uma chave
+        própria, para que o DOCX e o PDF do mesmo documento convivam no cache.
+        
+        Args:
+            ext (str): Extensão de entrada
+            output_ext (str, optional): Formato de saída pedido
             
-            # Salvar documento formatado
-            doc.save(output_path)
+        Returns:
+            str: Extensão para OutputCache.key_for_digest / key_for_stream
+        """
+        if output_ext is None or output_ext == cls.OUTPUT_EXTENSIONS[ext]:
+            return ext
+        return f"{ext}>{output_ext}"
+    
+    @classmethod
+    def load_backend(cls, ext):
+        """
+        Importa as bibliotecas do backend de uma extensão, uma vez por processo.
+        
+        Args:
+            ext (str): Extensão de entrada, ex.: '.pdf'
             
-            logger.info(f"Documento DOCX formatado com sucesso: {output_path}")
+        Returns:
+            str: Nome do método de formatação do backend
+        """
+        method, modules = cls.BACKENDS[ext]
+        if ext not in cls._loaded_backends:
+            started = time.perf_counter()
+            for module in modules:
+                importlib.import_module(module)
+            cls._loaded_backends.add(ext)
+            if modules:
+                logger.info(f"Backend {ext} carregado em {(time.perf_counter() - started) * 1000:.0f} ms")
+        return method
+    
+    def _format_docx(self, input_path, output_path, revision_key=None, index=None):
+        """
+        Formata um documento DOCX de acordo com as normas ABNT 2023.
+        
+        Args:
+            input_path: Caminho ou arquivo binário (file-like) de entrada
+            output_path: Caminho ou arquivo binário (file-like) de saída
+            revision_key (str, optional): Se informado, reaproveita os parágrafos
+                inalterados desde a versão anterior do mesmo documento
+            index (CitationIndex, optional): Índice de citações a preencher
+        
+        Returns:
+            Caminho ou arquivo formatado
+        """
+        try:
+            with docxpackage.LazyDocx(input_path) as package:
+                # Abrir documento sem descomprimir imagens e outras partes binárias
+                doc = package.document
+                
+                # Mesclar estilos ABNT pré-construídos
+                with metrics.STAGE_SECONDS.time('style_application'):
+                    self._merge_abnt_styles(doc)
+                
+                # Estados da versão anterior, para a formatação incremental
+                previous = None
+                if revision_key is not None and self.revisions is not None:
+                    previous = self.revisions.load(revision_key, self.VERSION)
+                
+                # Aplicar formatação ABNT ao conteúdo
+                with metrics.STAGE_SECONDS.time('paragraph_rules'):
+                    states = self._apply_abnt_formatting_to_docx(doc, previous, index)
+                metrics.DOCUMENT_PARAGRAPHS.observe(len(doc.paragraphs), 'docx')
+                
+                # Salvar documento formatado; partes não alteradas são copiadas sem recompressão
+                with metrics.STAGE_SECONDS.time('docx_save'):
+                    package.save(output_path, [doc.part, doc.part.part_related_by(RT.STYLES)])
+            
+            if states is not None:
+                self.revisions.save(revision_key, self.VERSION, states)
+            
+            logger.info(f"Documento DOCX formatado com sucesso: {_describe_target(output_path)}")
             return output_path
         except Exception as e:
             logger.error(f"Erro ao formatar documento DOCX: {str(e)}")
             raise
     
-    def _format_pdf(self, input_path, output_path):
+    def _format_pdf(self, input_path, output_path, index=None):
         """
         Formata um documento PDF de acordo com as normas ABNT 2023.
         
+        O texto extraído é gravado como DOCX com formatação ABNT.
+        
         Args:
-            input_path (str): Caminho do arquivo de entrada
-            output_path (str): Caminho do arquivo de saída
+            input_path: Caminho ou arquivo binário (file-like) de entrada
+            output_path: Caminho ou arquivo binário (file-like) do DOCX de saída
+            index (CitationIndex, optional): Índice de citações a preencher
             
         Returns:
-            str: Caminho do arquivo formatado
+            Caminho ou arquivo formatado
         """
         try:
-            # Extrair texto do PDF
-            reader = PdfReader(input_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n\n"
+            # Documento a partir do modelo ABNT (estilos e margens já aplicados)
+            with metrics.STAGE_SECONDS.time('style_application'):
+                doc = self._new_abnt_document()
             
-            # Criar documento DOCX temporário
-            temp_docx = os.path.join(os.path.dirname(output_path), f"temp_{uuid.uuid4()}.docx")
-            doc = Document()
+            # Extrair o texto página a página e formatar cada parágrafo ao adicioná-lo,
+            # sem montar o texto completo do PDF em memória. As duas etapas se
+            # intercalam, então o tempo de extração é medido à parte.
+            started = time.perf_counter()
+            pages = metrics.TimedIterator(self._iter_pdf_pages(input_path))
+            count = self._add_formatted_paragraphs(doc, self._iter_paragraphs(pages), index)
+            metrics.STAGE_SECONDS.observe(pages.elapsed, 'pdf_extraction')
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - started - pages.elapsed, 'paragraph_rules')
+            metrics.DOCUMENT_PARAGRAPHS.observe(count, 'pdf')
             
-            # Configurar estilos ABNT
-            self._apply_abnt_styles(doc)
+            # Salvar diretamente no destino, sem DOCX temporário
+            with metrics.STAGE_SECONDS.time('docx_save'):
+                doc.save(output_path)
             
-            # Adicionar texto extraído
-            for paragraph in text.split('\n'):
-                if paragraph.strip():
-                    p = doc.add_paragraph(paragraph.strip())
-                    p.style = 'Normal'
+            logger.info(f"Documento PDF convertido para DOCX com formatação ABNT: {_describe_target(output_path)}")
+            return output_path
+        except Exception as e:
+            logger.error(f"Erro ao formatar documento PDF: {str(e)}")
+            raise
+    
+    def _iter_pdf_pages(self, input_path):
+        """
+        Gera o texto de cada página do PDF sob demanda, na ordem original.
+        
+        PDFs com pelo menos PDF_PARALLEL_MIN_PAGES páginas são divididos em
+        faixas extraídas em paralelo por um pool de processos; abaixo disso,
+        a extração fica no processo atual. Cada worker abre o PDF pelo
+        caminho: arquivos abertos em disco (uploads em partes) usam o próprio
+        caminho, e PDFs em memória são gravados uma vez em um temporário.
+        
+        Args:
+            input_path: Caminho ou arquivo binário (file-like) do PDF
             
-            # Aplicar formatação ABNT ao conteúdo
-            self._apply_abnt_formatting_to_docx(doc)
+        Yields:
+            str: Texto extraído da página
+        """
+        from PyPDF2 import PdfReader
+        
+        path = input_path if isinstance(input_path, str) else _file_path(input_path)
+        if path is None:
+            # PDF em memória
+            reader = PdfReader(input_path)
+            page_count = len(reader.pages)
+            metrics.DOCUMENT_PAGES.observe(page_count)
+            if page_count < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_WORKERS < 2:
+                metrics.PDF_SHARDS.observe(1)
+                for page in reader.pages:
+                    yield page.extract_text() or ''
+                return
             
-            # Salvar documento DOCX temporário
-            doc.save(temp_docx)
+            input_path.seek(0)
+            fd, spooled = tempfile.mkstemp(suffix='.pdf', prefix='aibnt_pdf_')
+            with os.fdopen(fd, 'wb') as pdf_file:
+                shutil.copyfileobj(input_path, pdf_file)
+            try:
+                yield from self._iter_pdf_shards(spooled, page_count)
+            finally:
+                os.remove(spooled)
+            return
+        
+        # Passar o arquivo aberto (e não o caminho) evita que o PdfReader
+        # carregue o PDF inteiro em memória
+        with open(path, 'rb') as pdf_file:
+            reader = PdfReader(pdf_file)
+            page_count = len(reader.pages)
+            metrics.DOCUMENT_PAGES.observe(page_count)
             
-            # Converter DOCX para PDF
-            docx_output_path = output_path.replace('.pdf', '.docx')
-            os.rename(temp_docx, docx_output_path)
+            if page_count < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_WORKERS < 2:
+                metrics.PDF_SHARDS.observe(1)
+                for page in reader.pages:
+                    yield page.extract_text() or ''
+                return
+        
+        yield from self._iter_pdf_shards(path, page_count)
+    
+    def _iter_pdf_shards(self, path, page_count):
+        """
+        Extrai as páginas de um PDF em disco em faixas paralelas, na ordem original.
+        
+        Args:
+            path (str): Caminho do PDF
+            page_count (int): Número de páginas
             
-            # Também retornar o DOCX para download
-            logger.info(f"Documento PDF convertido para DOCX com formatação ABNT: {docx_output_path}")
-            return docx_output_path
-        except Exception as e:
-            logger.error(f"Erro ao formatar documento PDF: {str(e)}")
-            raise
+        Yields:
+            str: Texto extraído da página
+        """
+        workers = min(PDF_EXTRACT_WORKERS, page_count)
+        # Faixas menores que o número de workers equilibram páginas de custo desigual
+        shard_size = max(PDF_MIN_SHARD_PAGES, -(-page_count // (workers * 4)))
+        shards = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+        logger.info(f"Extraindo {page_count} páginas em {len(shards)} faixas com {workers} processos")
+        metrics.PDF_SHARDS.observe(len(shards))
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map preserva a ordem das faixas e entrega cada uma assim que estiver pronta
+            results = executor.map(_extract_pdf_pages, [path] * len(shards),
+                                   [start for start, _ in shards], [stop for _, stop in shards])
+            for texts in results:
+                yield from texts
+    
+    def _iter_paragraphs(self, chunks):
+        """
+        Converte blocos de texto em parágrafos não vazios.
+        
+        Args:
+            chunks: Iterável de blocos de texto (por exemplo, páginas)
+            
+        Yields:
+            str: Texto do parágrafo sem espaços nas pontas
+        """
+        for chunk in chunks:
+            for line in chunk.split('\n'):
+                line = line.strip()
+                if line:
+                    yield line
+    
+    def _add_formatted_paragraphs(self, doc, paragraphs, index=None):
+        """
+        Classifica e adiciona parágrafos já com o estilo e o texto ABNT finais.
+        
+        Os parágrafos são processados em lotes de PARAGRAPH_BATCH_SIZE: cada
+        lote é classificado de uma vez (rules.classify_many) e gravado no
+        corpo do documento como um único fragmento XML, com os IDs de estilo
+        resolvidos uma vez por documento. Nenhum parágrafo passa pelo
+        python-docx para ser criado e depois reestilizado.
+        
+        Args:
+            doc: Documento DOCX
+            paragraphs: Iterável de textos de parágrafo (sem espaços nas pontas e sem quebras de linha)
+            index (CitationIndex, optional): Índice de citações a preencher
+            
+        Returns:
+            int: Número de parágrafos adicionados
+        """
+        body = doc.element.body
+        first = len(doc.paragraphs)
+        style_ids = {}
+        found = None
+        count = 0
+        
+        paragraphs = iter(paragraphs)
+        while True:
+            batch = list(islice(paragraphs, PARAGRAPH_BATCH_SIZE))
+            if not batch:
+                break
+            
+            fragments = []
+            for text, rule in zip(batch, rules.classify_many(batch)):
+                if index is not None:
+                    found = []
+                edits = rules.paragraph_edits(text, rule, found)
+                if index is not None:
+                    index.add(first + count, citations.paragraph_entries(text, rule, edits, found))
+                
+                style = rule.style or 'Normal'
+                if style not in style_ids:
+                    # None para o estilo padrão, como em paragraph.style = 'Normal'
+                    style_ids[style] = doc.part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH)
+                fragments.append(docxpackage.paragraph_xml(rules.apply_edits(text, edits), style_ids[style]))
+                count += 1
+            docxpackage.append_paragraphs(body, fragments)
+        return count
     
-    def _format_txt_to_docx(self, input_path, output_path):
+    def _format_txt_to_docx(self, input_path, output_path, index=None):
         """
         Converte um arquivo TXT para DOCX e aplica formatação ABNT.
         
         Args:
-            input_path (str): Caminho do arquivo de entrada
-            output_path (str): Caminho do arquivo de saída
+            input_path: Caminho ou arquivo binário (file-like) de entrada
+            output_path: Caminho ou arquivo binário (file-like) de saída
+            index (CitationIndex, optional): Índice de citações a preencher
             
         Returns:
-            str: Caminho do arquivo formatado
+            Caminho ou arquivo formatado
         """
         try:
             # Ler conteúdo do arquivo TXT
-            with open(input_path, 'r', encoding='utf-8', errors='ignore') as file:
+            if isinstance(input_path, str):
+                with open(input_path, 'r', encoding='utf-8', errors='ignore') as file:
+                    text = file.read()
+            else:
+                file = TextIOWrapper(input_path, encoding='utf-8', errors='ignore')
                 text = file.read()
+                # Devolver o arquivo binário sem fechá-lo
+                file.detach()
             
-            # Criar documento DOCX
-            doc = Document()
-            
-            # Configurar estilos ABNT
-            self._apply_abnt_styles(doc)
+            # Criar documento DOCX a partir do modelo ABNT (estilos e margens já aplicados)
+            with metrics.STAGE_SECONDS.time('style_application'):
+                doc = self._new_abnt_document()
             
-            # Adicionar texto
-            for paragraph in text.split('\n'):
-                if paragraph.strip():
-                    p = doc.add_paragraph(paragraph.strip())
-                    p.style = 'Normal'
-            
-            # Aplicar formatação ABNT ao conteúdo
-            self._apply_abnt_formatting_to_docx(doc)
+            # Classificar as linhas em lote e adicioná-las já com o estilo e o texto finais
+            with metrics.STAGE_SECONDS.time('paragraph_rules'):
+                count = self._add_formatted_paragraphs(doc, self._iter_paragraphs([text]), index)
+            metrics.DOCUMENT_PARAGRAPHS.observe(count, 'txt')
             
             # Salvar documento formatado
-            doc.save(output_path)
+            with metrics.STAGE_SECONDS.time('docx_save'):
+                doc.save(output_path)
             
-            logger.info(f"Documento TXT convertido para DOCX com formatação ABNT: {output_path}")
+            logger.info(f"Documento TXT convertido para DOCX com formatação ABNT: {_describe_target(output_path)}")
             return output_path
         except Exception as e:
             logger.error(f"Erro ao converter TXT para DOCX: {str(e)}")
             raise
     
+    def _render_pdf(self, docx_file, output_path):
+        """
+        Renderiza um DOCX já formatado como PDF com o layout ABNT.
+        
+        A quebra de linhas e as métricas da fonte ficam em cache no processo
+        (ver pdfrender), então trabalhos seguintes com parágrafos repetidos
+        renderizam mais rápido.
+        
+        Args:
+            docx_file: Arquivo binário (file-like) do DOCX formatado
+            output_path: Caminho ou arquivo binário (file-like) do PDF de saída
+            
+        Returns:
+            Caminho ou arquivo renderizado
+        """
+        import pdfrender
+        
+        try:
+            docx_file.seek(0)
+            with metrics.STAGE_SECONDS.time('pdf_render'):
+                # Apenas as partes XML são lidas; imagens não são renderizadas
+                with docxpackage.LazyDocx(docx_file) as package:
+                    pages = pdfrender.render(pdfrender.document_paragraphs(package.document), output_path)
+            
+            logger.info(f"PDF renderizado com {pages} páginas: {_describe_target(output_path)}")
+            return output_path
+        except Exception as e:
+            logger.error(f"Erro ao renderizar PDF: {str(e)}")
+            raise
+    
+    def _format_gdoc(self, input_path, output_path, index=None):
+        """
+        Converte um atalho .gdoc do Google Docs para DOCX com formatação ABNT.
+        
+        Args:
+            input_path: Caminho ou arquivo binário (file-like) de entrada
+            output_path: Caminho ou arquivo binário (file-like) de saída
+            index (CitationIndex, optional): Índice de citações a preencher
+            
+        Returns:
+            Caminho ou arquivo formatado
+        """
+        with metrics.STAGE_SECONDS.time('gdoc_extraction'):
+            if isinstance(input_path, str):
+                with open(input_path, 'rb') as f:
+                    data = f.read()
+            else:
+                data = input_path.read()
+            text = _extract_gdoc_text(data)
+        return self._format_txt_to_docx(BytesIO(text), output_path, index)
+    
+    def _abnt_template(self):
+        """
+        Retorna o modelo DOCX com estilos e margens ABNT, construído uma vez por processo.
+        
+        Returns:
+            bytes: Pacote DOCX do modelo, sem compressão para abrir mais rápido
+        """
+        if ABNTFormatter._template_bytes is None:
+            doc = Document()
+            self._apply_abnt_styles(doc)
+            self._apply_abnt_margins(doc)
+            buffer = BytesIO()
+            doc.save(buffer)
+            
+            # Regravar sem compressão: cada abertura evita descompactar styles.xml
+            stored = BytesIO()
+            with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(stored, 'w', zipfile.ZIP_STORED) as target:
+                for item in source.infolist():
+                    target.writestr(item.filename, source.read(item.filename))
+            
+            ABNTFormatter._template_bytes = stored.getvalue()
+            ABNTFormatter._template_styles = {
+                style.name: style.element for style in Document(BytesIO(ABNTFormatter._template_bytes)).styles
+                if style.name in ABNT_STYLE_NAMES
+            }
+        return ABNTFormatter._template_bytes
+    
+    def _new_abnt_document(self):
+        """
+        Cria um documento vazio a partir do modelo ABNT em memória.
+        
+        Returns:
+            Document: Documento com estilos e margens ABNT
+        """
+        return Document(BytesIO(self._abnt_template()))
+    
+    def _merge_abnt_styles(self, doc):
+        """
+        Mescla os estilos ABNT do modelo em um documento existente.
+        
+        Estilos ausentes são copiados prontos do modelo; os já existentes
+        recebem apenas as propriedades ABNT, preservando o restante.
+        
+        Args:
+            doc: Documento DOCX
+        """
+        self._abnt_template()
+        styles = doc.styles
+        for name, element in ABNTFormatter._template_styles.items():
+            if name not in styles:
+                styles.element.append(deepcopy(element))
+        
+        self._apply_abnt_styles(doc)
+    
     def _apply_abnt_styles(self, doc):
         """
         Aplica estilos ABNT ao documento.
@@ -284,47 +816,97 @@ class ABNTFormatter:
             paragraph_format.space_before = Pt(0)
             paragraph_format.space_after = Pt(6)
     
-    def _apply_abnt_formatting_to_docx(self, doc):
+    def _apply_abnt_margins(self, doc):
         """
-        Aplica formatação ABNT ao conteúdo do documento DOCX.
+        Configura as margens ABNT em todas as seções do documento.
         
         Args:
             doc: Documento DOCX
         """
-        # Configurar margens do documento
-        sections = doc.sections
-        for section in sections:
+        for section in doc.sections:
             section.top_margin = Cm(3)
             section.bottom_margin = Cm(2)
             section.left_margin = Cm(3)
             section.right_margin = Cm(2)
+    
+    def _apply_abnt_formatting_to_docx(self, doc, previous=None, index=None):
+        """
+        Aplica formatação ABNT ao conteúdo do documento DOCX.
         
-        # Processar parágrafos para identificar e formatar citações e referências
-        for paragraph in doc.paragraphs:
-            text = paragraph.text.strip()
+        No modo incremental (`previous` informado), cada parágrafo é identificado
+        pela impressão digital do estilo e dos runs de entrada; os já formatados
+        na versão anterior recebem o resultado guardado, sem reclassificação nem
+        correção de citações. As entradas do índice de citações fazem parte do
+        estado, então parágrafos reaproveitados também entram no índice.
+        
+        Args:
+            doc: Documento DOCX
+            previous (dict, optional): Estados da versão anterior (ver revisions.RevisionStore)
+            index (CitationIndex, optional): Índice de citações a preencher
+        
+        Returns:
+            dict: Estados desta versão no modo incremental; None caso contrário
+        """
+        # Configurar margens do documento
+        self._apply_abnt_margins(doc)
+        
+        states = None if previous is None else {}
+        style_ids = {}  # Nome -> ID, resolvido uma vez por documento
+        reused = 0
+        
+        found = None
+        
+        # Processar parágrafos em uma única passada pela tabela de regras
+        for number, paragraph in enumerate(doc.paragraphs):
+            runs = paragraph.runs
+            if states is not None:
+                run_texts = [run.text for run in runs]
+                # ID do estilo lido direto do XML: resolver paragraph.style percorre a tabela de estilos
+                fingerprint = revisions.paragraph_fingerprint(paragraph._p.style, run_texts)
+                state = previous.get(fingerprint)
+                # Estados gravados antes do índice de citações não têm as entradas e são refeitos
+                if state is not None and len(state) > 2:
+                    style, texts, entries = state
+                    if style is not None:
+                        if style not in style_ids:
+                            style_ids[style] = doc.part.get_style_id(style, WD_STYLE_TYPE.PARAGRAPH)
+                        paragraph._p.style = style_ids[style]
+                    if texts is not None:
+                        for run, old_text, new_text in zip(runs, run_texts, texts):
+                            if old_text != new_text:
+                                rules.set_run_text(run, new_text)
+                    if index is not None:
+                        index.add(number, entries)
+                    states[fingerprint] = state
+                    reused += 1
+                    continue
+                raw_text = ''.join(run_texts)
+            else:
+                raw_text = paragraph.text
             
-            # Identificar citações longas (mais de 3 linhas)
-            if len(text) > 240 and text.startswith('"') and text.endswith('"'):
-                paragraph.style = 'ABNT Citação'
-                
-                # Atualizar formato de citação conforme ABNT 2023
-                # Remover aspas das citações longas
-                if text.startswith('"') and text.endswith('"'):
-                    paragraph.text = text[1:-1]
-                
-                # Corrigir formato de autoria em citações
-                paragraph.text = self._fix_citation_format(paragraph.text)
+            rule = rules.classify(raw_text.strip())
+            if rule is None:
+                continue
             
-            # Identificar possíveis referências
-            elif re.match(r'^[A-Z]+,\s+[A-Z]', text) or text.startswith('ASSOCIAÇÃO BRASILEIRA'):
-                paragraph.style = 'ABNT Referência'
+            if rule.style is not None:
+                paragraph.style = rule.style
             
-            # Processar citações em parágrafos normais
-            else:
-                # Corrigir formato de autoria em citações
-                new_text = self._fix_citation_format(text)
-                if new_text != text:
-                    paragraph.text = new_text
+            # Editar apenas os runs afetados, sem reconstruir o parágrafo
+            if index is not None or states is not None:
+                found = []
+            edits = rules.paragraph_edits(raw_text, rule, found)
+            rules.apply_edits_to_runs(runs, edits)
+            
+            if found is not None:
+                entries = citations.paragraph_entries(raw_text, rule, edits, found)
+                if index is not None:
+                    index.add(number, entries)
+            if states is not None:
+                states[fingerprint] = [rule.style, [run.text for run in runs] if edits else None, entries]
+        
+        if states is not None and previous:
+            logger.info(f"Formatação incremental: {reused} parágrafos reaproveitados da versão anterior")
+        return states
     
     def _fix_citation_format(self, text):
         """
@@ -336,41 +918,293 @@ class ABNTFormatter:
         Returns:
             str: Texto corrigido
         """
-        # Padrão para citações entre parênteses com autoria em maiúsculas
-        pattern = r'\(([A-Z]+)(,|\s+et\s+al\.)(.*?)\)'
-        
-        # Função para converter a primeira letra para maiúscula e o resto para minúscula
-        def convert_case(match):
-            author = match.group(1)
-            separator = match.group(2)
-            rest = match.group(3)
-            
-            # Converter autor para iniciar com maiúscula
-            if author == author.upper():
-                author = author.title()
-            
-            # Converter "ET AL." para "et al."
-            if separator.lower() == ' et al.':
-                separator = ' et al.'
-            
-            return f'({author}{separator}{rest})'
-        
-        # Aplicar correção
-        corrected_text = re.sub(pattern, convert_case, text)
+        return rules.fix_citation_format(text)
+
+# Inicializar o formatador ABNT com cache de saídas por conteúdo
+output_cache = OutputCache(CACHE_FOLDER)
+revision_store = revisions.RevisionStore(REVISION_FOLDER, ttl=artifacts.ARTIFACT_TTL)
+abnt_formatter = ABNTFormatter(cache=output_cache, revisions=revision_store)
+
+# Fila de trabalhos de formatação (pool de processos limitado)
+job_queue = JobQueue()
+
+# Uploads em partes (retomáveis), montados em disco
+upload_manager = uploads.UploadManager(UPLOAD_PARTS_FOLDER, MAX_CONTENT_LENGTH)
+
+# Documentos formatados persistidos (histórico, lotes), com validade e cotas
+artifact_store = artifacts.ArtifactStore(ARTIFACT_FOLDER)
+# Os estados de revisão vencem junto com os artefatos dos usuários; uploads
+# abandonados são descartados mesmo sem novos uploads
+artifact_store.add_sweep(revision_store.sweep)
+artifact_store.add_sweep(upload_manager.prune)
+
+# Sinaliza que o processo terminou o aquecimento (ver /readyz)
+_warm = threading.Event()
+
+def warm_up(start_pool=True):
+    """
+    Prepara o processo para receber tráfego.
+    
+    Carrega os backends de PRELOAD_BACKENDS, constrói o modelo ABNT e, se
+    pedido, inicia os processos do pool de trabalhos e a varredura dos
+    artefatos vencidos. Com o servidor em pré-carregamento, a primeira parte
+    roda uma vez no processo mestre e é herdada pelos workers; o pool e a
+    varredura são iniciados em cada worker após o fork.
+    
+    Args:
+        start_pool (bool): Inicia o pool de trabalhos e a varredura de artefatos
+    """
+    started = time.time()
+    for ext in filter(None, PRELOAD_BACKENDS):
+        try:
+            ABNTFormatter.load_backend(ext)
+        except (KeyError, ImportError, OSError) as e:
+            logger.warning(f"Não foi possível pré-carregar o backend {ext}: {str(e)}")
+    abnt_formatter._abnt_template()
+    if start_pool:
+        job_queue.start()
+        artifact_store.start_sweeper()
+    _warm.set()
+    logger.info(f"Processo {os.getpid()} aquecido em {time.time() - started:.2f}s")
+
+# Métricas lidas no momento da coleta em /metrics
+metrics.FunctionMetric('aibnt_job_queue_depth', 'Trabalhos pendentes ou em execução na fila.', job_queue.depth)
+metrics.FunctionMetric('aibnt_job_workers_recycled_total', 'Workers substituídos após o máximo de trabalhos.',
+                       lambda: job_queue.worker_stats()[0], 'counter')
+metrics.FunctionMetric('aibnt_job_workers_killed_total', 'Workers encerrados por exceder tempo ou memória.',
+                       lambda: job_queue.worker_stats()[1], 'counter')
+metrics.FunctionMetric('aibnt_cache_hits_total', 'Acertos no cache de saídas.',
+                       lambda: output_cache.hits, 'counter')
+metrics.FunctionMetric('aibnt_cache_misses_total', 'Falhas no cache de saídas.',
+                       lambda: output_cache.misses, 'counter')
+metrics.FunctionMetric('aibnt_cache_evictions_total', 'Entradas removidas do cache de saídas.',
+                       lambda: output_cache.evictions, 'counter')
+metrics.FunctionMetric('aibnt_cache_hit_ratio', 'Fração de acertos no cache de saídas.', output_cache.hit_ratio)
+metrics.FunctionMetric('aibnt_artifact_bytes', 'Espaço em disco ocupado pelos artefatos.', artifact_store.usage_bytes)
+
+def _format_job(input_path, output_dir):
+    """
+    Executa a formatação ABNT dentro de um processo do pool de trabalhos.
+    
+    Args:
+        input_path (str): Caminho do arquivo de entrada
+        output_dir (str): Diretório de saída
         
-        # Corrigir expressões latinas para itálico (simulado com marcadores)
-        latin_expressions = ['et al.', 'apud', 'in', 'loc. cit.', 'op. cit.', 'passim', 'sic']
-        for expr in latin_expressions:
-            # Não podemos aplicar itálico diretamente no texto, mas podemos marcar para processamento posterior
-            corrected_text = corrected_text.replace(f' {expr} ', f' <i>{expr}</i> ')
-            corrected_text = corrected_text.replace(f' {expr},', f' <i>{expr}</i>,')
-            corrected_text = corrected_text.replace(f' {expr}.', f' <i>{expr}</i>.')
-            corrected_text = corrected_text.replace(f' {expr})', f' <i>{expr}</i>)')
+    Returns:
+        str: Caminho do arquivo formatado
+    """
+    return abnt_formatter.format_document(input_path, output_dir)
+
+def _format_upload_job(data, ext, owner=None, download_stem=None, profile_name=None, revision_key=None,
+                       digest=None, output_ext=None):
+    """
+    Formata um upload em memória dentro de um processo do pool de trabalhos.
+    
+    Args:
+        data (bytes): Conteúdo do arquivo enviado (ou arquivo binário aberto)
+        ext (str): Extensão do arquivo enviado
+        owner (str, optional): Usuário dono da saída, guardada no armazenamento de artefatos.
+            Se None, a saída é guardada sem dono, por ANONYMOUS_ARTIFACT_TTL.
+        download_stem (str, optional): Nome base do arquivo para download
+        profile_name (str, optional): Se informado, grava um perfil cProfile com este nome
+        revision_key (str, optional): Documento do usuário, para a formatação incremental
+        digest (str, optional): SHA-256 do conteúdo, calculado durante o recebimento
+        output_ext (str, optional): Formato de saída pedido ('.docx' ou '.pdf')
+    
+    Returns:
+        Artifact: Artefato guardado, com o índice de citações nos metadados
+    """
+    index = citations.CitationIndex()
+    if profile_name is not None:
+        with metrics.profiled(profile_name):
+            output, output_ext = abnt_formatter.format_stream(data, ext, revision_key=revision_key, digest=digest,
+                                                              output_ext=output_ext, index=index)
+    else:
+        output, output_ext = abnt_formatter.format_stream(data, ext, revision_key=revision_key, digest=digest,
+                                                          output_ext=output_ext, index=index)
+    # Também as saídas anônimas vão para o disco: o trabalho guarda só o artefato,
+    # e a memória do processo web não cresce com o tráfego
+    output.seek(0)
+    return artifact_store.put(output, output_ext, owner=owner, name=f"{download_stem or 'documento'}_ABNT{output_ext}",
+                              metadata=index.to_dict())
+
+def _cached_upload_result(digest, ext, owner=None, download_stem=None, output_ext=None):
+    """
+    Atende um upload apenas com o cache de saídas, sem formatar.
+    
+    Roda no processo web: só lê a saída e o índice de citações já guardados.
+    
+    Args:
+        digest (str): SHA-256 do conteúdo enviado
+        ext (str): Extensão do arquivo enviado
+        owner (str, optional): Usuário dono da saída
+        download_stem (str, optional): Nome base do arquivo para download
+        output_ext (str, optional): Formato de saída pedido ('.docx' ou '.pdf')
+    
+    Returns:
+        Artifact: Artefato guardado, ou None se a saída ou o índice não estiverem em cache
+    """
+    index = citations.CitationIndex()
+    cached = abnt_formatter.fetch_cached(digest, ext, output_ext, index)
+    if cached is None:
+        return None
+    output, output_ext = cached
+    return artifact_store.put(output, output_ext, owner=owner, name=f"{download_stem or 'documento'}_ABNT{output_ext}",
+                              metadata=index.to_dict())
+
+def _format_spooled_job(path, ext, owner=None, download_stem=None, revision_key=None, digest=None,
+                        output_ext=None):
+    """
+    Formata um upload recebido em partes e remove o arquivo temporário.
+    
+    Args:
+        path (str): Arquivo montado pelo UploadManager
+        ext (str): Extensão do arquivo enviado
+        owner (str, optional): Usuário dono da saída, guardada no armazenamento de artefatos
+        download_stem (str, optional): Nome base do arquivo para download
+        revision_key (str, optional): Documento do usuário, para a formatação incremental
+        digest (str, optional): SHA-256 calculado durante o recebimento
+        output_ext (str, optional): Formato de saída pedido ('.docx' ou '.pdf')
+    
+    Returns:
+        Artifact: Resultado de _format_upload_job
+    """
+    try:
+        with open(path, 'rb') as f:
+            return _format_upload_job(f, ext, owner, download_stem, None, revision_key, digest, output_ext)
+    finally:
+        os.remove(path)
+
+def _extract_gdoc_text(data):
+    """
+    Extrai o texto de um atalho .gdoc do Google Docs.
+    
+    Args:
+        data (bytes): Conteúdo do arquivo .gdoc
         
-        return corrected_text
+    Returns:
+        bytes: Texto extraído, codificado em UTF-8
+    """
+    # Em uma versão real, usaríamos a API do Google Drive
+    # Aqui, apenas simulamos a extração
+    try:
+        gdoc_data = json.loads(data.decode('utf-8', errors='ignore'))
+        doc_id = gdoc_data.get('doc_id', 'unknown')
+    except:
+        doc_id = 'unknown'
+    
+    text = (f"Conteúdo extraído do Google Doc ID: {doc_id}\n\n"
+            "Este é um documento simulado extraído de um arquivo Google Docs.\n"
+            "Em um ambiente de produção, usaríamos a API do Google Drive para baixar o conteúdo real.")
+    return text.encode('utf-8')
+
+def _init_batch_worker():
+    """
+    Prepara um processo do pool do lote.
+    
+    Os documentos do lote já são formatados em paralelo; sem isto, cada PDF
+    grande abriria seu próprio pool de extração, multiplicando os processos
+    (e a memória) do trabalho.
+    """
+    global PDF_EXTRACT_WORKERS
+    PDF_EXTRACT_WORKERS = 1
+
+def _format_batch_job(zip_path, workers, ordered, fail_fast, download_stem=None):
+    """
+    Executa a formatação em lote de um ZIP dentro de um processo do pool de trabalhos.
+    
+    O ZIP de entrada e o de saída ficam na área temporária do armazenamento
+    de artefatos; a saída é guardada como artefato anônimo e a entrada é
+    removida ao final.
+    
+    Returns:
+        Artifact: ZIP com os documentos formatados e o relatório
+    """
+    output_zip = artifact_store.temp_path('.zip')
+    try:
+        batch.format_batch(zip_path, output_zip, _format_job, workers=workers,
+                           ordered=ordered, fail_fast=fail_fast, initializer=_init_batch_worker)
+        return artifact_store.put(output_zip, '.zip', name=f"{download_stem or 'lote'}_ABNT.zip")
+    finally:
+        for path in (zip_path, output_zip):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _record_history(user_id, original_filename):
+    """
+    Cria o callback que salva o documento no histórico quando o trabalho termina.
+    """
+    def on_complete(job):
+        storage.add_document(user_id, original_filename, job.result.filename, job.created_at)
+    return on_complete
+
+def _requested_output_ext(value):
+    """
+    Converte a opção 'formato' do cliente ('docx' ou 'pdf') na extensão de saída.
+    
+    Returns:
+        str: Extensão de saída, ou None para o formato padrão
+    
+    Raises:
+        UploadError: Se o formato pedido não for suportado
+    """
+    if not value:
+        return None
+    output_ext = '.' + value.lower().lstrip('.')
+    if output_ext not in ABNTFormatter.OUTPUT_FORMATS:
+        raise uploads.UploadError(f"Formato de saída não suportado: {value}")
+    return output_ext
+
+def _wants_json():
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return best == 'application/json'
+
+def _dispatch_upload(func, args, ext, size, on_complete=None, cached=None, **metadata):
+    """
+    Encaminha a formatação de um upload conforme o formato e o tamanho.
+    
+    Textos pequenos são formatados na própria requisição. Para os demais,
+    a requisição só tenta o cache (`cached`); sem a saída em cache, o
+    documento vai para os workers isolados do pool, com seus limites.
+    
+    Args:
+        func: Função de formatação do trabalho
+        args (tuple): Argumentos de `func`
+        ext (str): Extensão do arquivo enviado
+        size (int): Tamanho do upload, em bytes
+        on_complete (callable, optional): Chamado com o Job concluído
+        cached (callable, optional): Leitura apenas do cache; retorna o resultado ou None
+    
+    Returns:
+        Job: Trabalho concluído (caminho rápido) ou enfileirado
+    
+    Raises:
+        QueueFullError: Se o documento precisar da fila e ela estiver cheia
+    """
+    if uploads.runs_inline(ext, size):
+        return job_queue.run_inline(func, *args, on_complete=on_complete, **metadata)
+    if cached is not None:
+        result = cached()
+        if result is not None:
+            return job_queue.run_inline(lambda: result, on_complete=on_complete, **metadata)
+    return job_queue.submit(func, *args, on_complete=on_complete, **metadata)
 
-# Inicializar o formatador ABNT
-abnt_formatter = ABNTFormatter()
+def _job_response(job):
+    # Resposta JSON de um trabalho: 200 se já concluído, 202 se ainda na fila
+    status_url = url_for('job_status', job_id=job.id)
+    response = jsonify(dict(job.to_dict(),
+                            status_url=status_url,
+                            events_url=url_for('job_events', job_id=job.id),
+                            result_url=url_for('job_result', job_id=job.id)))
+    response.status_code = 200 if job.finished else 202
+    response.headers['Location'] = status_url
+    return response
+
+def _busy_response():
+    response = jsonify({'error': 'Servidor ocupado. Tente novamente em instantes.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
 
 @app.route('/')
 def index():
@@ -382,8 +1216,9 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        if email in users_db and check_password_hash(users_db[email]['password'], password):
-            session['user_id'] = users_db[email]['id']
+        user = storage.get_user_by_email(email)
+        if user is not None and check_password_hash(user['password'], password):
+            session['user_id'] = user['id']
             session['user_email'] = email
             flash('Login realizado com sucesso!')
             return redirect(url_for('index'))
@@ -399,18 +1234,11 @@ def register():
         password = request.form.get('password')
         name = request.form.get('name')
         
-        if email in users_db:
+        user = storage.create_user(email, name, generate_password_hash(password))
+        if user is None:
             flash('Este email já está cadastrado.')
         else:
-            user_id = str(uuid.uuid4())
-            users_db[email] = {
-                'id': user_id,
-                'name': name,
-                'password': generate_password_hash(password),
-                'documents': []
-            }
-            
-            session['user_id'] = user_id
+            session['user_id'] = user['id']
             session['user_email'] = email
             flash('Cadastro realizado com sucesso!')
             return redirect(url_for('index'))
@@ -439,57 +1267,83 @@ def upload_file():
     if file and allowed_file(file.filename):
         # Gerar nome de arquivo seguro e único
         original_filename = secure_filename(file.filename)
-        filename = f"{uuid.uuid4()}_{original_filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        name, ext = os.path.splitext(original_filename)
+        ext = ext.lower()
         
         try:
-            # Salvar o arquivo
-            file.save(filepath)
-            
-            # Verificar se é um arquivo .gdoc
-            if filepath.lower().endswith('.gdoc'):
-                # Em uma versão real, usaríamos a API do Google Drive
-                # Aqui, apenas simulamos a extração
-                with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                    try:
-                        gdoc_data = json.load(f)
-                        doc_id = gdoc_data.get('doc_id', 'unknown')
-                    except:
-                        doc_id = 'unknown'
-                
-                txt_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{filename}_extracted.txt")
-                with open(txt_path, 'w', encoding='utf-8') as f:
-                    f.write(f"Conteúdo extraído do Google Doc ID: {doc_id}\n\n")
-                    f.write("Este é um documento simulado extraído de um arquivo Google Docs.\n")
-                    f.write("Em um ambiente de produção, usaríamos a API do Google Drive para baixar o conteúdo real.")
-                
-                filepath = txt_path
-                
-            # Aplicar formatação ABNT
-            output_path = abnt_formatter.format_document(filepath)
+            # Recusar cedo quando a fila estiver cheia, antes de ler o arquivo;
+            # documentos pequenos são formatados na própria requisição
+            if job_queue.is_full() and not uploads.runs_inline(ext, request.content_length or 0):
+                raise QueueFullError(f"Fila de formatação cheia ({job_queue.max_depth} trabalhos)")
+            
+            # Formato de saída pedido (DOCX por padrão, ou PDF renderizado)
+            output_ext = _requested_output_ext(request.form.get('formato') or request.args.get('formato'))
+            
+            # Ler o arquivo em memória; o upload original não é gravado em disco
+            with metrics.STAGE_SECONDS.time('upload_read'):
+                data = file.read()
             
-            # Gerar URL para download
-            download_url = url_for('download_file', filename=os.path.basename(output_path))
+            # Conferir o tipo real pelos primeiros bytes, antes de enfileirar
+            uploads.sniff(data[:uploads.SNIFF_BYTES], ext)
             
-            # Se o usuário estiver logado, salvar o documento no histórico
+            # Perfil cProfile opcional (pedido com ?profile=1 ou por amostragem)
+            profile_name = None
+            if metrics.should_profile(request.args.get('profile') == '1'):
+                profile_name = f"upload_{uuid.uuid4()}"
+            
+            # Enfileirar formatação ABNT e responder imediatamente. A saída é guardada
+            # como artefato: por ARTIFACT_TTL e no histórico para usuários logados, por
+            # ANONYMOUS_ARTIFACT_TTL para os demais. Para usuários logados, novas versões
+            # do mesmo arquivo são formatadas de forma incremental.
+            on_complete = None
+            owner = None
+            revision_key = None
             if 'user_id' in session:
-                user_email = session['user_email']
-                if 'documents' not in users_db[user_email]:
-                    users_db[user_email]['documents'] = []
-                
-                users_db[user_email]['documents'].append({
-                    'original_name': original_filename,
-                    'formatted_name': os.path.basename(output_path),
-                    'date': 'Agora'  # Em produção, usar datetime
-                })
+                on_complete = _record_history(session['user_id'], original_filename)
+                owner = session['user_id']
+                revision_key = f"{session['user_id']}/{original_filename}"
             
-            # Retornar para a página com link de download
+            # O hash identifica uma saída já em cache e é reaproveitado pelo worker
+            digest = hashlib.sha256(data).hexdigest()
+            job = _dispatch_upload(_format_upload_job,
+                                   (data, ext, owner, name, profile_name, revision_key, digest, output_ext),
+                                   ext, len(data), on_complete,
+                                   lambda: _cached_upload_result(digest, ext, owner, name, output_ext),
+                                   original_name=original_filename, download_stem=name)
+            
+            if _wants_json():
+                return _job_response(job)
+            
+            events_url = url_for('job_events', job_id=job.id)
+            download_url = url_for('job_result', job_id=job.id)
+            
+            # Retornar para a página que acompanha o trabalho
             return render_template('index.html', 
                                   file_uploaded=True, 
                                   filename=original_filename, 
+                                  job_id=job.id,
+                                  events_url=events_url,
                                   download_url=download_url,
                                   logged_in='user_id' in session)
             
+        except QueueFullError as e:
+            logger.warning(f"Upload recusado: {str(e)}")
+            if _wants_json():
+                return _busy_response()
+            flash('Servidor ocupado. Tente novamente em instantes.')
+            return redirect(url_for('index'))
+        except uploads.UploadError as e:
+            logger.warning(f"Upload recusado: {str(e)}")
+            if _wants_json():
+                return jsonify({'error': str(e)}), e.status_code
+            flash(f'Arquivo recusado: {str(e)}')
+            return redirect(url_for('index'))
+        except artifacts.QuotaExceededError as e:
+            logger.warning(f"Upload recusado: {str(e)}")
+            if _wants_json():
+                return jsonify({'error': str(e)}), e.status_code
+            flash('Sem espaço para guardar o documento formatado. Tente novamente mais tarde.')
+            return redirect(url_for('index'))
         except Exception as e:
             logger.error(f"Erro ao processar arquivo: {str(e)}")
             flash(f'Erro ao processar o arquivo: {str(e)}')
@@ -498,14 +1352,291 @@ def upload_file():
         flash('Tipo de arquivo não permitido')
         return redirect(url_for('index'))
 
+@app.route('/batch', methods=['POST'])
+def batch_upload():
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'Nenhum arquivo enviado.'}), 400
+    if not file.filename.lower().endswith('.zip'):
+        return jsonify({'error': 'Envie um arquivo .zip com os documentos.'}), 400
+    
+    if job_queue.is_full():
+        return _busy_response()
+    
+    # Opções do lote, limitadas à configuração do servidor
+    workers = min(request.form.get('workers', batch.BATCH_WORKERS, type=int), batch.BATCH_WORKERS)
+    ordered = request.form.get('ordered', 'false').lower() in ('1', 'true', 'sim')
+    fail_fast = request.form.get('fail_fast', 'false').lower() in ('1', 'true', 'sim')
+    
+    # Entrada na área temporária dos artefatos: removida pelo trabalho ou, se abandonada, pela varredura
+    zip_path = artifact_store.temp_path('.zip')
+    
+    try:
+        file.save(zip_path)
+        if not zipfile.is_zipfile(zip_path):
+            os.remove(zip_path)
+            return jsonify({'error': 'Arquivo .zip inválido.'}), 400
+        
+        # Limites de documentos e de bytes descompactados, antes de enfileirar
+        try:
+            with zipfile.ZipFile(zip_path) as archive:
+                batch.check_archive(archive)
+        except ValueError as e:
+            os.remove(zip_path)
+            return jsonify({'error': str(e)}), 413
+        
+        job = job_queue.submit(_format_batch_job, zip_path, max(1, workers), ordered, fail_fast,
+                               os.path.splitext(secure_filename(file.filename))[0],
+                               timeout=batch.BATCH_TIMEOUT, original_name=file.filename)
+    except QueueFullError:
+        return _busy_response()
+    except Exception as e:
+        logger.error(f"Erro ao processar lote: {str(e)}")
+        return jsonify({'error': f'Erro ao processar o lote: {str(e)}'}), 500
+    
+    return _job_response(job)
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Inicia um upload em partes.
+    
+    Recebe JSON (ou formulário) com 'filename', 'size' e, opcionalmente,
+    'formato' ('docx' ou 'pdf') da saída. As partes são
+    enviadas com PATCH para 'upload_url', com o cabeçalho Upload-Offset e o
+    corpo binário; GET na mesma URL informa onde retomar após uma falha.
+    """
+    params = request.get_json(silent=True) or request.form
+    filename = secure_filename(params.get('filename', ''))
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Tipo de arquivo não permitido'}), 415
+    
+    try:
+        upload = upload_manager.create(filename, int(params.get('size', 0)), session.get('user_id'),
+                                       _requested_output_ext(params.get('formato')))
+    except ValueError:
+        return jsonify({'error': 'Tamanho do upload inválido'}), 400
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    
+    upload_url = url_for('upload_chunk', upload_id=upload.id)
+    response = jsonify(dict(upload.to_dict(), upload_url=upload_url, chunk_size=uploads.UPLOAD_CHUNK_SIZE))
+    response.status_code = 201
+    response.headers['Location'] = upload_url
+    response.headers['Upload-Offset'] = str(upload.offset)
+    return response
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def upload_chunk(upload_id):
+    upload = upload_manager.get(upload_id)
+    if upload is None or upload.user_id != session.get('user_id'):
+        return jsonify({'error': 'Upload não encontrado.'}), 404
+    
+    if request.method == 'DELETE':
+        upload_manager.discard(upload.id)
+        return '', 204
+    
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({'error': 'Cabeçalho Upload-Offset ausente ou inválido'}), 400
+        
+        # O corpo é lido do stream em blocos, sem passar pelo parser de formulários
+        try:
+            upload_manager.append(upload, offset, request.stream)
+        except uploads.OffsetMismatchError as e:
+            response = jsonify(dict(upload.to_dict(), error=str(e)))
+            response.status_code = e.status_code
+            response.headers['Upload-Offset'] = str(e.offset)
+            return response
+        except uploads.UploadError as e:
+            return jsonify({'error': str(e)}), e.status_code
+        
+        if upload.complete:
+            return _finish_chunked_upload(upload)
+    
+    response = jsonify(upload.to_dict())
+    response.headers['Upload-Offset'] = str(upload.offset)
+    return response
+
+def _finish_chunked_upload(upload):
+    """
+    Encaminha um upload em partes concluído para a formatação.
+    
+    O SHA-256 calculado durante o recebimento identifica entradas já
+    formatadas: essas, e as pequenas, são atendidas na própria requisição.
+    Com a fila cheia, sem espaço para guardar a saída ou com erro de
+    leitura/gravação, o upload continua completo; basta repetir o último
+    PATCH (corpo vazio).
+    """
+    name, ext = os.path.splitext(upload.filename)
+    digest = upload.digest
+    
+    if upload_manager.take(upload) is None:
+        return jsonify({'error': 'Upload já finalizado.'}), 409
+    
+    on_complete = None
+    revision_key = None
+    if upload.user_id is not None:
+        on_complete = _record_history(upload.user_id, upload.filename)
+        revision_key = f"{upload.user_id}/{upload.filename}"
+    
+    def cached():
+        result = _cached_upload_result(digest, ext, upload.user_id, name, upload.output_ext)
+        if result is not None:
+            try:
+                os.remove(upload.path)
+            except OSError as e:
+                # A saída já está guardada; não perder o resultado por causa do arquivo temporário
+                logger.warning(f"Erro ao remover upload {upload.id}: {str(e)}")
+        return result
+    
+    try:
+        job = _dispatch_upload(_format_spooled_job,
+                               (upload.path, ext, upload.user_id, name, revision_key, digest, upload.output_ext),
+                               ext, upload.size, on_complete, cached, original_name=upload.filename,
+                               download_stem=name)
+    except QueueFullError as e:
+        logger.warning(f"Upload recusado: {str(e)}")
+        upload_manager.restore(upload)
+        return _busy_response()
+    except artifacts.QuotaExceededError as e:
+        logger.warning(f"Upload recusado: {str(e)}")
+        upload_manager.restore(upload)
+        return jsonify({'error': str(e)}), e.status_code
+    except OSError as e:
+        logger.error(f"Erro ao finalizar upload {upload.id}: {str(e)}")
+        upload_manager.restore(upload)
+        return jsonify({'error': 'Erro ao finalizar o upload. Tente novamente.'}), 500
+    
+    logger.info(f"Upload {upload.id} concluído ({'inline' if job.finished else 'enfileirado'}, sha256 {digest})")
+    return _job_response(job)
+
 @app.route('/download/<filename>')
 def download_file(filename):
+    # Busca pelo ID no índice dos artefatos, sem percorrer diretórios
+    artifact = artifact_store.get(os.path.splitext(filename)[0])
+    if artifact is not None:
+        return send_file(artifact.path, as_attachment=True, download_name=artifact.name)
+    
     try:
+        # Saídas gravadas antes do armazenamento de artefatos
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
     except FileNotFoundError:
-        flash('Arquivo não encontrado.')
+        flash('Arquivo não encontrado ou expirado.')
         return redirect(url_for('index'))
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabalho não encontrado.'}), 404
+    
+    data = job.to_dict()
+    if job.status == STATUS_DONE:
+        data['result_url'] = url_for('job_result', job_id=job.id)
+    return jsonify(data)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabalho não encontrado.'}), 404
+    if job.error is not None:
+        # Limites do worker (tempo, CPU, memória) respondem 422: o documento não pode ser processado
+        return jsonify(job.to_dict()), job.error_status
+    if not job.finished:
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        return response
+    
+    if isinstance(job.result, artifacts.Artifact):
+        artifact = artifact_store.get(job.result.id)
+        if artifact is None:
+            return jsonify({'error': 'Resultado expirado.'}), 410
+        return send_file(artifact.path, as_attachment=True, download_name=artifact.name)
+    
+    return send_from_directory(os.path.dirname(job.result), os.path.basename(job.result), as_attachment=True)
+
+@app.route('/jobs/<job_id>/citations')
+def job_citations(job_id):
+    """
+    Índice de citações e referências do documento formatado por um trabalho,
+    com as verificações cruzadas e a ordem alfabética das referências.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabalho não encontrado.'}), 404
+    if job.error is not None:
+        return jsonify(job.to_dict()), job.error_status
+    if not job.finished:
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        return response
+    
+    if isinstance(job.result, artifacts.Artifact):
+        data = artifact_store.metadata(job.result.id)
+    else:
+        data = None
+    if data is None:
+        return jsonify({'error': 'Índice de citações indisponível ou expirado.'}), 404
+    return jsonify(citations.CitationIndex.from_dict(data).report())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Trabalho não encontrado.'}), 404
+    
+    def stream():
+        for event in job_queue.events(job_id):
+            if event is None:
+                # Comentário SSE para manter a conexão aberta
+                yield ': keep-alive\n\n'
+            else:
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+    
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/healthz')
+def healthz():
+    # Liveness: o processo está de pé e respondendo
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: aquecido e com espaço na fila de formatação
+    if not _warm.is_set():
+        return jsonify({'status': 'aquecendo'}), 503
+    if job_queue.is_full():
+        return jsonify({'status': 'ocupado', 'queue_depth': job_queue.depth()}), 503
+    return jsonify({'status': 'pronto', 'queue_depth': job_queue.depth()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(output_cache.stats())
+
+@app.route('/artifacts/stats')
+def artifact_stats():
+    return jsonify(artifact_store.stats())
+
+@app.route('/artifacts/<filename>/citations')
+def artifact_citations(filename):
+    # Aceita o nome usado em /download (ID do artefato com a extensão)
+    data = artifact_store.metadata(os.path.splitext(filename)[0])
+    if data is None:
+        return jsonify({'error': 'Índice de citações indisponível ou expirado.'}), 404
+    return jsonify(citations.CitationIndex.from_dict(data).report())
+
 @app.route('/send_email', methods=['POST'])
 def send_email():
     if 'user_id' not in session:
@@ -535,11 +1666,27 @@ def history():
         flash('Você precisa estar logado para ver seu histórico.')
         return redirect(url_for('login'))
     
-    user_email = session['user_email']
-    documents = users_db[user_email].get('documents', [])
+    try:
+        documents, next_cursor = storage.list_documents(session['user_id'], before=request.args.get('antes'))
+    except ValueError:
+        return redirect(url_for('history'))
+    
+    # Disponibilidade da página inteira em uma consulta; nomes antigos são arquivos em UPLOAD_FOLDER
+    names = {os.path.splitext(doc['formatted_name'])[0]: doc['formatted_name'] for doc in documents}
+    available = {names[artifact_id] for artifact_id in artifact_store.available(names)}
+    available.update(doc['formatted_name'] for doc in documents if doc['formatted_name'] not in available
+                     and os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], doc['formatted_name'])))
     
-    return render_template('history.html', documents=documents)
+    return render_template('history.html', documents=documents, next_cursor=next_cursor, available=available,
+                           first_page=request.args.get('antes') is None)
 
 if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção use server.py (gunicorn)
+    debug = os.environ.get('AIBNT_DEBUG', '1') == '1'
+    warm_up(start_pool=False)
+    # O pool de trabalhos parte sob demanda no primeiro upload, mas a varredura
+    # não: é iniciada aqui, no processo que atende (e não no monitor do reloader)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        artifact_store.start_sweeper()
     # Listening on 0.0.0.0 makes it accessible externally
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=debug)
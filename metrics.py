@@ -0,0 +1,194 @@
+import os
+import time
+import random
+import cProfile
+import logging
+import multiprocessing
+from contextlib import contextmanager
+
+logger = logging.getLogger('aibnt_app.metrics')
+
+# Configurações de profiling por requisição
+PROFILE_DIR = os.environ.get('AIBNT_PROFILE_DIR')
+PROFILE_SAMPLE_RATE = float(os.environ.get('AIBNT_PROFILE_SAMPLE_RATE', 0))
+
+# Etapas instrumentadas do pipeline de formatação
+STAGES = ('upload_read', 'gdoc_extraction', 'pdf_extraction', 'style_application',
+          'paragraph_rules', 'docx_save', 'pdf_render', 'format_total')
+FORMATS = ('txt', 'pdf', 'docx', 'gdoc')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (10e3, 50e3, 100e3, 500e3, 1e6, 2e6, 5e6, 10e6, 20e6)
+PAGE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+PARAGRAPH_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+SHARD_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# Métricas registradas, na ordem em que aparecem em /metrics
+REGISTRY = []
+
+
+def _labels(name, value, extra=None):
+    pairs = []
+    if name is not None and value is not None:
+        pairs.append(f'{name}="{value}"')
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """
+    Histograma no formato Prometheus, com valores em memória compartilhada.
+
+    Os valores de rótulo são declarados na criação para que toda a memória
+    seja alocada antes do fork dos workers, que então somam nos mesmos
+    contadores do processo principal.
+    """
+
+    def __init__(self, name, documentation, buckets, label=None, label_values=(None,)):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._lock = multiprocessing.Lock()
+        self._series = {
+            value: (multiprocessing.Array('L', len(self.buckets) + 1, lock=False),
+                    multiprocessing.Value('d', 0.0, lock=False))
+            for value in label_values
+        }
+        REGISTRY.append(self)
+
+    def observe(self, amount, label_value=None):
+        series = self._series.get(label_value)
+        if series is None:
+            return
+        counts, total = series
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if amount <= bound:
+                index = position
+                break
+        with self._lock:
+            counts[index] += 1
+            total.value += amount
+
+    def totals(self, label_value=None):
+        """
+        Retorna (número de observações, soma dos valores) de uma série.
+        """
+        counts, total = self._series[label_value]
+        with self._lock:
+            return sum(counts), total.value
+
+    @contextmanager
+    def time(self, label_value=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, label_value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for value, (counts, total) in self._series.items():
+            with self._lock:
+                snapshot = list(counts)
+                amount = total.value
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), snapshot):
+                cumulative += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(float(bound)))
+                lines.append(f'{self.name}_bucket{_labels(self.label, value, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label, value)} {amount}')
+            lines.append(f'{self.name}_count{_labels(self.label, value)} {cumulative}')
+        return '\n'.join(lines)
+
+
+class FunctionMetric:
+    """
+    Métrica cujo valor é lido de uma função no momento da coleta.
+    """
+
+    def __init__(self, name, documentation, func, metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.metric_type = metric_type
+        REGISTRY.append(self)
+
+    def render(self):
+        return '\n'.join([f'# HELP {self.name} {self.documentation}',
+                          f'# TYPE {self.name} {self.metric_type}',
+                          f'{self.name} {self.func()}'])
+
+
+def render():
+    """
+    Retorna todas as métricas registradas no formato de texto do Prometheus.
+    """
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+class TimedIterator:
+    """
+    Envolve um iterador e acumula o tempo gasto produzindo cada item.
+
+    Útil em pipelines em streaming, em que a etapa produtora (por exemplo,
+    a extração de texto do PDF) se intercala com a consumidora.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+
+def should_profile(requested=False):
+    """
+    Indica se uma requisição deve ser perfilada.
+
+    Requer AIBNT_PROFILE_DIR; a requisição é perfilada quando pedida
+    explicitamente ou sorteada pela taxa AIBNT_PROFILE_SAMPLE_RATE.
+    """
+    if not PROFILE_DIR:
+        return False
+    return requested or random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profiled(name):
+    """
+    Executa o bloco sob cProfile e grava as estatísticas em PROFILE_DIR/<name>.prof.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}.prof")
+        profiler.dump_stats(path)
+        logger.info(f"Perfil gravado em {path}")
+
+
+# Métricas do pipeline de formatação
+STAGE_SECONDS = Histogram('aibnt_stage_seconds', 'Duração de cada etapa do pipeline de formatação.',
+                          LATENCY_BUCKETS, label='stage', label_values=STAGES)
+DOCUMENT_BYTES = Histogram('aibnt_document_bytes', 'Tamanho dos documentos de entrada em bytes.',
+                           SIZE_BUCKETS, label='format', label_values=FORMATS)
+DOCUMENT_PAGES = Histogram('aibnt_document_pages', 'Número de páginas dos PDFs de entrada.', PAGE_BUCKETS)
+PDF_SHARDS = Histogram('aibnt_pdf_extraction_shards',
+                       'Faixas de páginas extraídas em paralelo por PDF (1: extração no próprio processo).',
+                       SHARD_BUCKETS)
+DOCUMENT_PARAGRAPHS = Histogram('aibnt_document_paragraphs', 'Número de parágrafos dos documentos formatados.',
+                                PARAGRAPH_BUCKETS, label='format', label_values=FORMATS)
@@ -0,0 +1,290 @@
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from docx.enum.style import WD_STYLE_TYPE
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import BaseDocTemplate, Flowable, Frame, PageTemplate
+
+# Limites da renderização
+RENDER_MAX_PAGES = int(os.environ.get('AIBNT_RENDER_MAX_PAGES', 1000))
+PAGE_NUMBER_FROM = int(os.environ.get('AIBNT_PDF_NUMBER_FROM', 1))  # primeira página com número visível
+
+# Caches do processo, compartilhados entre trabalhos: larguras de palavras
+# (métricas da fonte) e parágrafos já quebrados em linhas
+WORD_CACHE_SIZE = int(os.environ.get('AIBNT_WORD_CACHE_SIZE', 100000))
+LAYOUT_CACHE_SIZE = int(os.environ.get('AIBNT_LAYOUT_CACHE_SIZE', 20000))
+
+# Margens ABNT (as mesmas de ABNTFormatter._apply_abnt_margins)
+TOP_MARGIN = 3 * cm
+BOTTOM_MARGIN = 2 * cm
+LEFT_MARGIN = 3 * cm
+RIGHT_MARGIN = 2 * cm
+
+# Número da página: canto superior direito, a 2 cm das bordas
+PAGE_NUMBER_OFFSET = 2 * cm
+PAGE_NUMBER_SIZE = 10
+
+# Altura da linha simples e descendente, em relação ao corpo da fonte (Times New Roman)
+SINGLE_LINE = 1.15
+DESCENT = 0.22
+
+BlockStyle = namedtuple('BlockStyle', ['font', 'size', 'line_spacing', 'alignment', 'left_indent',
+                                       'first_line_indent', 'space_before', 'space_after'])
+
+# Estilos ABNT (os mesmos de ABNTFormatter._apply_abnt_styles). Times New Roman
+# é desenhada com a Times das fontes padrão do PDF, de métricas equivalentes.
+# O recuo negativo da primeira linha das referências sairia da margem esquerda
+# e por isso não é aplicado.
+STYLES = {
+    'Normal': BlockStyle('Times-Roman', 12, 1.5, 'justify', 0, 0, 0, 0),
+    'Heading 1': BlockStyle('Times-Bold', 14, 1.5, 'center', 0, 0, 0, 12),
+    'Heading 2': BlockStyle('Times-Bold', 12, 1.5, 'left', 0, 0, 12, 6),
+    'ABNT Citação': BlockStyle('Times-Roman', 10, 1.0, 'justify', 4 * cm, 0, 6, 6),
+    'ABNT Referência': BlockStyle('Times-Roman', 10, 1.0, 'left', 0, 0, 0, 6),
+}
+
+# Expressões latinas chegam do formatador marcadas com <i>...</i> (ver
+# rules._mark_latin) e são desenhadas com a variante itálica da fonte
+ITALIC_FONTS = {'Times-Roman': 'Times-Italic', 'Times-Bold': 'Times-BoldItalic'}
+ITALIC_RE = re.compile(r'(</?i>)')
+
+# Cada linha guarda seus trechos como (itálico, texto)
+Line = namedtuple('Line', ['runs', 'gaps', 'width', 'justify'])
+
+
+class RenderError(Exception):
+    """
+    Erro de renderização, por exemplo um documento acima do limite de páginas.
+    """
+
+
+def style_for(name):
+    """
+    Retorna o estilo de renderização de um estilo de parágrafo do DOCX.
+
+    Títulos abaixo do nível 2 usam o estilo do nível 2; estilos sem
+    equivalente ABNT são renderizados como corpo de texto.
+    """
+    if name in STYLES:
+        return name
+    if name is not None and name.startswith('Heading'):
+        return 'Heading 2'
+    return 'Normal'
+
+
+def _fonts(style):
+    # (fonte normal, fonte itálica), indexada pelo booleano do trecho
+    return style.font, ITALIC_FONTS.get(style.font, style.font)
+
+
+def _word_runs(word, italic):
+    # Divide a palavra nos trechos entre as marcações; retorna os trechos e o estado ao final
+    runs = []
+    for piece in ITALIC_RE.split(word):
+        if piece == '<i>':
+            italic = True
+        elif piece == '</i>':
+            italic = False
+        elif piece:
+            runs.append((italic, piece))
+    return runs, italic
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _word_width(font, word):
+    # Largura em milésimos do corpo da fonte: vale para qualquer tamanho
+    return stringWidth(word, font, 1000)
+
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def layout(text, style_name, width):
+    """
+    Quebra o texto de um parágrafo em linhas.
+
+    O resultado depende apenas dos argumentos e fica em cache: parágrafos
+    repetidos (entre trabalhos ou em novas versões do mesmo documento) não
+    são medidos de novo. As marcações <i>...</i> não são desenhadas: o
+    trecho entre elas é medido e desenhado em itálico.
+
+    Args:
+        text (str): Texto do parágrafo; '\\n' força uma quebra de linha
+        style_name (str): Chave de STYLES
+        width (float): Largura disponível, em pontos
+
+    Returns:
+        tuple: Linhas (Line) do parágrafo
+    """
+    style = STYLES[style_name]
+    fonts = _fonts(style)
+    scale = style.size / 1000
+    space = _word_width(style.font, ' ') * scale
+    lines = []
+    available = width - style.left_indent - style.first_line_indent
+    italic = False
+
+    for segment in text.split('\n'):
+        runs = []
+        words = 0
+        line_width = 0
+        for word in segment.split():
+            pieces, italic = _word_runs(word, italic)
+            if not pieces:
+                continue
+            word_width = sum(_word_width(fonts[slant], piece) for slant, piece in pieces) * scale
+            if words and line_width + space + word_width > available:
+                lines.append(Line(tuple(runs), words - 1, line_width, True))
+                runs = []
+                words = 0
+                line_width = 0
+                available = width - style.left_indent
+            if words:
+                line_width += space
+                runs[-1] = (runs[-1][0], runs[-1][1] + ' ')
+            for slant, piece in pieces:
+                if runs and runs[-1][0] == slant:
+                    runs[-1] = (slant, runs[-1][1] + piece)
+                else:
+                    runs.append((slant, piece))
+            words += 1
+            line_width += word_width
+        # Última linha do parágrafo (ou antes de uma quebra manual) não é justificada
+        lines.append(Line(tuple(runs), words - 1, line_width, False))
+        available = width - style.left_indent
+
+    return tuple(lines)
+
+
+def clear_caches():
+    """
+    Esvazia os caches de métricas e de quebra de linhas do processo.
+    """
+    _word_width.cache_clear()
+    layout.cache_clear()
+
+
+class TextBlock(Flowable):
+    """
+    Parágrafo (ou parte de um parágrafo) com quebra de linhas em cache.
+
+    Args:
+        text (str): Texto do parágrafo
+        style_name (str): Chave de STYLES
+        lines (tuple, optional): Linhas já calculadas, ao dividir entre páginas
+        first (bool): Contém a primeira linha do parágrafo
+        last (bool): Contém a última linha do parágrafo
+    """
+
+    def __init__(self, text, style_name, lines=None, first=True, last=True):
+        Flowable.__init__(self)
+        self.text = text
+        self.style_name = style_name
+        self.style = STYLES[style_name]
+        self.fonts = _fonts(self.style)
+        self.lines = lines
+        self.first = first
+        self.last = last
+        self.leading = self.style.size * SINGLE_LINE * self.style.line_spacing
+        self.spaceBefore = self.style.space_before if first else 0
+        self.spaceAfter = self.style.space_after if last else 0
+
+    def wrap(self, availWidth, availHeight):
+        if self.lines is None:
+            self.lines = layout(self.text, self.style_name, availWidth)
+        self.width = availWidth
+        self.height = len(self.lines) * self.leading
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        if self.lines is None:
+            self.lines = layout(self.text, self.style_name, availWidth)
+        count = int(availHeight // self.leading)
+        if count <= 0 or count >= len(self.lines):
+            return []
+        return [TextBlock(self.text, self.style_name, self.lines[:count], self.first, False),
+                TextBlock(self.text, self.style_name, self.lines[count:], False, self.last)]
+
+    def draw(self):
+        style = self.style
+        text = self.canv.beginText()
+        text.setFont(style.font, style.size, self.leading)
+        baseline = self.height - self.leading + style.size * DESCENT
+
+        for index, line in enumerate(self.lines):
+            x = style.left_indent
+            if self.first and index == 0:
+                x += style.first_line_indent
+            available = self.width - x
+            word_space = 0
+            if style.alignment == 'center':
+                x += (available - line.width) / 2
+            elif style.alignment == 'justify' and line.justify and line.gaps > 0:
+                word_space = (available - line.width) / line.gaps
+
+            text.setTextOrigin(x, baseline - index * self.leading)
+            text.setWordSpace(word_space)
+            for slant, run in line.runs:
+                text.setFont(self.fonts[slant], style.size, self.leading)
+                text.textOut(run)
+
+        self.canv.drawText(text)
+
+
+def _number_page(canvas, document):
+    page = canvas.getPageNumber()
+    if page > RENDER_MAX_PAGES:
+        raise RenderError(f"Documento excede o limite de {RENDER_MAX_PAGES} páginas")
+    if page >= PAGE_NUMBER_FROM:
+        width, height = document.pagesize
+        canvas.setFont(STYLES['Normal'].font, PAGE_NUMBER_SIZE)
+        canvas.drawRightString(width - PAGE_NUMBER_OFFSET, height - PAGE_NUMBER_OFFSET, str(page))
+
+
+def document_paragraphs(doc):
+    """
+    Lê os parágrafos de um documento python-docx para a renderização.
+
+    Args:
+        doc: Documento DOCX já formatado
+
+    Yields:
+        tuple: (chave de STYLES, texto do parágrafo)
+    """
+    # ID -> nome resolvido uma vez; paragraph.style percorre a tabela de estilos
+    names = {style.style_id: style.name for style in doc.styles}
+    default = style_for(getattr(doc.styles.default(WD_STYLE_TYPE.PARAGRAPH), 'name', None))
+    for paragraph in doc.paragraphs:
+        style_id = paragraph._p.style
+        style = default if style_id is None else style_for(names.get(style_id))
+        yield style, paragraph.text
+
+
+def render(paragraphs, target):
+    """
+    Renderiza parágrafos como PDF A4 com margens, espaçamento e numeração ABNT.
+
+    Args:
+        paragraphs: Iterável de (chave de STYLES, texto)
+        target: Caminho ou arquivo binário (file-like) do PDF de saída
+
+    Returns:
+        int: Número de páginas do PDF
+
+    Raises:
+        RenderError: Se o documento exceder RENDER_MAX_PAGES
+    """
+    document = BaseDocTemplate(target, pagesize=A4, leftMargin=LEFT_MARGIN, rightMargin=RIGHT_MARGIN,
+                               topMargin=TOP_MARGIN, bottomMargin=BOTTOM_MARGIN,
+                               pageCompression=1)
+    frame = Frame(document.leftMargin, document.bottomMargin, document.width, document.height,
+                  leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0, id='corpo')
+    document.addPageTemplates([PageTemplate(id='abnt', frames=[frame], onPage=_number_page)])
+    try:
+        document.build([TextBlock(text, style) for style, text in paragraphs])
+    except RenderError:
+        # O reportlab acrescenta o contexto interno à mensagem original
+        raise RenderError(f"Documento excede o limite de {RENDER_MAX_PAGES} páginas") from None
+    return document.page
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import uuid
+
+logger = logging.getLogger('aibnt_app.revisions')
+
+# Espaço máximo dos estados de revisão
+REVISION_MAX_BYTES = int(os.environ.get('AIBNT_REVISION_MAX_BYTES', 200 * 1024 * 1024))  # 200MB
+
+
+def paragraph_fingerprint(style_id, run_texts):
+    """
+    Calcula a impressão digital de um parágrafo de entrada.
+
+    Considera o estilo e o texto de cada run, de modo que os textos
+    formatados gravados para a impressão digital podem ser copiados
+    run a run para um parágrafo idêntico.
+
+    Args:
+        style_id (str): ID do estilo do parágrafo (None para o estilo padrão)
+        run_texts (list): Texto de cada run
+
+    Returns:
+        str: Impressão digital em hexadecimal
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((style_id or '').encode('utf-8'))
+    for text in run_texts:
+        digest.update(b'\x1f')
+        digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RevisionStore:
+    """
+    Guarda, por documento de cada usuário, o resultado da última formatação
+    de cada parágrafo, indexado pela impressão digital da entrada.
+
+    Cada estado é uma lista [estilo aplicado ou None, textos dos runs
+    formatados ou None, entradas do índice de citações do parágrafo]. Como
+    as regras ABNT classificam e corrigem cada parágrafo isoladamente, um
+    parágrafo com a mesma impressão digital recebe exatamente o mesmo
+    resultado (inclusive as citações) e pode ser copiado sem reprocessar.
+
+    Cada formatação regrava o estado do documento, então a data de
+    modificação do arquivo é a do último uso; `sweep` remove os estados
+    mais antigos que `ttl` (no aplicativo, a validade dos artefatos dos
+    usuários) e, acima de `max_bytes`, os menos recentes.
+    """
+
+    def __init__(self, directory, ttl=None, max_bytes=REVISION_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:2], f"{name}.json")
+
+    def load(self, key, version):
+        """
+        Retorna os estados da versão anterior do documento.
+
+        Args:
+            key (str): Identificador do documento, ex.: '<user_id>/<nome original>'
+            version (str): Versão das regras de formatação
+
+        Returns:
+            dict: Impressão digital -> estado; vazio se não houver versão anterior válida
+        """
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Estado de revisão ilegível para {key}: {str(e)}")
+            return {}
+
+        # Estados de outra versão das regras não podem ser reaproveitados
+        if data.get('version') != version:
+            return {}
+        return data.get('paragraphs', {})
+
+    def save(self, key, version, states):
+        """
+        Substitui atomicamente os estados do documento.
+
+        Falhas de gravação só são registradas: sem estado, a próxima versão
+        do documento é formatada por completo.
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': version, 'paragraphs': states}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o estado de revisão: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def sweep(self):
+        """
+        Remove os estados vencidos e, acima do limite de espaço, os menos recentes.
+
+        Sem estado, a próxima versão do documento é apenas formatada por completo.
+
+        Returns:
+            int: Número de estados removidos
+        """
+        now = time.time()
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            # Temporários de gravações interrompidas também vencem pelo TTL
+            if (not self.ttl or mtime > now - self.ttl) and (not self.max_bytes or total <= self.max_bytes):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"Varredura de revisões: {removed} estados removidos")
+        return removed
@@ -0,0 +1,311 @@
+import re
+from bisect import bisect_right
+from itertools import accumulate
+
+# Estilos de parágrafo criados por ABNTFormatter._apply_abnt_styles
+STYLE_CITATION = 'ABNT Citação'
+STYLE_REFERENCE = 'ABNT Referência'
+
+# Citação entre parênteses com autoria em maiúsculas, ex.: (SILVA, 2020)
+CITATION_PATTERN = r'\((?P<author>[A-Z]+)(?P<separator>,|\s+et\s+al\.)(?P<rest>.*?)\)'
+
+# Citação já corrigida, ex.: (Silva, 2020); não é alterada, apenas indexada
+FORMATTED_CITATION_PATTERN = r'\((?P<name>[A-ZÀ-Ý][a-zà-ÿ]+)(?:,|\s+et\s+al\.)(?P<name_rest>[^()]*?)\)'
+
+# Expressões latinas que devem ficar em itálico
+LATIN_EXPRESSIONS = ['et al.', 'apud', 'in', 'loc. cit.', 'op. cit.', 'passim', 'sic']
+LATIN_PATTERN = r' (?P<latin>%s)(?=[ ,.)])' % '|'.join(
+    re.escape(expr) for expr in sorted(LATIN_EXPRESSIONS, key=len, reverse=True))
+
+LATIN_RE = re.compile(LATIN_PATTERN)
+
+# Um único scanner: cada posição é testada primeiro como citação e depois
+# como expressão latina, de modo que o texto é percorrido apenas uma vez
+SCANNER_RE = re.compile(f'(?P<citation>{CITATION_PATTERN})|(?P<formatted>{FORMATTED_CITATION_PATTERN})|{LATIN_PATTERN}')
+
+REFERENCE_RE = re.compile(r'^[A-Z]+,\s+[A-Z]')
+
+# Citações longas: mais de 3 linhas (aprox. 240 caracteres) entre aspas
+LONG_QUOTE_MIN_LENGTH = 240
+
+# Os mesmos testes de _is_long_quote e _is_reference, para uma linha de um texto
+# com várias (re.M); usados na classificação em lote de classify_many
+LONG_QUOTE_LINE_RE = re.compile(r'^"[^\n]{%d,}"$' % (LONG_QUOTE_MIN_LENGTH - 1), re.M)
+REFERENCE_LINE_RE = re.compile(r'^(?:[A-Z]+,[^\S\n]+[A-Z]|ASSOCIAÇÃO BRASILEIRA)', re.M)
+
+
+class ParagraphRule:
+    """
+    Regra declarativa de classificação de parágrafos.
+
+    Args:
+        name (str): Identificador da regra
+        match (callable): Recebe o texto sem espaços nas pontas e retorna bool
+        style (str, optional): Estilo aplicado quando a regra casa
+        strip_quotes (bool): Remove as aspas externas do parágrafo
+        fix_citations (bool): Corrige autoria e expressões latinas
+        pattern (re.Pattern, optional): Equivalente de `match` em modo multilinha,
+            que casa no início das linhas aceitas; permite classificar um lote de
+            linhas com uma única busca (ver classify_many)
+    """
+
+    def __init__(self, name, match, style=None, strip_quotes=False, fix_citations=False, pattern=None):
+        self.name = name
+        self.match = match
+        self.style = style
+        self.strip_quotes = strip_quotes
+        self.fix_citations = fix_citations
+        self.pattern = pattern
+
+
+def _is_long_quote(text):
+    return len(text) > LONG_QUOTE_MIN_LENGTH and text.startswith('"') and text.endswith('"')
+
+
+def _is_reference(text):
+    return REFERENCE_RE.match(text) is not None or text.startswith('ASSOCIAÇÃO BRASILEIRA')
+
+
+# Tabela de regras avaliada em ordem; a primeira que casar é aplicada.
+# Novas regras ABNT entram aqui sem acrescentar passadas sobre o documento.
+PARAGRAPH_RULES = [
+    ParagraphRule('citacao_longa', _is_long_quote, style=STYLE_CITATION, strip_quotes=True, fix_citations=True,
+                  pattern=LONG_QUOTE_LINE_RE),
+    ParagraphRule('referencia', _is_reference, style=STYLE_REFERENCE, pattern=REFERENCE_LINE_RE),
+    ParagraphRule('corpo', lambda text: True, fix_citations=True),
+]
+
+
+def classify(text, rules=PARAGRAPH_RULES):
+    """
+    Retorna a primeira regra que casa com o texto (sem espaços nas pontas).
+    """
+    for rule in rules:
+        if rule.match(text):
+            return rule
+    return None
+
+
+def classify_many(texts, rules=PARAGRAPH_RULES):
+    """
+    Classifica um lote de parágrafos de uma vez.
+
+    Os textos são unidos por quebras de linha e cada regra com `pattern` é
+    avaliada com uma única busca sobre o lote, em vez de uma chamada por
+    parágrafo; só as regras sem padrão (como a regra final, que aceita
+    tudo) são testadas parágrafo a parágrafo, e apenas nos ainda não
+    classificados. O resultado é o mesmo de classify para cada texto.
+
+    Args:
+        texts (list): Textos sem espaços nas pontas e sem quebras de linha
+        rules (list): Tabela de regras, em ordem de prioridade
+
+    Returns:
+        list: Regra de cada texto (ou None), na mesma ordem
+    """
+    joined = '\n'.join(texts)
+    # Posição inicial de cada linha no texto unido -> índice do parágrafo
+    starts = {offset: index for index, offset in
+              enumerate(accumulate((len(text) + 1 for text in texts[:-1]), initial=0))}
+
+    result = [None] * len(texts)
+    pending = len(texts)
+    for rule in rules:
+        if not pending:
+            break
+        if rule.pattern is not None:
+            for match in rule.pattern.finditer(joined):
+                index = starts.get(match.start())
+                if index is not None and result[index] is None:
+                    result[index] = rule
+                    pending -= 1
+        else:
+            for index, text in enumerate(texts):
+                if result[index] is None and rule.match(text):
+                    result[index] = rule
+                    pending -= 1
+    return result
+
+
+def _convert_citation(match):
+    author = match.group('author')
+    separator = match.group('separator')
+    rest = match.group('rest')
+
+    # Converter autor para iniciar com maiúscula
+    if author == author.upper():
+        author = author.title()
+
+    # Converter "ET AL." para "et al."
+    if separator.lower() == ' et al.':
+        separator = ' et al.'
+
+    return f'({author}{separator}{rest})'
+
+
+def _mark_latin(text):
+    # Não podemos aplicar itálico diretamente no texto, marcamos para processamento posterior
+    return LATIN_RE.sub(r' <i>\g<latin></i>', text)
+
+
+def citation_edits(text, pos=0, endpos=None, found=None):
+    """
+    Calcula as correções de citação em uma única varredura do texto.
+
+    Args:
+        text (str): Texto do parágrafo
+        pos (int): Início da região analisada
+        endpos (int, optional): Fim da região analisada
+        found (list, optional): Recebe as citações encontradas na mesma
+            varredura, como tuplas (início, fim, autor, restante)
+
+    Returns:
+        list: Tuplas (início, fim, substituição) ordenadas e sem sobreposição
+    """
+    if endpos is None:
+        endpos = len(text)
+
+    edits = []
+    for match in SCANNER_RE.finditer(text, pos, endpos):
+        if match.group('citation') is not None:
+            replacement = _mark_latin(_convert_citation(match))
+            if found is not None:
+                found.append((match.start(), match.end(), match.group('author'), match.group('rest')))
+        elif match.group('formatted') is not None:
+            # Expressões latinas dentro da citação recebem a mesma marcação de fora dela
+            replacement = _mark_latin(match.group(0))
+            if found is not None:
+                found.append((match.start(), match.end(), match.group('name'), match.group('name_rest')))
+        else:
+            replacement = f" <i>{match.group('latin')}</i>"
+        if replacement != match.group(0):
+            edits.append((match.start(), match.end(), replacement))
+    return edits
+
+
+def apply_edits(text, edits):
+    """
+    Aplica as correções a uma string.
+    """
+    if not edits:
+        return text
+
+    parts = []
+    last = 0
+    for start, end, replacement in edits:
+        parts.append(text[last:start])
+        parts.append(replacement)
+        last = end
+    parts.append(text[last:])
+    return ''.join(parts)
+
+
+def fix_citation_format(text):
+    """
+    Corrige o formato de citações conforme ABNT 2023.
+
+    Args:
+        text (str): Texto a ser corrigido
+
+    Returns:
+        str: Texto corrigido
+    """
+    return apply_edits(text, citation_edits(text))
+
+
+def paragraph_edits(text, rule, found=None):
+    """
+    Calcula as edições que a regra aplica ao texto bruto do parágrafo.
+
+    Args:
+        text (str): Texto do parágrafo, incluindo espaços nas pontas
+        rule (ParagraphRule): Regra que classificou o parágrafo
+        found (list, optional): Recebe as citações encontradas (ver citation_edits)
+
+    Returns:
+        list: Tuplas (início, fim, substituição)
+    """
+    start = len(text) - len(text.lstrip())
+    end = len(text.rstrip())
+
+    edits = []
+    if rule.strip_quotes:
+        # Remover aspas das citações longas
+        edits.append((start, start + 1, ''))
+        closing = (end - 1, end, '')
+        start, end = start + 1, end - 1
+    else:
+        closing = None
+
+    if rule.fix_citations:
+        edits.extend(citation_edits(text, start, end, found))
+
+    if closing is not None:
+        edits.append(closing)
+    return edits
+
+
+# Caracteres que o python-docx converte em elementos próprios (<w:tab/>, <w:br/>)
+_SPECIAL_RUN_CHARS = re.compile('[\t\n\r]')
+
+
+def set_run_text(run, text):
+    """
+    Substitui o texto de um run.
+
+    Para texto sem tabulações nem quebras, grava um único <w:t> em vez de
+    percorrer o texto caractere a caractere como o setter `run.text`.
+    """
+    if _SPECIAL_RUN_CHARS.search(text):
+        run.text = text
+        return
+    run._r.clear_content()
+    if text:
+        run._r.add_t(text)
+
+
+def apply_edits_to_runs(runs, edits):
+    """
+    Aplica as correções diretamente nos runs, reescrevendo só os alterados.
+
+    Diferente de atribuir `paragraph.text`, preserva a formatação dos runs
+    que não foram tocados. Uma edição que atravessa vários runs é gravada no
+    primeiro deles e o trecho correspondente é removido dos demais.
+
+    Args:
+        runs (list): Runs do parágrafo (python-docx)
+        edits (list): Tuplas (início, fim, substituição) sobre o texto do parágrafo
+    """
+    if not edits:
+        return
+
+    texts = [run.text for run in runs]
+    if not texts:
+        return
+    starts = []
+    offset = 0
+    for run_text in texts:
+        starts.append(offset)
+        offset += len(run_text)
+
+    changed = set()
+    # Ordem reversa: as posições anteriores continuam válidas após cada edição
+    for start, end, replacement in reversed(edits):
+        first = max(bisect_right(starts, start) - 1, 0)
+        last = max(bisect_right(starts, end - 1) - 1, first) if end > start else first
+
+        head = texts[first][:start - starts[first]]
+        tail = texts[last][end - starts[last]:]
+        if first == last:
+            texts[first] = head + replacement + tail
+        else:
+            texts[first] = head + replacement
+            for index in range(first + 1, last):
+                texts[index] = ''
+                changed.add(index)
+            texts[last] = tail
+            changed.add(last)
+        changed.add(first)
+
+    for index in sorted(changed):
+        set_run_text(runs[index], texts[index])
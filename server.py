@@ -1,19 +1,15 @@
 import os
-import http.server
-import socketserver
+import sys
 
-from http import HTTPStatus
+from main import app
 
+# Ponto de entrada WSGI de produção: gunicorn --config gunicorn.conf.py server:app
 
-class Handler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(HTTPStatus.OK)
-        self.end_headers()
-        msg = 'Hello! you requested %s' % (self.path)
-        self.wfile.write(msg.encode())
 
+if __name__ == '__main__':
+    # Equivalente ao Procfile, para execução direta (python server.py)
+    from gunicorn.app.wsgiapp import run
 
-port = int(os.getenv('PORT', 80))
-print('Listening on port %s' % (port))
-httpd = socketserver.TCPServer(('', port), Handler)
-httpd.serve_forever()
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    sys.argv = [sys.argv[0], '--config', config, 'server:app']
+    run()
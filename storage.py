@@ -0,0 +1,268 @@
+import os
+import time
+import uuid
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger('aibnt_app.storage')
+
+# Configurações do armazenamento
+STORAGE_POOL_SIZE = int(os.environ.get('AIBNT_STORAGE_POOL_SIZE', 8))
+HISTORY_PAGE_SIZE = 20
+
+
+class Storage:
+    """
+    Interface dos backends de armazenamento de usuários e histórico.
+
+    Usuários são dicionários com 'id', 'email', 'name' e 'password'.
+    Documentos são dicionários com 'id', 'original_name',
+    'formatted_name', 'created_at' (timestamp UNIX) e 'date' (texto).
+    """
+
+    def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    def create_user(self, email, name, password_hash):
+        """
+        Cria um usuário.
+
+        Returns:
+            dict: Usuário criado, ou None se o email já estiver cadastrado
+        """
+        raise NotImplementedError
+
+    def add_document(self, user_id, original_name, formatted_name, created_at=None):
+        raise NotImplementedError
+
+    def list_documents(self, user_id, limit=HISTORY_PAGE_SIZE, before=None):
+        """
+        Lista o histórico do usuário do mais recente para o mais antigo.
+
+        Args:
+            user_id (str): ID do usuário
+            limit (int): Quantidade máxima de documentos
+            before (str, optional): Cursor retornado pela página anterior
+
+        Returns:
+            tuple: (lista de documentos, cursor da próxima página ou None)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _format_date(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%d/%m/%Y %H:%M')
+
+
+def _document(row_id, original_name, formatted_name, created_at):
+    return {
+        'id': row_id,
+        'original_name': original_name,
+        'formatted_name': formatted_name,
+        'created_at': created_at,
+        'date': _format_date(created_at),
+    }
+
+
+class MemoryStorage(Storage):
+    """
+    Armazenamento em memória, local ao processo (desenvolvimento e testes).
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._documents = {}
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            user = self._users.get(email)
+            return dict(user) if user else None
+
+    def create_user(self, email, name, password_hash):
+        with self._lock:
+            if email in self._users:
+                return None
+            user = {'id': str(uuid.uuid4()), 'email': email, 'name': name, 'password': password_hash}
+            self._users[email] = user
+            self._documents[user['id']] = []
+            return dict(user)
+
+    def add_document(self, user_id, original_name, formatted_name, created_at=None):
+        with self._lock:
+            document = _document(self._next_id, original_name, formatted_name, created_at or time.time())
+            self._next_id += 1
+            self._documents.setdefault(user_id, []).append(document)
+            return document
+
+    def list_documents(self, user_id, limit=HISTORY_PAGE_SIZE, before=None):
+        with self._lock:
+            documents = sorted(self._documents.get(user_id, []),
+                               key=lambda doc: (doc['created_at'], doc['id']), reverse=True)
+        if before is not None:
+            created_at, row_id = _parse_cursor(before)
+            documents = [doc for doc in documents if (doc['created_at'], doc['id']) < (created_at, row_id)]
+        page = documents[:limit]
+        return page, _cursor(page[-1]) if len(documents) > limit else None
+
+
+class SQLiteStorage(Storage):
+    """
+    Armazenamento em SQLite no modo WAL, compartilhável entre processos.
+
+    As conexões ficam em um pool por processo; após um fork o pool herdado
+    é descartado, pois conexões SQLite não podem cruzar processos.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT NOT NULL,
+            name TEXT,
+            password TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email);
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL REFERENCES users (id),
+            original_name TEXT NOT NULL,
+            formatted_name TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_user_date ON documents (user_id, created_at);
+    '''
+
+    def __init__(self, path, pool_size=STORAGE_POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = queue.LifoQueue()
+                self._pid = os.getpid()
+            pool = self._pool
+
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            yield conn
+        finally:
+            if pool is self._pool and pool.qsize() < self.pool_size:
+                pool.put(conn)
+            else:
+                conn.close()
+
+    def get_user_by_email(self, email):
+        with self._connection() as conn:
+            row = conn.execute('SELECT id, email, name, password FROM users WHERE email = ?', (email,)).fetchone()
+        return dict(row) if row else None
+
+    def create_user(self, email, name, password_hash):
+        user = {'id': str(uuid.uuid4()), 'email': email, 'name': name, 'password': password_hash}
+        try:
+            with self._connection() as conn:
+                conn.execute('INSERT INTO users (id, email, name, password) VALUES (?, ?, ?, ?)',
+                             (user['id'], email, name, password_hash))
+        except sqlite3.IntegrityError:
+            return None
+        return user
+
+    def add_document(self, user_id, original_name, formatted_name, created_at=None):
+        created_at = created_at or time.time()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO documents (user_id, original_name, formatted_name, created_at) VALUES (?, ?, ?, ?)',
+                (user_id, original_name, formatted_name, created_at))
+        return _document(cursor.lastrowid, original_name, formatted_name, created_at)
+
+    def list_documents(self, user_id, limit=HISTORY_PAGE_SIZE, before=None):
+        # Paginação por cursor (created_at, id): o custo não cresce com a profundidade da página
+        query = 'SELECT id, original_name, formatted_name, created_at FROM documents WHERE user_id = ?'
+        params = [user_id]
+        if before is not None:
+            created_at, row_id = _parse_cursor(before)
+            query += ' AND (created_at, id) < (?, ?)'
+            params.extend([created_at, row_id])
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        documents = [_document(*row) for row in rows[:limit]]
+        return documents, _cursor(documents[-1]) if len(rows) > limit else None
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        while pool is not None and not pool.empty():
+            pool.get_nowait().close()
+
+
+def _cursor(document):
+    return f"{document['created_at']!r}_{document['id']}"
+
+
+def _parse_cursor(cursor):
+    try:
+        created_at, row_id = cursor.rsplit('_', 1)
+        return float(created_at), int(row_id)
+    except ValueError:
+        raise ValueError(f"Cursor de paginação inválido: {cursor}")
+
+
+# Backends disponíveis, selecionados pelo esquema da URL de armazenamento
+BACKENDS = {
+    'sqlite': lambda location: SQLiteStorage(location),
+    'memory': lambda location: MemoryStorage(),
+}
+
+
+def create_storage(url):
+    """
+    Cria o backend de armazenamento a partir de uma URL.
+
+    Exemplos: 'sqlite:///caminho/absoluto/aibnt.db', 'sqlite://relativo.db', 'memory://'
+
+    Args:
+        url (str): URL do armazenamento
+
+    Returns:
+        Storage: Backend configurado
+    """
+    scheme, _, location = url.partition('://')
+    if scheme not in BACKENDS:
+        raise ValueError(f"Backend de armazenamento não suportado: {scheme}")
+    logger.info(f"Usando armazenamento {scheme}")
+    return BACKENDS[scheme](location)
@@ -0,0 +1,329 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('aibnt_app.uploads')
+
+# Configurações dos uploads em partes
+UPLOAD_CHUNK_SIZE = int(os.environ.get('AIBNT_UPLOAD_CHUNK_SIZE', 1024 * 1024))  # tamanho sugerido ao cliente
+UPLOAD_SESSION_TTL = int(os.environ.get('AIBNT_UPLOAD_SESSION_TTL', 24 * 60 * 60))  # 24 horas
+INLINE_MAX_BYTES = int(os.environ.get('AIBNT_INLINE_MAX_BYTES', 256 * 1024))
+# Formatos que podem ser formatados no processo web. PDFs e DOCX (ZIP) podem
+# expandir muito além do tamanho enviado e vão sempre para os workers isolados.
+INLINE_EXTENSIONS = ('.txt', '.gdoc')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Bytes iniciais usados na identificação do tipo real do arquivo
+SNIFF_BYTES = 4096
+
+# Assinaturas (magic bytes) dos formatos binários aceitos
+MAGIC_NUMBERS = {
+    '.pdf': (b'%PDF-',),
+    '.docx': (b'PK\x03\x04',),
+}
+
+# Formatos de texto: validados como UTF-8 sem bytes nulos
+TEXT_EXTENSIONS = ('.txt', '.gdoc')
+
+
+class UploadError(Exception):
+    """
+    Erro de upload, com o código HTTP correspondente.
+    """
+
+    status_code = 400
+
+
+class UnsupportedTypeError(UploadError):
+    """
+    O conteúdo não corresponde a um tipo de arquivo aceito.
+    """
+
+    status_code = 415
+
+
+class UploadTooLargeError(UploadError):
+    """
+    O upload excede o tamanho declarado ou o limite do servidor.
+    """
+
+    status_code = 413
+
+
+class OffsetMismatchError(UploadError):
+    """
+    A parte enviada não começa onde o upload parou; o cliente deve retomar de `offset`.
+    """
+
+    status_code = 409
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+def sniff(head, ext):
+    """
+    Verifica se os primeiros bytes do arquivo correspondem à extensão declarada.
+
+    Args:
+        head (bytes): Primeiros bytes do arquivo (até SNIFF_BYTES)
+        ext (str): Extensão declarada, ex.: '.pdf'
+
+    Raises:
+        UnsupportedTypeError: Se o conteúdo não for do tipo declarado
+    """
+    ext = ext.lower()
+    if ext in MAGIC_NUMBERS:
+        if not head.startswith(MAGIC_NUMBERS[ext]):
+            raise UnsupportedTypeError(f"Conteúdo não corresponde a um arquivo {ext}")
+        return
+
+    if ext in TEXT_EXTENSIONS:
+        if b'\0' in head:
+            raise UnsupportedTypeError(f"Arquivo {ext} com conteúdo binário")
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # Um caractere multibyte pode ter sido cortado no fim do trecho
+            if e.reason != 'unexpected end of data':
+                raise UnsupportedTypeError(f"Arquivo {ext} não está em UTF-8")
+        return
+
+    raise UnsupportedTypeError(f"Formato de arquivo não suportado: {ext}")
+
+
+def _sniff_length(ext):
+    # Bytes necessários para validar o tipo: a maior assinatura do formato (textos: qualquer trecho)
+    return max((len(signature) for signature in MAGIC_NUMBERS.get(ext.lower(), ())), default=1)
+
+
+def runs_inline(ext, size):
+    """
+    Indica se um upload pode ser formatado na própria requisição.
+
+    Args:
+        ext (str): Extensão do arquivo
+        size (int): Tamanho em bytes
+
+    Returns:
+        bool: True para textos de até INLINE_MAX_BYTES
+    """
+    return ext.lower() in INLINE_EXTENSIONS and size <= INLINE_MAX_BYTES
+
+
+class UploadSession:
+    """
+    Upload em andamento, gravado em disco à medida que as partes chegam.
+    """
+
+    def __init__(self, upload_id, filename, size, path, user_id=None, output_ext=None):
+        self.id = upload_id
+        self.filename = filename
+        self.ext = os.path.splitext(filename)[1].lower()
+        self.size = size
+        self.path = path
+        self.user_id = user_id
+        self.output_ext = output_ext
+        self.offset = 0
+        self.checked = False  # tipo já validado pelos primeiros bytes
+        self.head = b''  # bytes gravados antes da validação (menos que uma assinatura)
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._sha256 = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    @property
+    def digest(self):
+        """
+        SHA-256 hexadecimal do conteúdo recebido (final quando `complete`).
+        """
+        return self._sha256.hexdigest()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'output_ext': self.output_ext,
+            'offset': self.offset,
+            'complete': self.complete,
+        }
+
+
+class UploadManager:
+    """
+    Uploads em partes, retomáveis, com validação no primeiro trecho.
+
+    Cada parte é lida do corpo da requisição em blocos e gravada direto no
+    arquivo da sessão, atualizando o SHA-256 incrementalmente; o corpo
+    inteiro nunca fica em memória. O tipo real é verificado pelos magic
+    bytes assim que chegam os primeiros bytes, antes de aceitar o restante.
+
+    As sessões ficam na memória do processo; apenas os dados vão para disco.
+    """
+
+    def __init__(self, directory, max_bytes, ttl=UPLOAD_SESSION_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def create(self, filename, size, user_id=None, output_ext=None):
+        """
+        Abre uma sessão de upload.
+
+        Args:
+            filename (str): Nome seguro do arquivo (define a extensão esperada)
+            size (int): Tamanho total declarado, em bytes
+            user_id (str, optional): Usuário dono do upload
+            output_ext (str, optional): Formato de saída pedido para a formatação
+
+        Returns:
+            UploadSession: Sessão criada
+
+        Raises:
+            UploadError: Se o tamanho for inválido ou exceder o limite
+        """
+        if size <= 0:
+            raise UploadError("Tamanho do upload deve ser positivo")
+        if size > self.max_bytes:
+            raise UploadTooLargeError(f"Upload de {size} bytes excede o limite de {self.max_bytes}")
+
+        upload_id = str(uuid.uuid4())
+        session = UploadSession(upload_id, filename, size, os.path.join(self.directory, f"{upload_id}.part"),
+                                user_id, output_ext)
+        open(session.path, 'wb').close()
+        self.prune()
+        with self._lock:
+            self._sessions[upload_id] = session
+        logger.info(f"Upload {upload_id} iniciado: {filename} ({size} bytes)")
+        return session
+
+    def get(self, upload_id):
+        """
+        Retorna a sessão com o ID informado ou None.
+        """
+        with self._lock:
+            return self._sessions.get(upload_id)
+
+    def append(self, session, offset, stream):
+        """
+        Grava uma parte do upload a partir de um stream, em blocos.
+
+        Args:
+            session (UploadSession): Sessão do upload
+            offset (int): Posição em que a parte começa
+            stream: Corpo da requisição (file-like)
+
+        Returns:
+            UploadSession: Sessão atualizada
+
+        Raises:
+            OffsetMismatchError: Se `offset` não for a posição atual do upload
+            UnsupportedTypeError: Se o início do arquivo não for do tipo declarado
+            UploadTooLargeError: Se a parte ultrapassar o tamanho declarado
+        """
+        if not session._lock.acquire(blocking=False):
+            raise OffsetMismatchError("Outra parte deste upload está sendo recebida", session.offset)
+        try:
+            if offset != session.offset:
+                raise OffsetMismatchError(f"Parte começa em {offset}, esperado {session.offset}", session.offset)
+
+            with open(session.path, 'r+b') as f:
+                f.seek(session.offset)
+                # Até validar o tipo, acumula até SNIFF_BYTES antes de gravar. Uma primeira
+                # parte menor que a assinatura é gravada e a validação fica para a próxima.
+                pending = b''
+                while True:
+                    block = stream.read(STREAM_BLOCK_SIZE)
+                    if not session.checked:
+                        pending += block
+                        head = session.head + pending
+                        if block and len(head) < SNIFF_BYTES:
+                            continue
+                        if len(head) >= _sniff_length(session.ext) or session.offset + len(pending) >= session.size:
+                            self._check_head(session, head[:SNIFF_BYTES])
+                            session.checked = True
+                            session.head = b''
+                        else:
+                            session.head = head
+                        block, pending = pending, b''
+                    if not block:
+                        break
+                    if session.offset + len(block) > session.size:
+                        raise UploadTooLargeError(f"Upload excede o tamanho declarado de {session.size} bytes")
+
+                    f.write(block)
+                    session._sha256.update(block)
+                    session.offset += len(block)
+            session.updated_at = time.time()
+            return session
+        finally:
+            session._lock.release()
+
+    def _check_head(self, session, head):
+        try:
+            sniff(head, session.ext)
+        except UnsupportedTypeError:
+            logger.warning(f"Upload {session.id} recusado: conteúdo não corresponde a {session.ext}")
+            self.discard(session.id)
+            raise
+
+    def take(self, session):
+        """
+        Retira do registro uma sessão concluída; o arquivo passa a ser do chamador.
+
+        Returns:
+            UploadSession: Sessão, ou None se já tiver sido retirada
+        """
+        with self._lock:
+            return self._sessions.pop(session.id, None)
+
+    def restore(self, session):
+        """
+        Devolve ao registro uma sessão retirada com `take`.
+        """
+        with self._lock:
+            self._sessions[session.id] = session
+
+    def discard(self, upload_id):
+        """
+        Encerra a sessão e remove os dados recebidos.
+        """
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is not None and os.path.exists(session.path):
+            os.remove(session.path)
+
+    def prune(self):
+        """
+        Descarta as sessões abandonadas há mais tempo que o TTL e seus dados.
+
+        Chamado ao abrir uma sessão e pela varredura periódica dos artefatos.
+
+        Returns:
+            int: Número de sessões descartadas
+        """
+        limit = time.time() - self.ttl
+        with self._lock:
+            expired = [session for session in self._sessions.values() if session.updated_at < limit]
+            for session in expired:
+                del self._sessions[session.id]
+        for session in expired:
+            if os.path.exists(session.path):
+                os.remove(session.path)
+        if expired:
+            logger.info(f"{len(expired)} uploads abandonados descartados")
+        return len(expired)